@@ -1,66 +1,1002 @@
-import json
-import os
+import math
+from contextlib import contextmanager
+
+from gradebook_aggregates import RunningStats
+from gradebook_binary import write_snapshot
+from gradebook_events import EventBus, GradeAdded, GradeBookReloaded, GradeRemoved, StudentAdded, StudentDeleted
+from gradebook_export import EXPORT_FORMATS, guess_export, open_export, write_students
+from gradebook_index import StudentIndex
+from gradebook_metrics import Metrics, instrument_storage
+from gradebook_ranking import RankingIndex
+from gradebook_records import LazyStudents, StudentRecord
+from gradebook_reports import ReportCache
+from gradebook_storage import open_storage
+
+
+def authenticate(username, password):
+    """
+    Authenticate a user. No grade book has to be loaded first.
+
+    Args:
+        username (str): The username.
+        password (str): The password.
+
+    Returns:
+        bool: True if the username and password are correct false if not
+    """
+    if username == 'admin' and password == 'password':
+        return True
+    return False
+
 
 class GradeBook:
-    def __init__(self, filename='gradebook.json'):
+    """
+    A class to represent a grade book for managing student grades.
+
+    Attributes:
+        filename (str): The name of the file to save/load data: JSON, a binary snapshot, a SQLite database
+            or a directory of class shards.
+        storage (Storage): The backend that loads and persists the data.
+        students (dict): A dictionary of StudentRecord objects, keyed by student ID.
+        version (int): A counter that goes up every time the student data changes, for caches built on top.
+        conflicts (list): Changes made here that were dropped because another process had already
+            made them impossible, such as a grade added for a student someone else deleted.
+        instrumentation (Metrics): The metrics being collected, or None when metrics are off.
+        reports (ReportCache): Rendered per-student reports, kept until their student changes.
+        events (EventBus): Tells subscribers which students and grades changed, once each change or batch is persisted.
+    """
+
+    # Methods that control metrics or only hand back a context manager are not timed.
+    UNTIMED_METHODS = ('batch', 'close', 'metrics', 'enable_metrics', 'disable_metrics')
+
+    def __init__(self, filename='gradebook.json', journal=False, compact_size=1024 * 1024, format=None, storage=None,
+                 metrics=False, report_cache_size=1024):
+        """
+        Initialize the GradeBook with a filename and load existing data.
+
+        Args:
+            filename (str): The name of the file to save/load data.
+            journal (bool): Append each change to a log next to a JSON or binary file instead of rewriting the whole file.
+            compact_size (int): The journal size in bytes at which it is folded back into the file.
+            format (str): 'json' or 'binary' for file storage. Defaults to the format of the existing file, or 'json' for a new one.
+            storage (Storage): The backend to use. Defaults to one picked by open_storage from the file.
+            metrics (bool): Collect timings and counters from the start, including the first load. See enable_metrics.
+            report_cache_size (int): The most rendered reports to keep in the report cache.
+        """
         self.filename = filename
-        self.students = self.load_data()
+        self.storage = storage or open_storage(filename, journal=journal, compact_size=compact_size, format=format)
+        self._pending = None
+        self._undo = None
+        self.version = 0
+        self._student_versions = {}
+        self._versions_base = 0
+        self.conflicts = []
+        self.events = EventBus()
+        self.instrumentation = None
+        self.reports = ReportCache(self, report_cache_size)
+        if metrics:
+            self.enable_metrics()
+        self.load_data()
+
+    @property
+    def students(self):
+        """
+        dict: The student data, keyed by student ID.
+
+        Assigning new data rebuilds the running grade aggregates from it.
+        """
+        return self._students
+
+    @students.setter
+    def students(self, students):
+        self._students = students
+        self.version += 1
+        self._rebuild_aggregates()
+        # Every student may have changed, so they all start again from the current version.
+        self._student_versions = {}
+        self._versions_base = self.version
+        self.events.emit(GradeBookReloaded())
 
     def load_data(self):
-        try:
-            with open(self.filename, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
+        """
+        Load student data from storage, replaying any logged changes on top of it.
+
+        Returns:
+            dict: The StudentRecord objects loaded, or an empty dictionary if there is no data yet.
+        """
+        self._load()
+        self.events.flush()
+        return self.students
 
     def save_data(self):
-        with open(self.filename, 'w') as f:
-            json.dump(self.students, f, indent=4)
+        """
+        Save every student to storage, first picking up any changes other processes have saved.
+        """
+        with self.storage.lock():
+            self._sync()
+            self.storage.save(self.students)
+        self.events.flush()
+
+    def compact(self):
+        """
+        Fold logged changes back into the data file.
+        """
+        with self.storage.lock():
+            self._sync()
+            self.storage.compact(self.students)
+        self.events.flush()
+
+    def close(self):
+        """
+        Release the files and connections held by the storage, and stop any periodic metrics dumps.
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.stop_dumps()
+        self.storage.close()
+
+    def enable_metrics(self, dump_path=None, dump_interval=60.0):
+        """
+        Start timing every public method and the storage, and counting the bytes and saves of the storage.
+
+        Timed versions of the methods are set on this grade book and its storage only, and
+        disable_metrics removes them again, so when metrics are off nothing is measured at all.
+
+        Args:
+            dump_path (str): A JSON file to write the metrics to every dump_interval seconds, or None.
+            dump_interval (float): The seconds between dumps.
+
+        Returns:
+            Metrics: The metrics being collected.
+        """
+        if self.instrumentation is None:
+            self.instrumentation = Metrics()
+            names = [name for name, value in vars(GradeBook).items()
+                     if callable(value) and not name.startswith('_') and name not in self.UNTIMED_METHODS]
+            self.instrumentation.instrument(self, 'gradebook.', names)
+            instrument_storage(self.storage, self.instrumentation)
+        if dump_path is not None:
+            self.instrumentation.start_dumps(dump_path, dump_interval)
+        return self.instrumentation
+
+    def disable_metrics(self):
+        """
+        Stop collecting metrics and put the original methods back. Periodic dumps stop after a final one.
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.stop_dumps()
+            self.instrumentation.uninstrument()
+            self.instrumentation = None
+
+    def metrics(self):
+        """
+        Get the metrics collected since enable_metrics.
+
+        Returns:
+            dict: The snapshot described in Metrics.snapshot plus the report cache statistics as
+                'reports', or None if metrics are off.
+        """
+        if self.instrumentation is None:
+            return None
+        snapshot = self.instrumentation.snapshot()
+        snapshot['reports'] = self.reports.stats()
+        return snapshot
+
+    def export_data(self, export_path, format=None, compression=None, classes=None, progress=None):
+        """
+        Export student data to a specified file.
+
+        Text formats are written one student at a time, so large grade books export in constant memory.
+
+        Args:
+            export_path (str): The path to the export file.
+            format (str): 'json', 'jsonl', 'csv' (one row per student), 'csv-grades' (one row per grade) or
+                'binary'. Defaults to the format matching the file extension, or 'json'.
+            compression (str): 'gzip' or 'lzma'. Defaults to the one matching a .gz, .xz or .lzma extension, if any.
+            classes (iterable): Only export students in these classes. Defaults to every student.
+            progress (function): Called as progress(written, total) while a text format is written.
+
+        Returns:
+            int: The number of students exported.
+        """
+        guessed_format, guessed_compression = guess_export(export_path)
+        format = format or guessed_format
+        compression = compression or guessed_compression
+        records = self.students.iter_records() if isinstance(self.students, LazyStudents) else self.students.values()
+        total = len(self.students)
+        if classes is not None:
+            classes = set(classes)
+            records = (student for student in records if student.class_name in classes)
+            total = sum(self._class_sizes.get(class_name, 0) for class_name in classes)
+        if format == 'binary':
+            if compression is not None:
+                raise ValueError("Binary exports cannot be compressed")
+            students = self.students if classes is None else {student.id: student for student in records}
+            write_snapshot(students, export_path)
+            return len(students)
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown grade book format: {format}")
+        with open_export(export_path, compression) as f:
+            return write_students(records, f, format, progress, total)
 
     def add_student(self, student_info):
+        """
+        Add a new student to the grade book.
+
+        Args:
+            student_info (dict): A dictionary containing student information with keys 'ID', 'Name', 'Class', 'Grades'.
+
+        Returns:
+            bool: True if the student was added, False if the student already exists.
+        """
         student_id = student_info['ID']
         if student_id in self.students:
             return False
         else:
-            self.students[student_id] = student_info
-            self.students[student_id]['Grades'] = []
-            self.save_data()
+            student = {'ID': student_id, 'Name': student_info['Name'], 'Class': student_info['Class'], 'Grades': []}
+            self._commit({'op': 'add_student', 'student': student})
             return True
 
-    def add_grade(self, student_id, grade):
+    def delete_student(self, student_id):
+        """
+        Delete a student from the grade book.
+
+        Args:
+            student_id (str): The ID of the student to delete.
+
+        Returns:
+            bool: True if the student was deleted, False if the student does not exist.
+        """
         if student_id in self.students:
-            self.students[student_id]['Grades'].append(grade)
-            self.save_data()
+            self._commit({'op': 'delete_student', 'id': student_id})
             return True
         else:
             return False
 
-    def delete_grade(self, student_id, grade):
+    def add_grade(self, student_id, grade, assignment=None, timestamp=None):
+        """
+        Add a grade for a student.
+
+        The grade gets a new entry ID, never given to an earlier grade of the student, which grade_entries
+        lists and delete_grade_entry takes.
+
+        Args:
+            student_id (str): The ID of the student.
+            grade (float): The grade to add.
+            assignment (str): The assignment the grade is for, or None.
+            timestamp (float): When the grade was given, in seconds since the epoch, or None to
+                record no time. Grades with neither an assignment nor a timestamp store nothing
+                beyond the grade itself.
+
+        Returns:
+            bool: True if the grade was added, False if the student does not exist.
+
+        Raises:
+            ValueError: If the timestamp is infinite or NaN.
+        """
+        if timestamp is not None and not math.isfinite(timestamp):
+            raise ValueError(f"Invalid timestamp {timestamp}")
         if student_id in self.students:
-            try:
-                self.students[student_id]['Grades'].remove(grade)
-                self.save_data()
-                return True
-            except ValueError:
-                return False
+            record = {'op': 'add_grade', 'id': student_id, 'grade': grade}
+            if assignment is not None:
+                record['assignment'] = assignment
+            if timestamp is not None:
+                record['timestamp'] = timestamp
+            self._commit(record)
+            return True
         else:
             return False
 
+    def delete_grade(self, student_id, grade):
+        """
+        Delete a grade for a student.
+
+        When the student has the same grade more than once, the earliest one is deleted. Use
+        delete_grade_entry to say exactly which one.
+
+        Args:
+            student_id (str): The ID of the student.
+            grade (float): The grade to delete.
+
+        Returns:
+            bool: True if the grade was deleted, False if the grade does not exist or the student does not exist.
+        """
+        if student_id in self.students and grade in self.students[student_id].grades:
+            self._commit({'op': 'delete_grade', 'id': student_id, 'grade': grade})
+            return True
+        else:
+            return False
+
+    def delete_grade_entry(self, student_id, entry_id):
+        """
+        Delete one grade of a student by its entry ID.
+
+        Args:
+            student_id (str): The ID of the student.
+            entry_id (int): The entry ID of the grade, from grade_entries.
+
+        Returns:
+            bool: True if the grade was deleted, False if the entry or the student does not exist.
+        """
+        if student_id not in self.students:
+            return False
+        student = self.students[student_id]
+        index = student.grade_entries().position(entry_id)
+        if index is None:
+            return False
+        self._commit({'op': 'delete_grade', 'id': student_id, 'grade': student.grades[index], 'entry': entry_id})
+        return True
+
+    def grade_entries(self, student_id):
+        """
+        Get the grades of a student with their entry IDs, assignments and timestamps.
+
+        Args:
+            student_id (str): The ID of the student.
+
+        Returns:
+            list: A dictionary per grade with keys 'ID', 'Grade', 'Assignment' and 'Timestamp', in the
+                order the grades were added, or None if the student does not exist. Assignment and
+                Timestamp are None where unknown.
+        """
+        if student_id not in self.students:
+            return None
+        student = self.students[student_id]
+        if student.entries is None:
+            return [{'ID': number, 'Grade': grade, 'Assignment': None, 'Timestamp': None}
+                    for number, grade in enumerate(student.grades, 1)]
+        entries = []
+        for index, grade in enumerate(student.grades):
+            entry_id, assignment, timestamp = student.entries.entry(index)
+            entries.append({'ID': entry_id, 'Grade': grade, 'Assignment': assignment, 'Timestamp': timestamp})
+        return entries
+
+    @contextmanager
+    def batch(self):
+        """
+        Group several changes so they are persisted once, when the block ends.
+
+        If the block raises, every change made inside it is undone and nothing is written.
+        Batches may be nested; only the outermost one persists. Event subscribers hear about
+        the changes once, when the outermost batch ends.
+
+        Example:
+            with gradebook.batch():
+                gradebook.add_student({'ID': '3', 'Name': 'Ana', 'Class': '2025'})
+                gradebook.add_grade('3', 91.0)
+
+        Yields:
+            GradeBook: This grade book.
+        """
+        if self._pending is not None:
+            yield self
+            return
+        self._pending = []
+        self._undo = []
+        try:
+            try:
+                yield self
+            except BaseException:
+                for undo in reversed(self._undo):
+                    undo()
+                raise
+            if self._pending:
+                self._persist(self._pending, self._undo)
+        finally:
+            self._pending = None
+            self._undo = None
+            self.events.flush()
+
+    def add_students(self, students_info):
+        """
+        Add several new students and persist them once.
+
+        Every student is checked before any is added, so either all of them are added or none are.
+
+        Args:
+            students_info (iterable): Dictionaries with keys 'ID', 'Name' and 'Class'.
+
+        Returns:
+            int: The number of students added.
+
+        Raises:
+            ValueError: If a student is missing information or their ID is already taken.
+        """
+        students_info = list(students_info)
+        errors = []
+        seen = set()
+        for position, student_info in enumerate(students_info):
+            missing = [key for key in ('ID', 'Name', 'Class') if key not in student_info]
+            if missing:
+                errors.append(f"Row {position}: missing {', '.join(missing)}")
+            elif student_info['ID'] in self.students or student_info['ID'] in seen:
+                errors.append(f"Row {position}: student with ID {student_info['ID']} already exists")
+            else:
+                seen.add(student_info['ID'])
+        if errors:
+            raise ValueError('\n'.join(errors))
+        with self.batch():
+            for student_info in students_info:
+                self.add_student(student_info)
+        return len(students_info)
+
+    def add_grades(self, grades):
+        """
+        Add several grades and persist them once.
+
+        Every grade is checked before any is added, so either all of them are added or none are.
+
+        Args:
+            grades (iterable): (student_id, grade) pairs, or (student_id, grade, assignment) triples.
+
+        Returns:
+            int: The number of grades added.
+
+        Raises:
+            ValueError: If a student does not exist or a grade is not numeric.
+        """
+        checked = []
+        errors = []
+        for position, (student_id, grade, *assignment) in enumerate(grades):
+            if student_id not in self.students:
+                errors.append(f"Row {position}: student with ID {student_id} does not exist")
+                continue
+            try:
+                checked.append((student_id, float(grade), assignment[0] if assignment else None))
+            except (TypeError, ValueError):
+                errors.append(f"Row {position}: invalid grade {grade!r}")
+        if errors:
+            raise ValueError('\n'.join(errors))
+        with self.batch():
+            for student_id, grade, assignment in checked:
+                self.add_grade(student_id, grade, assignment)
+        return len(checked)
+
     def calculate_final_grade(self, student_id):
+        """
+        Calculate the final grade for a student.
+
+        Args:
+            student_id (str): The ID of the student.
+
+        Returns:
+            float: The final grade, or None if the student does not exist or has no grades.
+        """
         if student_id in self.students:
-            grades = self.students[student_id]['Grades']
-            if grades:
-                return sum(grades) / len(grades)
-            else:
-                return None
+            return self.students[student_id].stats.mean()
         else:
             return None
 
+    def grade_statistics(self, student_id):
+        """
+        Get the count, mean, variance, lowest and highest grade of a student.
+
+        Args:
+            student_id (str): The ID of the student.
+
+        Returns:
+            dict: The statistics with keys 'count', 'mean', 'variance', 'min', 'max', or None if the student does not exist.
+        """
+        if student_id in self.students:
+            student = self.students[student_id]
+            if student.stats.stale:
+                student.stats.rebuild(student.grades)
+            return student.stats.summary()
+        else:
+            return None
+
+    def class_statistics(self, class_name):
+        """
+        Get the count, mean, variance, lowest and highest grade across every student in a class.
+
+        Args:
+            class_name (str): The class.
+
+        Returns:
+            dict: The statistics with keys 'count', 'mean', 'variance', 'min', 'max', or None if no student is in the class.
+        """
+        stats = self._class_stats.get(class_name)
+        if stats is None:
+            return None
+        if stats.stale:
+            stats.rebuild(grade for student in self.find_by_class(class_name) for grade in student.grades)
+        return stats.summary()
+
+    def find_by_class(self, class_name, limit=None):
+        """
+        Find the students in a class.
+
+        Args:
+            class_name (str): The class.
+            limit (int): The most students to return, or None for all of them.
+
+        Returns:
+            list: The matching students, in the order they were added.
+        """
+        return [self.students[student_id] for student_id in self._student_index().by_class(class_name, limit)]
+
+    def find_by_name_prefix(self, prefix, limit=None):
+        """
+        Find the students whose name starts with a prefix, ignoring case.
+
+        Args:
+            prefix (str): The start of the name.
+            limit (int): The most students to return, or None for all of them.
+
+        Returns:
+            list: The matching students, ordered by name.
+        """
+        return [self.students[student_id] for student_id in self._student_index().by_name_prefix(prefix, limit)]
+
+    def top_k(self, n, class_name=None):
+        """
+        List the students with the highest final grades, such as for an honor roll.
+
+        Args:
+            n (int): The most students to list.
+            class_name (str): Only rank students in this class. Defaults to every student.
+
+        Returns:
+            list: (student ID, final grade) pairs, highest first. Students without grades are not ranked.
+        """
+        return self._ranking_index().top(n, class_name)
+
+    def bottom_k(self, n, class_name=None):
+        """
+        List the students with the lowest final grades, such as for an at-risk list.
+
+        Args:
+            n (int): The most students to list.
+            class_name (str): Only rank students in this class. Defaults to every student.
+
+        Returns:
+            list: (student ID, final grade) pairs, lowest first. Students without grades are not ranked.
+        """
+        return self._ranking_index().bottom(n, class_name)
+
+    def rank_of(self, student_id, in_class=False):
+        """
+        Rank a student by final grade. The highest final grade is rank 1, and tied students share the best rank.
+
+        Args:
+            student_id (str): The ID of the student.
+            in_class (bool): Rank the student among their class instead of the whole grade book.
+
+        Returns:
+            int: The rank, or None if the student does not exist or has no grades.
+        """
+        return self._ranking_index().rank(student_id, in_class)
+
+    def students_between(self, low, high, class_name=None):
+        """
+        List the students whose final grade is in a range, bounds included.
+
+        Args:
+            low (float): The lowest final grade.
+            high (float): The highest final grade.
+            class_name (str): Only list students in this class. Defaults to every student.
+
+        Returns:
+            list: (student ID, final grade) pairs, highest first.
+        """
+        return self._ranking_index().between(low, high, class_name)
+
+    def class_names(self):
+        """
+        List the classes that have students.
+
+        Returns:
+            list: The class names, in sorted order.
+        """
+        return self._student_index().class_names()
+
+    def student_version(self, student_id):
+        """
+        Get the version of a student, which moves on whenever the student is added or deleted or
+        their grades change, for caches of results that depend on one student.
+
+        Args:
+            student_id (str): The ID of the student.
+
+        Returns:
+            int: The value of version when the student last changed, or when the students were last loaded.
+        """
+        return self._student_versions.get(student_id, self._versions_base)
+
+    def verify_aggregates(self):
+        """
+        Check the running grade aggregates against the raw grade lists.
+
+        Returns:
+            list: A description of every student or class whose aggregates disagree with its grades. Empty if all agree.
+        """
+        problems = []
+        by_class = {}
+        for student_id, student in self.students.items():
+            if student.stats is None or not student.stats.matches(student.grades):
+                problems.append(f"Student {student_id}: aggregates do not match grades")
+            if student.entries is not None and len(student.entries) != len(student.grades):
+                problems.append(f"Student {student_id}: grade entries do not match grades")
+            by_class.setdefault(student.class_name, []).extend(student.grades)
+        for class_name in self._class_stats.keys() | by_class.keys():
+            stats = self._class_stats.get(class_name)
+            if stats is None or not stats.matches(by_class.get(class_name, ())):
+                problems.append(f"Class {class_name}: aggregates do not match grades")
+        return problems
+
     def get_grades(self, student_id):
+        """
+        Get the grades for a student.
+
+        Args:
+            student_id (str): The ID of the student.
+
+        Returns:
+            list: A copy of the grades of the student as plain floats, or None if the student does not exist.
+        """
         if student_id in self.students:
-            return self.students[student_id]['Grades']
+            return self.students[student_id].grades.tolist()
         else:
             return None
 
     def print_all_students(self):
+        """
+        Print all students in the grade book.
+
+        Returns:
+            dict: A dictionary of all students. Each StudentRecord reads like a student dictionary.
+        """
         return self.students
+
+    def student_ids(self, sort_by=None, reverse=False):
+        """
+        List the student IDs in a chosen order, for paging through the grade book.
+
+        Args:
+            sort_by (str): 'ID', 'Name', 'Class' or 'Final Grade', or None for the order students were added.
+            reverse (bool): Sort in descending order. Students without grades stay last when sorting by final grade.
+
+        Returns:
+            list: The student IDs.
+        """
+        if sort_by is None:
+            student_ids = list(self.students)
+        elif sort_by == 'ID':
+            student_ids = sorted(self.students, key=str)
+        elif sort_by == 'Name':
+            student_ids = self._student_index().names()
+        elif sort_by == 'Class':
+            index = self._student_index()
+            student_ids = [student_id for class_name in index.class_names() for student_id in index.by_class(class_name)]
+        elif sort_by == 'Final Grade':
+            ranking = self._ranking_index()
+            graded = ranking.ids()
+            if reverse:
+                graded.reverse()
+            return graded + [student_id for student_id in self.students if student_id not in ranking]
+        else:
+            raise ValueError(f"Cannot sort students by {sort_by}")
+        if reverse:
+            student_ids.reverse()
+        return student_ids
+
+    def authenticate(self, username, password):
+        """
+        Authenticate a user. Kept for callers that already hold a grade book; see the module-level authenticate.
+
+        Args:
+            username (str): The username.
+            password (str): The password.
+
+        Returns:
+            bool: True if the username and password are correct false if not
+        """
+        return authenticate(username, password)
+
+    def _commit(self, record):
+        """
+        Apply a mutation record in memory and persist it.
+
+        Inside a batch the record is only queued, and is persisted together with the rest of the batch.
+
+        Args:
+            record (dict): The mutation record.
+        """
+        undo = self._apply(record)
+        if self._pending is not None:
+            self._pending.append(record)
+            self._undo.append(undo)
+            return
+        try:
+            self._persist([record], [undo])
+        finally:
+            self.events.flush()
+
+    def _persist(self, records, undos):
+        """
+        Persist mutation records that were already applied in memory.
+
+        The storage lock is held from the check for changes by other processes through the write,
+        so no one can write in between. If the write fails, the records are undone in memory.
+
+        Args:
+            records (list): The mutation records.
+            undos (list): The functions that reverse each record.
+        """
+        with self.storage.lock():
+            records, undos = self._sync(records, undos)
+            try:
+                if records:
+                    self.storage.write(records, self.students)
+            except BaseException:
+                for undo in reversed(undos):
+                    undo()
+                raise
+
+    def _sync(self, records=(), undos=()):
+        """
+        Bring the in-memory students up to date with changes other processes have written, then
+        re-apply changes made here that are not persisted yet. Call with the storage lock held.
+
+        The unpersisted changes are undone first, which leaves the students as they were when this
+        grade book last loaded or wrote. Records appended to a journal by others are applied on top;
+        otherwise everything is loaded again. Changes that no longer apply are added to conflicts
+        and dropped.
+
+        Args:
+            records (list): The mutation records applied in memory but not persisted.
+            undos (list): The functions that reverse each record.
+
+        Returns:
+            tuple: The records that still apply, and the functions that reverse them.
+        """
+        if not self.storage.changed():
+            return records, undos
+        for undo in reversed(undos):
+            undo()
+        theirs = self.storage.catch_up()
+        if theirs is None:
+            self._load()
+        else:
+            for record in theirs:
+                self._apply(record)
+        kept = []
+        undos = []
+        for record in records:
+            if self._applies(record):
+                undos.append(self._apply(record))
+                kept.append(record)
+            else:
+                self.conflicts.append(record)
+        return kept, undos
+
+    def _applies(self, record):
+        """
+        Check whether a mutation record can still be applied, by the same rules as the public methods.
+
+        Args:
+            record (dict): The mutation record.
+
+        Returns:
+            bool: True if the record can be applied.
+        """
+        op = record['op']
+        if op == 'add_student':
+            return record['student']['ID'] not in self.students
+        student_id = record['id']
+        if op == 'delete_grade':
+            if student_id not in self.students:
+                return False
+            if 'entry' in record:
+                return self.students[student_id].grade_entries().position(record['entry']) is not None
+            return record['grade'] in self.students[student_id].grades
+        return student_id in self.students
+
+    def _load(self):
+        """
+        Load student data from storage and replay any logged changes, without flushing events.
+        """
+        students, records = self.storage.load()
+        self.students = students
+        for record in records:
+            self._apply(record)
+
+    def _rebuild_aggregates(self):
+        """
+        Recompute the per-student and per-class grade aggregates from scratch.
+
+        The class and name indexes and the ranking are dropped too, and rebuilt the next time a
+        search or ranking query needs them.
+        """
+        self._index = None
+        self._ranking = None
+        if isinstance(self._students, LazyStudents):
+            # Student aggregates are filled in as each record is read; the class ones come from the source.
+            self._class_stats, self._class_sizes = self._students.class_aggregates()
+            return
+        self._class_stats = {}
+        self._class_sizes = {}
+        for student_id, student in self._students.items():
+            if not isinstance(student, StudentRecord):
+                self._students[student_id] = StudentRecord.from_dict(student)
+            self._track_student(student_id)
+
+    def _student_index(self):
+        """
+        Get the class and name indexes, building them on first use.
+
+        Returns:
+            StudentIndex: The indexes, kept current by every add and delete from then on.
+        """
+        if self._index is None:
+            records = self.students.iter_records() if isinstance(self.students, LazyStudents) else self.students.values()
+            self._index = StudentIndex(records)
+        return self._index
+
+    def _ranking_index(self):
+        """
+        Get the ranking by final grade, building it on first use and bringing it up to date with
+        the students that changed since it was last used.
+
+        Returns:
+            RankingIndex: The ranking.
+        """
+        if self._ranking is None or self._ranking.needs_rebuild():
+            records = self.students.iter_records() if isinstance(self.students, LazyStudents) else self.students.values()
+            self._ranking = RankingIndex(records)
+        else:
+            self._ranking.refresh(self.students)
+        return self._ranking
+
+    def _apply(self, record):
+        """
+        Apply a mutation record in memory, keeping the running aggregates up to date, without persisting it.
+
+        The change is emitted as an event, and so is the reverse change when it is undone.
+
+        Args:
+            record (dict): The mutation record.
+
+        Returns:
+            function: A function that reverses the change.
+        """
+        self.storage.changing(record)
+        students = self.students
+        op = record['op']
+        if op == 'add_student':
+            student_id = record['student']['ID']
+            student = students[student_id] = StudentRecord.from_dict(record['student'])
+            self._track_student(student_id)
+            self.events.emit(StudentAdded(student_id, student))
+
+            def undo():
+                self._untrack_student(student_id, students.pop(student_id))
+                self.events.emit(StudentDeleted(student_id, student))
+            return undo
+        elif op == 'delete_student':
+            student_id = record['id']
+            student = students.pop(student_id)
+            self._untrack_student(student_id, student)
+            self.events.emit(StudentDeleted(student_id, student))
+
+            def undo():
+                students[student_id] = student
+                self._track_student(student_id)
+                self.events.emit(StudentAdded(student_id, student))
+            return undo
+        elif op == 'add_grade':
+            student = students[record['id']]
+            last_id = len(student.grades) if student.entries is None else student.entries.last_id
+            # A record made here may have been numbered before another process added grades to
+            # the same student; it is renumbered, and the record updated, before it is persisted.
+            if record.get('entry', 0) <= last_id:
+                record['entry'] = last_id + 1
+            # Grades numbered from 1 without labels or timestamps need no entries at all.
+            if (student.entries is not None or record['entry'] != last_id + 1
+                    or record.get('assignment') is not None or record.get('timestamp') is not None):
+                student.grade_entries().append(record['entry'], record.get('assignment'), record.get('timestamp'))
+            student.grades.append(record['grade'])
+            self._track_grade(record['id'], student, student.grades[-1], 1)
+            self.events.emit(GradeAdded(record['id'], student.grades[-1], record['entry']))
+
+            def undo():
+                if student.entries is not None:
+                    student.entries.pop(-1)
+                    # An undone grade was never persisted, so its ID may be handed out again.
+                    student.entries.last_id = last_id
+                grade = student.grades.pop()
+                self._track_grade(record['id'], student, grade, -1)
+                self.events.emit(GradeRemoved(record['id'], grade, record['entry']))
+            return undo
+        elif op == 'delete_grade':
+            student = students[record['id']]
+            entries = student.grade_entries()
+            if 'entry' in record:
+                index = entries.position(record['entry'])
+            else:
+                # Records logged before grades had entry IDs name the grade by value.
+                index = student.grades.index(record['grade'])
+                record['entry'] = entries.ids[index]
+            grade = student.grades.pop(index)
+            entry = entries.pop(index)
+            self._track_grade(record['id'], student, grade, -1)
+            self.events.emit(GradeRemoved(record['id'], grade, entry[0]))
+
+            def undo():
+                student.grades.insert(index, grade)
+                entries.insert(index, *entry)
+                self._track_grade(record['id'], student, grade, 1, appended=False)
+                self.events.emit(GradeAdded(record['id'], grade, entry[0]))
+            return undo
+        else:
+            raise ValueError(f"Unknown journal operation: {op}")
+
+    def _track_student(self, student_id):
+        """
+        Start keeping aggregates for a student that was just added.
+
+        Args:
+            student_id (str): The ID of the student.
+        """
+        self.version += 1
+        self._student_versions[student_id] = self.version
+        student = self._students[student_id]
+        student.stats = RunningStats(student.grades)
+        self._class_stats.setdefault(student.class_name, RunningStats()).merge(student.stats)
+        self._class_sizes[student.class_name] = self._class_sizes.get(student.class_name, 0) + 1
+        if self._index is not None:
+            self._index.add(student)
+        if self._ranking is not None:
+            self._ranking.mark(student_id)
+
+    def _untrack_student(self, student_id, student):
+        """
+        Stop keeping aggregates for a student that was just removed.
+
+        Args:
+            student_id (str): The ID of the student.
+            student (dict): The removed student data.
+        """
+        self.version += 1
+        self._student_versions[student_id] = self.version
+        class_name = student.class_name
+        self._class_stats[class_name].unmerge(student.stats)
+        self._class_sizes[class_name] -= 1
+        if self._class_sizes[class_name] == 0:
+            del self._class_stats[class_name]
+            del self._class_sizes[class_name]
+        if self._index is not None:
+            self._index.remove(student)
+        if self._ranking is not None:
+            self._ranking.mark(student_id)
+
+    def _track_grade(self, student_id, student, grade, direction, appended=True):
+        """
+        Update the aggregates of a student and their class for a grade that was added or removed.
+
+        Removing a grade, or putting one back among the others, recomputes the student's aggregates
+        from their grades and swaps them into the class aggregates in place of the old ones.
+        Subtracting the grade itself would leave its rounding error in the student's sum, and the
+        final grade would drift from the sum of the grades in order divided by their count. The
+        class sum is kept as the sum of its students' sums, so it agrees with the class's grades
+        to within rounding rather than bit for bit. The rebuild makes a removal O(grades of the
+        student) instead of O(1), the same order as removing the grade from its array.
+
+        Args:
+            student_id (str): The ID of the student.
+            student (dict): The student data.
+            grade (float): The grade.
+            direction (int): 1 if the grade was added, -1 if it was removed.
+            appended (bool): For an added grade, whether it went after every other grade.
+        """
+        self.version += 1
+        self._student_versions[student_id] = self.version
+        class_stats = self._class_stats[student.class_name]
+        if direction > 0 and appended:
+            student.stats.add(grade)
+            class_stats.add(grade)
+        else:
+            class_stats.unmerge(student.stats)
+            student.stats.rebuild(student.grades)
+            class_stats.merge(student.stats)
+        if self._ranking is not None:
+            self._ranking.mark(student_id)
@@ -0,0 +1,173 @@
+import math
+
+
+class RunningStats:
+    """
+    Running count, sum, sum of squares, minimum and maximum of a set of grades.
+
+    Adding and removing a grade is O(1). Removing the current minimum or maximum cannot be
+    undone from the running values alone, so the extremes are then marked stale and the owner
+    recomputes them from the raw grades with rebuild().
+
+    Attributes:
+        count (int): The number of grades.
+        total (float): The sum of the grades.
+        total_sq (float): The sum of the squared grades.
+        minimum (float): The lowest grade, or None if there are no grades.
+        maximum (float): The highest grade, or None if there are no grades.
+        stale (bool): True if minimum and maximum need to be rebuilt.
+    """
+
+    __slots__ = ('count', 'total', 'total_sq', 'minimum', 'maximum', 'stale')
+
+    def __init__(self, grades=()):
+        """
+        Initialize the statistics from a sequence of grades.
+
+        Args:
+            grades (iterable): The grades to start with.
+        """
+        self.rebuild(grades)
+
+    def rebuild(self, grades):
+        """
+        Recompute every value from the raw grades.
+
+        Args:
+            grades (iterable): The grades.
+        """
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.minimum = None
+        self.maximum = None
+        self.stale = False
+        for grade in grades:
+            self.add(grade)
+
+    def add(self, grade):
+        """
+        Account for a new grade.
+
+        Args:
+            grade (float): The grade that was added.
+        """
+        self.count += 1
+        self.total += grade
+        self.total_sq += grade * grade
+        if not self.stale:
+            if self.minimum is None or grade < self.minimum:
+                self.minimum = grade
+            if self.maximum is None or grade > self.maximum:
+                self.maximum = grade
+
+    def remove(self, grade):
+        """
+        Account for a grade that was removed.
+
+        Args:
+            grade (float): The grade that was removed.
+        """
+        self.count -= 1
+        self.total -= grade
+        self.total_sq -= grade * grade
+        if self.count == 0:
+            self.rebuild(())
+        elif grade == self.minimum or grade == self.maximum:
+            self.stale = True
+
+    def merge(self, other):
+        """
+        Account for every grade counted by another set of statistics.
+
+        Args:
+            other (RunningStats): The statistics to add.
+        """
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        if other.stale:
+            self.stale = True
+        elif not self.stale:
+            if self.minimum is None or other.minimum < self.minimum:
+                self.minimum = other.minimum
+            if self.maximum is None or other.maximum > self.maximum:
+                self.maximum = other.maximum
+
+    def unmerge(self, other):
+        """
+        Stop accounting for the grades counted by another set of statistics.
+
+        Args:
+            other (RunningStats): The statistics to remove.
+        """
+        if other.count == 0:
+            return
+        self.count -= other.count
+        self.total -= other.total
+        self.total_sq -= other.total_sq
+        if self.count == 0:
+            self.rebuild(())
+        elif other.stale or other.minimum == self.minimum or other.maximum == self.maximum:
+            self.stale = True
+
+    def mean(self):
+        """
+        Calculate the mean grade.
+
+        Returns:
+            float: The mean, or None if there are no grades.
+        """
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def variance(self):
+        """
+        Calculate the population variance of the grades.
+
+        Returns:
+            float: The variance, or None if there are no grades.
+        """
+        if self.count == 0:
+            return None
+        mean = self.total / self.count
+        return max(self.total_sq / self.count - mean * mean, 0.0)
+
+    def summary(self):
+        """
+        Summarize the statistics. The extremes must not be stale.
+
+        Returns:
+            dict: The 'count', 'mean', 'variance', 'min' and 'max' of the grades.
+        """
+        return {
+            'count': self.count,
+            'mean': self.mean(),
+            'variance': self.variance(),
+            'min': self.minimum,
+            'max': self.maximum,
+        }
+
+    def matches(self, grades):
+        """
+        Check the running values against the raw grades.
+
+        Args:
+            grades (iterable): The grades the statistics should describe.
+
+        Returns:
+            bool: True if the statistics agree with the grades.
+        """
+        expected = RunningStats(grades)
+        if expected.count != self.count:
+            return False
+        if not math.isclose(expected.total, self.total, rel_tol=1e-9, abs_tol=1e-6):
+            return False
+        if not math.isclose(expected.total_sq, self.total_sq, rel_tol=1e-9, abs_tol=1e-6):
+            return False
+        if not self.stale and (expected.minimum != self.minimum or expected.maximum != self.maximum):
+            return False
+        return True
@@ -0,0 +1,286 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from gradebook import GradeBook
+from gradebook_binary import write_snapshot
+from gradebook_records import StudentRecord
+from gradebook_storage import ShardedStorage, SqliteStorage, write_json
+
+OPERATIONS = ('cold_start', 'load_data', 'save_data', 'add_grade', 'delete_grade', 'calculate_final_grade', 'export_data')
+FORMATS = {'json': 'gradebook.json', 'binary': 'gradebook.bin', 'sqlite': 'gradebook.db', 'sharded': 'gradebook.shards'}
+
+
+def generate(path, students, grades_per_student, format='json', seed=0):
+    """
+    Write a synthetic grade book.
+
+    Args:
+        path (str): The file to write.
+        students (int): The number of students.
+        grades_per_student (int): The number of grades each student gets.
+        format (str): 'json', 'binary', 'sqlite' or 'sharded'.
+        seed (int): The random seed, so the same arguments always give the same grade book.
+    """
+    rng = random.Random(seed)
+    records = {}
+    for number in range(students):
+        student_id = f"S{number:07d}"
+        grades = [round(rng.uniform(40, 100), 1) for _ in range(grades_per_student)]
+        records[student_id] = StudentRecord(student_id, f"Student {number}", f"Class {number % 40}", grades)
+    if format == 'json':
+        write_json(records, path)
+    elif format == 'binary':
+        write_snapshot(records, path)
+    elif format in ('sqlite', 'sharded'):
+        storage = SqliteStorage(path) if format == 'sqlite' else ShardedStorage(path)
+        try:
+            storage.save(records)
+        finally:
+            storage.close()
+    else:
+        raise ValueError(f"Unknown grade book format: {format}")
+
+
+def summarize(samples):
+    """
+    Summarize the seconds taken by repeated runs of an operation.
+
+    Args:
+        samples (list): The seconds each run took.
+
+    Returns:
+        dict: 'samples', 'ops_per_sec', 'p50_ms' and 'p99_ms'.
+    """
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        'samples': len(ordered),
+        'ops_per_sec': round(len(ordered) / total, 3) if total else None,
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 4),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 4),
+    }
+
+
+def measure(run, budget, max_samples, min_samples=3):
+    """
+    Time an operation repeatedly until the time budget or sample count is used up.
+
+    Args:
+        run (function): Runs the operation once. Called with the sample number.
+        budget (float): The seconds to spend, after the minimum number of samples.
+        max_samples (int): The most runs.
+        min_samples (int): The fewest runs, whatever the budget.
+
+    Returns:
+        dict: The summary of the samples.
+    """
+    samples = []
+    deadline = time.perf_counter() + budget
+    while len(samples) < max_samples and (len(samples) < min_samples or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        run(len(samples))
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def peak_rss_mb():
+    """
+    Get the peak resident memory of this process.
+
+    Returns:
+        float: Megabytes, or None where the resource module is missing (Windows).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_case(directory, students, grades_per_student, format, journal, budget, max_samples):
+    """
+    Benchmark every operation on one grade book size. Runs in its own process so the peak
+    memory belongs to this size alone.
+
+    Args:
+        directory (str): A scratch directory.
+        students (int): The number of students.
+        grades_per_student (int): The number of grades per student.
+        format (str): 'json', 'binary', 'sqlite' or 'sharded'.
+        journal (bool): Open the grade book in journal mode.
+        budget (float): The seconds to spend on each operation.
+        max_samples (int): The most runs of each operation.
+
+    Returns:
+        dict: The summary of each operation, and 'peak_rss_mb'.
+    """
+    path = os.path.join(directory, FORMATS[format])
+    generate(path, students, grades_per_student, format)
+    rng = random.Random(1)
+    student_ids = [f"S{rng.randrange(students):07d}" for _ in range(max_samples)]
+    results = {}
+
+    def cold_start(_):
+        GradeBook(path, journal=journal).close()
+    results['cold_start'] = measure(cold_start, budget, max_samples)
+
+    gradebook = GradeBook(path, journal=journal)
+    try:
+        results['load_data'] = measure(lambda _: gradebook.load_data(), budget, max_samples)
+        results['save_data'] = measure(lambda _: gradebook.save_data(), budget, max_samples)
+        results['add_grade'] = measure(lambda number: gradebook.add_grade(student_ids[number], 101.0), budget, max_samples)
+        added = results['add_grade']['samples']
+        results['delete_grade'] = measure(lambda number: gradebook.delete_grade(student_ids[number], 101.0),
+                                          budget, added, min_samples=min(3, added))
+        results['calculate_final_grade'] = measure(lambda number: gradebook.calculate_final_grade(student_ids[number]), budget, max_samples)
+        export_path = os.path.join(directory, 'export.csv')
+        results['export_data'] = measure(lambda _: gradebook.export_data(export_path), budget, max_samples)
+    finally:
+        gradebook.close()
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def run_suite(sizes, grades_per_student, format='json', journal=False, budget=2.0, max_samples=1000):
+    """
+    Benchmark every size, each in a fresh process.
+
+    Args:
+        sizes (list): The numbers of students to try.
+        grades_per_student (int): The number of grades per student.
+        format (str): 'json', 'binary', 'sqlite' or 'sharded'.
+        journal (bool): Open the grade books in journal mode.
+        budget (float): The seconds to spend on each operation.
+        max_samples (int): The most runs of each operation.
+
+    Returns:
+        dict: The report, with 'meta' describing the run and 'results' keyed by size.
+    """
+    report = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'format': format,
+            'journal': journal,
+            'grades_per_student': grades_per_student,
+            'budget': budget,
+            'max_samples': max_samples,
+        },
+        'results': {},
+    }
+    for students in sizes:
+        directory = tempfile.mkdtemp(prefix='gradebook-bench-')
+        try:
+            command = [sys.executable, os.path.abspath(__file__), '--case', str(students), '--directory', directory,
+                       '--grades-per-student', str(grades_per_student), '--format', format,
+                       '--budget', str(budget), '--max-samples', str(max_samples)]
+            if journal:
+                command.append('--journal')
+            output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+            report['results'][str(students)] = json.loads(output)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        print(f"{students} students done", file=sys.stderr)
+    return report
+
+
+def compare(report, baseline, threshold):
+    """
+    Find operations that got slower than a baseline report by more than a threshold.
+
+    The median latency is compared, for every size and operation present in both reports.
+    Peak memory is compared the same way.
+
+    Args:
+        report (dict): The new report.
+        baseline (dict): The baseline report.
+        threshold (float): The allowed slowdown, as a fraction: 0.25 allows 25% slower.
+
+    Returns:
+        list: A description of each regression. Empty if there are none.
+
+    Raises:
+        ValueError: If the baseline was run with a different format, journal mode or grades per student.
+    """
+    for setting in ('format', 'journal', 'grades_per_student'):
+        if report['meta'].get(setting) != baseline.get('meta', {}).get(setting):
+            raise ValueError(f"The baseline was run with a different {setting}: {baseline.get('meta', {}).get(setting)!r}")
+    regressions = []
+    for size, results in report['results'].items():
+        old_results = baseline.get('results', {}).get(size, {})
+        for operation in OPERATIONS:
+            new, old = results.get(operation), old_results.get(operation)
+            if not new or not old or not old['p50_ms']:
+                continue
+            change = new['p50_ms'] / old['p50_ms'] - 1
+            if change > threshold:
+                regressions.append(f"{size} students, {operation}: p50 {old['p50_ms']} ms -> {new['p50_ms']} ms (+{change:.0%})")
+        new_rss, old_rss = results.get('peak_rss_mb'), old_results.get('peak_rss_mb')
+        if new_rss and old_rss and new_rss / old_rss - 1 > threshold:
+            regressions.append(f"{size} students, peak RSS: {old_rss} MB -> {new_rss} MB (+{new_rss / old_rss - 1:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    """
+    Run the benchmarks from the command line.
+
+    Args:
+        argv (list): The arguments, or None to use sys.argv.
+
+    Returns:
+        int: The exit status: 1 if a regression against the baseline was found, otherwise 0.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark GradeBook operations across roster sizes.')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated numbers of students, e.g. 1000,10000,100000,1000000')
+    parser.add_argument('--grades-per-student', type=int, default=10, help='grades per synthetic student')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='json', help='the grade book file format')
+    parser.add_argument('--journal', action='store_true', help='open the grade books in journal mode')
+    parser.add_argument('--budget', type=float, default=2.0, help='seconds to spend on each operation')
+    parser.add_argument('--max-samples', type=int, default=1000, help='the most runs of each operation')
+    parser.add_argument('--output', help='write the JSON report to this file as well as printing it')
+    parser.add_argument('--baseline', help='a report to compare against; regressions make the exit status 1')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown against the baseline, as a fraction')
+    parser.add_argument('--case', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--directory', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case is not None:
+        results = run_case(args.directory, args.case, args.grades_per_student, args.format, args.journal, args.budget, args.max_samples)
+        print(json.dumps(results))
+        return 0
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    report = run_suite(sizes, args.grades_per_student, args.format, args.journal, args.budget, args.max_samples)
+    text = json.dumps(report, indent=4)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from gradebook_aggregates import RunningStats
+from gradebook_records import GradeEntries, LazyStudents, StudentRecord
+
+MAGIC = b'GRADEBK\x01'
+VERSION = 2
+
+# magic, version, reserved, student count, grade count, then the offsets of the index,
+# grade, string, class and sort-order regions and the size of the class region.
+HEADER = struct.Struct('<8sII8Q')
+
+# string offset, ID length, name length, class number, grade count, first grade,
+# then the sum, sum of squares, minimum and maximum of the grades, and the length of the
+# grade entries JSON stored after the name (0 when the grades are numbered from 1).
+ENTRY = struct.Struct('<QIIIIQddddI')
+
+# Version 1 snapshots have no grade entries.
+ENTRIES = {1: struct.Struct('<QIIIIQdddd'), VERSION: ENTRY}
+
+ORDER = struct.Struct('<I')
+
+
+def is_binary_snapshot(path):
+    """
+    Check whether a file is a binary grade book snapshot.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        bool: True if the file starts with the snapshot magic bytes.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def write_snapshot(students, path):
+    """
+    Write student records to a binary snapshot file.
+
+    The file holds a fixed-size header, one fixed-size index entry per student, every grade in
+    one contiguous float64 region, the ID and name strings followed by any grade entries as JSON,
+    a small JSON table of classes with their aggregates, and the student numbers sorted by ID for
+    binary search.
+
+    Args:
+        students (Mapping): StudentRecord objects keyed by student ID.
+        path (str): The path to write to.
+    """
+    records = students.iter_records() if isinstance(students, LazyStudents) else students.values()
+    count = len(students)
+    index_offset = HEADER.size
+    grades_offset = index_offset + count * ENTRY.size
+    index = bytearray()
+    strings = bytearray()
+    ids = []
+    classes = {}
+    grade_count = 0
+    with open(path, 'wb') as f:
+        f.seek(grades_offset)
+        for student in records:
+            grades = student.grades
+            if sys.byteorder != 'little':
+                grades = array('d', grades)
+                grades.byteswap()
+            f.write(grades.tobytes())
+            stats = RunningStats(student.grades)
+            id_bytes = student.id.encode('utf-8')
+            name_bytes = student.name.encode('utf-8')
+            entries_bytes = b'' if student.entries is None else json.dumps(student.entries.to_dict()).encode('utf-8')
+            class_info = classes.get(student.class_name)
+            if class_info is None:
+                class_info = classes[student.class_name] = [len(classes), 0, RunningStats()]
+            class_info[1] += 1
+            class_info[2].merge(stats)
+            index += ENTRY.pack(
+                len(strings), len(id_bytes), len(name_bytes), class_info[0], stats.count, grade_count,
+                stats.total, stats.total_sq,
+                math.nan if stats.minimum is None else stats.minimum,
+                math.nan if stats.maximum is None else stats.maximum,
+                len(entries_bytes),
+            )
+            strings += id_bytes
+            strings += name_bytes
+            strings += entries_bytes
+            ids.append(id_bytes)
+            grade_count += stats.count
+        strings_offset = f.tell()
+        f.write(strings)
+        classes_offset = f.tell()
+        class_table = json.dumps([
+            {'Class': name, 'Students': size, 'Count': stats.count, 'Total': stats.total,
+             'TotalSq': stats.total_sq, 'Min': stats.minimum, 'Max': stats.maximum}
+            for name, (_, size, stats) in classes.items()
+        ]).encode('utf-8')
+        f.write(class_table)
+        f.write(b'\0' * (-f.tell() % ORDER.size))
+        order_offset = f.tell()
+        order = array('I', sorted(range(count), key=ids.__getitem__))
+        if sys.byteorder != 'little':
+            order.byteswap()
+        f.write(order.tobytes())
+        f.seek(0)
+        f.write(HEADER.pack(
+            MAGIC, VERSION, 0, count, grade_count, index_offset, grades_offset,
+            strings_offset, classes_offset, len(class_table), order_offset,
+        ))
+        f.write(index)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class BinarySnapshot:
+    """
+    A read-only, memory-mapped binary grade book snapshot.
+
+    Opening a snapshot only reads the header and the class table. Student records are decoded
+    from the mapping when they are asked for, which makes a snapshot a source for LazyStudents.
+
+    Attributes:
+        path (str): The path to the snapshot file.
+        count (int): The number of students in the snapshot.
+        header_size (int): The bytes read to open the snapshot: the header and the class table.
+    """
+
+    def __init__(self, path):
+        """
+        Open and map a snapshot file.
+
+        Args:
+            path (str): The path to the snapshot file.
+
+        Raises:
+            ValueError: If the file is not a binary snapshot of a supported version.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped.
+            self._file.close()
+            raise ValueError(f"{path} is not a binary grade book snapshot")
+        (magic, version, _, self.count, self.grade_count, self._index_offset, self._grades_offset,
+         self._strings_offset, classes_offset, classes_size, self._order_offset) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version not in ENTRIES:
+            self.close()
+            raise ValueError(f"{path} is not a binary grade book snapshot")
+        self._entry = ENTRIES[version]
+        self._classes = json.loads(self._map[classes_offset:classes_offset + classes_size])
+        self.header_size = HEADER.size + classes_size
+        self._class_names = [sys.intern(info['Class']) for info in self._classes]
+
+    def close(self):
+        """
+        Unmap and close the snapshot file.
+        """
+        self._map.close()
+        self._file.close()
+
+    def id_at(self, number):
+        """
+        Read the ID of the student stored at a position.
+
+        Args:
+            number (int): The position of the student in the snapshot.
+
+        Returns:
+            str: The student ID.
+        """
+        string_offset, id_length = struct.unpack_from('<QI', self._map, self._index_offset + number * self._entry.size)
+        start = self._strings_offset + string_offset
+        return self._map[start:start + id_length].decode('utf-8')
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, student_id):
+        return self.find(student_id) is not None
+
+    def read(self, student_id):
+        """
+        Decode a student by ID.
+
+        Args:
+            student_id (str): The student ID.
+
+        Returns:
+            StudentRecord: The decoded record, or None if the student is not in the snapshot.
+        """
+        number = self.find(student_id)
+        return None if number is None else self.record(number)
+
+    def ids(self):
+        """
+        Yield every student ID in stored order.
+
+        Yields:
+            str: Each student ID.
+        """
+        for number in range(self.count):
+            yield self.id_at(number)
+
+    def records(self):
+        """
+        Decode every student in stored order.
+
+        Yields:
+            StudentRecord: Each student record.
+        """
+        for number in range(self.count):
+            yield self.record(number)
+
+    def find(self, student_id):
+        """
+        Find the position of a student by ID with a binary search over the sorted IDs.
+
+        Args:
+            student_id (str): The student ID.
+
+        Returns:
+            int: The position of the student, or None if the student is not in the snapshot.
+        """
+        if not isinstance(student_id, str):
+            return None
+        key = student_id.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            number = ORDER.unpack_from(self._map, self._order_offset + middle * ORDER.size)[0]
+            string_offset, id_length = struct.unpack_from('<QI', self._map, self._index_offset + number * self._entry.size)
+            start = self._strings_offset + string_offset
+            found = self._map[start:start + id_length]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return number
+        return None
+
+    def record(self, number):
+        """
+        Decode the student stored at a position.
+
+        Args:
+            number (int): The position of the student in the snapshot.
+
+        Returns:
+            StudentRecord: The decoded record, with its running aggregates already filled in.
+        """
+        fields = self._entry.unpack_from(self._map, self._index_offset + number * self._entry.size)
+        string_offset, id_length, name_length, class_number, grade_count, first_grade, total, total_sq, minimum, maximum = fields[:10]
+        entries_length = fields[10] if len(fields) > 10 else 0
+        start = self._strings_offset + string_offset
+        student_id = self._map[start:start + id_length].decode('utf-8')
+        start += id_length
+        name = self._map[start:start + name_length].decode('utf-8')
+        start += name_length
+        entries = None
+        if entries_length:
+            entries = GradeEntries.from_dict(json.loads(self._map[start:start + entries_length]))
+        record = StudentRecord(student_id, name, self._class_names[class_number])
+        start = self._grades_offset + first_grade * 8
+        record.grades.frombytes(self._map[start:start + grade_count * 8])
+        if sys.byteorder != 'little':
+            record.grades.byteswap()
+        record.entries = entries
+        stats = RunningStats()
+        if grade_count:
+            stats.count = grade_count
+            stats.total = total
+            stats.total_sq = total_sq
+            stats.minimum = minimum
+            stats.maximum = maximum
+        record.stats = stats
+        return record
+
+    def class_aggregates(self):
+        """
+        Read the per-class aggregates stored in the snapshot.
+
+        Returns:
+            tuple: A dictionary of RunningStats and a dictionary of student counts, both keyed by class.
+        """
+        class_stats = {}
+        class_sizes = {}
+        for name, info in zip(self._class_names, self._classes):
+            stats = RunningStats()
+            stats.count = info['Count']
+            stats.total = info['Total']
+            stats.total_sq = info['TotalSq']
+            stats.minimum = info['Min']
+            stats.maximum = info['Max']
+            class_stats[name] = stats
+            class_sizes[name] = info['Students']
+        return class_stats, class_sizes
@@ -0,0 +1,416 @@
+import argparse
+import io
+import json
+import math
+import shlex
+import sys
+import weakref
+
+from gradebook import GradeBook
+from gradebook_export import EXPORT_FORMATS
+
+try:
+    from gradebook_stats import GradeStatistics
+except ImportError:
+    # Without NumPy, class statistics come from the grade book's running aggregates instead.
+    GradeStatistics = None
+
+# One GradeStatistics per grade book, so the lines of a batch share its packed arrays.
+_statistics = weakref.WeakKeyDictionary()
+
+
+class CommandError(Exception):
+    """
+    A command that could not be carried out, such as a grade for a student who does not exist.
+    """
+
+
+class _LineParser(argparse.ArgumentParser):
+    """
+    An argument parser that raises CommandError instead of exiting, for the lines of a batch.
+    """
+
+    def error(self, message):
+        raise CommandError(message)
+
+    def exit(self, status=0, message=None):
+        raise CommandError(message.strip() if message else 'the line asked the parser to exit')
+
+    def print_help(self, file=None):
+        raise CommandError('-h is not supported in a batch; run the command with -h on its own')
+
+
+def _timestamp(text):
+    """
+    Parse a --timestamp argument.
+
+    Args:
+        text (str): Seconds since the epoch.
+
+    Returns:
+        float: The timestamp.
+
+    Raises:
+        argparse.ArgumentTypeError: If the text is not a finite number.
+    """
+    try:
+        timestamp = float(text)
+    except ValueError:
+        timestamp = math.nan
+    if not math.isfinite(timestamp):
+        raise argparse.ArgumentTypeError(f"invalid timestamp: {text!r}")
+    return timestamp
+
+
+def _student(gradebook, student_id):
+    """
+    Look up a student, or fail the command.
+
+    Args:
+        gradebook (GradeBook): The grade book.
+        student_id (str): The ID of the student.
+
+    Returns:
+        StudentRecord: The student.
+
+    Raises:
+        CommandError: If the student does not exist.
+    """
+    student = gradebook.students.get(student_id)
+    if student is None:
+        raise CommandError(f"Student with ID {student_id} does not exist.")
+    return student
+
+
+def _describe(gradebook, student):
+    """
+    Convert a student to a dictionary with their final grade.
+
+    Args:
+        gradebook (GradeBook): The grade book.
+        student (StudentRecord): The student.
+
+    Returns:
+        dict: 'ID', 'Name', 'Class', 'Grades' and 'Final Grade'.
+    """
+    return {'ID': student.id, 'Name': student.name, 'Class': student.class_name,
+            'Grades': student.grades.tolist(), 'Final Grade': gradebook.calculate_final_grade(student.id)}
+
+
+def _add_student(gradebook, args):
+    if not gradebook.add_student({'ID': args.id, 'Name': args.name, 'Class': args.class_name}):
+        raise CommandError(f"Student with ID {args.id} already exists.")
+    return f"Added student {args.id}."
+
+
+def _delete_student(gradebook, args):
+    if not gradebook.delete_student(args.id):
+        raise CommandError(f"Student with ID {args.id} does not exist.")
+    return f"Deleted student {args.id}."
+
+
+def _add_grade(gradebook, args):
+    if not gradebook.add_grade(args.id, args.grade, args.assignment, args.timestamp):
+        raise CommandError(f"Student with ID {args.id} does not exist.")
+    return f"Added grade {args.grade} for student {args.id}."
+
+
+def _delete_grade(gradebook, args):
+    _student(gradebook, args.id)
+    if args.entry is not None:
+        if not gradebook.delete_grade_entry(args.id, args.entry):
+            raise CommandError(f"Grade entry {args.entry} not found for student ID {args.id}.")
+        return f"Deleted grade entry {args.entry} for student {args.id}."
+    if args.grade is None:
+        raise CommandError('Give the grade to delete, or --entry')
+    if not gradebook.delete_grade(args.id, args.grade):
+        raise CommandError(f"Grade {args.grade} not found for student ID {args.id}.")
+    return f"Deleted grade {args.grade} for student {args.id}."
+
+
+def _show(gradebook, args):
+    student = _student(gradebook, args.id)
+    if args.entries:
+        return gradebook.grade_entries(args.id)
+    return _describe(gradebook, student)
+
+
+def _final_grade(gradebook, args):
+    _student(gradebook, args.id)
+    return {'ID': args.id, 'Final Grade': gradebook.calculate_final_grade(args.id)}
+
+
+def _search(gradebook, args):
+    student = gradebook.students.get(args.text)
+    if student:
+        matches = [student]
+    else:
+        matches = gradebook.find_by_name_prefix(args.text, limit=args.limit) or gradebook.find_by_class(args.text, limit=args.limit)
+    if not matches:
+        raise CommandError(f"No student found matching: {args.text}")
+    return [_describe(gradebook, student) for student in matches]
+
+
+def _class_summaries(gradebook):
+    """
+    Summarize the grades of every class in one vectorized pass, or return None without NumPy.
+
+    Args:
+        gradebook (GradeBook): The grade book.
+
+    Returns:
+        dict: For each class, its 'count', 'mean', 'variance', 'std', 'min', 'max', 'median' and
+            'percentiles', or None if NumPy is not installed.
+    """
+    if GradeStatistics is None:
+        return None
+    statistics = _statistics.get(gradebook)
+    if statistics is None:
+        statistics = _statistics[gradebook] = GradeStatistics(gradebook)
+    summaries = {}
+    for class_name, summary in statistics.class_summary().items():
+        std = summary['std']
+        summaries[class_name] = {
+            'count': summary['count'], 'mean': summary['mean'], 'variance': None if std is None else std * std,
+            'std': std, 'min': summary['min'], 'max': summary['max'], 'median': summary['median'],
+            'percentiles': summary['percentiles'],
+        }
+    return summaries
+
+
+def _stats(gradebook, args):
+    if args.id is not None:
+        _student(gradebook, args.id)
+        return dict(gradebook.grade_statistics(args.id), ID=args.id)
+    summaries = _class_summaries(gradebook)
+    if args.class_name is not None:
+        if summaries is None:
+            summary = gradebook.class_statistics(args.class_name)
+        else:
+            summary = summaries.get(args.class_name)
+        if summary is None:
+            raise CommandError(f"No student is in class {args.class_name}.")
+        return dict(summary, Class=args.class_name)
+    if summaries is None:
+        return [dict(gradebook.class_statistics(class_name), Class=class_name) for class_name in gradebook.class_names()]
+    return [dict(summaries[class_name], Class=class_name) for class_name in gradebook.class_names()]
+
+
+def _ranked(pairs):
+    return [{'ID': student_id, 'Final Grade': final_grade} for student_id, final_grade in pairs]
+
+
+def _top(gradebook, args):
+    return _ranked(gradebook.top_k(args.n, args.class_name))
+
+
+def _bottom(gradebook, args):
+    return _ranked(gradebook.bottom_k(args.n, args.class_name))
+
+
+def _between(gradebook, args):
+    return _ranked(gradebook.students_between(args.low, args.high, args.class_name))
+
+
+def _rank(gradebook, args):
+    _student(gradebook, args.id)
+    rank = gradebook.rank_of(args.id, args.in_class)
+    if rank is None:
+        raise CommandError(f"Student with ID {args.id} has no grades.")
+    return {'ID': args.id, 'Rank': rank, 'Final Grade': gradebook.calculate_final_grade(args.id)}
+
+
+def _export(gradebook, args):
+    try:
+        count = gradebook.export_data(args.path, args.format, args.compression, args.classes)
+    except (OSError, ValueError) as error:
+        raise CommandError(str(error)) from None
+    return f"Exported {count} students to {args.path}."
+
+
+def _add_commands(subparsers):
+    """
+    Add the grade book commands to a parser, for both the command line and the lines of a batch.
+
+    Args:
+        subparsers: The result of ArgumentParser.add_subparsers.
+    """
+    command = subparsers.add_parser('add-student', help='add a student')
+    command.add_argument('id', help='the student ID')
+    command.add_argument('name', help='the student name')
+    command.add_argument('class_name', metavar='class', help='the class')
+    command.set_defaults(run=_add_student)
+
+    command = subparsers.add_parser('delete-student', help='delete a student and their grades')
+    command.add_argument('id', help='the student ID')
+    command.set_defaults(run=_delete_student)
+
+    command = subparsers.add_parser('add-grade', help='add a grade for a student')
+    command.add_argument('id', help='the student ID')
+    command.add_argument('grade', type=float, help='the grade')
+    command.add_argument('--assignment', help='the assignment the grade is for')
+    command.add_argument('--timestamp', type=_timestamp, help='when the grade was given, in seconds since the epoch (default: not recorded)')
+    command.set_defaults(run=_add_grade)
+
+    command = subparsers.add_parser('delete-grade', help='delete a grade of a student, by value or by entry ID')
+    command.add_argument('id', help='the student ID')
+    command.add_argument('grade', type=float, nargs='?', help='the grade; the earliest one is deleted if it appears more than once')
+    command.add_argument('--entry', type=int, help='delete the grade with this entry ID instead')
+    command.set_defaults(run=_delete_grade)
+
+    command = subparsers.add_parser('show', help='show a student')
+    command.add_argument('id', help='the student ID')
+    command.add_argument('--entries', action='store_true', help='list each grade with its entry ID, assignment and timestamp')
+    command.set_defaults(run=_show)
+
+    command = subparsers.add_parser('final-grade', help='show the final grade of a student')
+    command.add_argument('id', help='the student ID')
+    command.set_defaults(run=_final_grade)
+
+    command = subparsers.add_parser('search', help='find students by ID, the start of a name, or class')
+    command.add_argument('text', help='the text to search for')
+    command.add_argument('--limit', type=int, default=100, help='the most students to list')
+    command.set_defaults(run=_search)
+
+    command = subparsers.add_parser('stats', help='show grade statistics of a student, a class, or every class '
+                                                  '(with medians and percentiles when NumPy is installed)')
+    target = command.add_mutually_exclusive_group()
+    target.add_argument('--id', help='the student ID')
+    target.add_argument('--class', dest='class_name', help='the class')
+    command.set_defaults(run=_stats)
+
+    command = subparsers.add_parser('top', help='list the students with the highest final grades')
+    command.add_argument('n', type=int, help='the number of students')
+    command.add_argument('--class', dest='class_name', help='only rank students in this class')
+    command.set_defaults(run=_top)
+
+    command = subparsers.add_parser('bottom', help='list the students with the lowest final grades')
+    command.add_argument('n', type=int, help='the number of students')
+    command.add_argument('--class', dest='class_name', help='only rank students in this class')
+    command.set_defaults(run=_bottom)
+
+    command = subparsers.add_parser('between', help='list the students with a final grade in a range, highest first')
+    command.add_argument('low', type=float, help='the lowest final grade')
+    command.add_argument('high', type=float, help='the highest final grade')
+    command.add_argument('--class', dest='class_name', help='only list students in this class')
+    command.set_defaults(run=_between)
+
+    command = subparsers.add_parser('rank', help='show the rank of a student by final grade')
+    command.add_argument('id', help='the student ID')
+    command.add_argument('--in-class', action='store_true', help='rank the student among their class')
+    command.set_defaults(run=_rank)
+
+    command = subparsers.add_parser('export', help='export the grade book')
+    command.add_argument('path', help='the file to write; the format and compression follow its extension')
+    command.add_argument('--format', choices=EXPORT_FORMATS + ('binary',), help='the export format')
+    command.add_argument('--compression', choices=('gzip', 'lzma'), help='the compression')
+    command.add_argument('--class', dest='classes', action='append', help='only export this class; may be repeated')
+    command.set_defaults(run=_export)
+
+
+def _print(result, as_json, out):
+    """
+    Print the result of a command.
+
+    Args:
+        result: A message, a dictionary, or a list of dictionaries.
+        as_json (bool): Print the result as one line of JSON instead of text.
+        out (file): Where to print.
+    """
+    if as_json:
+        print(json.dumps(result), file=out)
+    elif isinstance(result, list):
+        for item in result:
+            _print(item, as_json, out)
+    elif isinstance(result, dict):
+        print(', '.join(f"{key}: {value}" for key, value in result.items()), file=out)
+    else:
+        print(result, file=out)
+
+
+def run_batch(gradebook, lines, keep_going=False, as_json=False, out=None, err=None):
+    """
+    Run one command per line inside a single grade book batch, so every change is persisted once.
+
+    Lines are split like a shell command line. Blank lines and lines starting with # are skipped.
+    Without keep_going the first failing line undoes every change the batch made and nothing is written.
+    Results are printed only once the batch has been saved; errors are printed as they happen.
+
+    Args:
+        gradebook (GradeBook): The grade book.
+        lines (iterable): The command lines, such as an open file.
+        keep_going (bool): Report failing lines and carry on, persisting the lines that succeeded.
+        as_json (bool): Print results as JSON lines.
+        out (file): Where results are printed. Defaults to standard output.
+        err (file): Where errors are printed. Defaults to standard error.
+
+    Returns:
+        int: The number of lines that failed.
+    """
+    out = out or sys.stdout
+    err = err or sys.stderr
+    parser = _LineParser(prog='batch', add_help=False)
+    _add_commands(parser.add_subparsers(dest='command', required=True))
+    failures = 0
+    results = io.StringIO()
+    try:
+        with gradebook.batch():
+            for line_number, line in enumerate(lines, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    args = parser.parse_args(shlex.split(line))
+                    _print(args.run(gradebook, args), as_json, results)
+                except (CommandError, ValueError) as error:
+                    failures += 1
+                    print(f"Line {line_number}: {error}", file=err)
+                    if not keep_going:
+                        raise CommandError('The batch was rolled back; nothing was saved.') from None
+    except CommandError as error:
+        print(error, file=err)
+        return failures
+    out.write(results.getvalue())
+    return failures
+
+
+def main(argv=None):
+    """
+    Run grade book commands from the command line, without the GUI.
+
+    Args:
+        argv (list): The arguments, or None to use sys.argv.
+
+    Returns:
+        int: The exit status: 0 on success, 1 if a command failed.
+    """
+    parser = argparse.ArgumentParser(description='Manage a grade book from the command line.')
+    parser.add_argument('--gradebook', default='gradebook.json', help='the grade book file (JSON, binary snapshot or SQLite)')
+    parser.add_argument('--journal', action='store_true', help='append changes to a journal instead of rewriting the file')
+    parser.add_argument('--json', action='store_true', help='print results as JSON, one line per command')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    _add_commands(subparsers)
+    command = subparsers.add_parser('batch', help='run many commands, one per line, and save them together')
+    command.add_argument('source', nargs='?', default='-', help='the file of commands, or - for standard input')
+    command.add_argument('--keep-going', action='store_true', help='skip failing lines instead of rolling the batch back')
+    args = parser.parse_args(argv)
+
+    gradebook = GradeBook(args.gradebook, journal=args.journal)
+    try:
+        if args.command == 'batch':
+            if args.source == '-':
+                return 1 if run_batch(gradebook, sys.stdin, args.keep_going, args.json) else 0
+            with open(args.source, 'r', encoding='utf-8') as f:
+                return 1 if run_batch(gradebook, f, args.keep_going, args.json) else 0
+        try:
+            _print(args.run(gradebook, args), args.json, sys.stdout)
+        except CommandError as error:
+            print(error, file=sys.stderr)
+            return 1
+        return 0
+    finally:
+        gradebook.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+import argparse
+import json
+import math
+import os
+from json.decoder import WHITESPACE
+
+from gradebook_export import EXPORT_FORMATS, guess_export, open_export, write_students
+from gradebook_import import open_import
+from gradebook_records import GradeEntries, StudentRecord
+
+READ_SIZE = 64 * 1024
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+# Field names in any variant, by their case-folded spelling.
+FIELDS = {
+    'id': 'ID',
+    'name': 'Name',
+    'class': 'Class',
+    'grades': 'Grades',
+    'grade ids': 'Grade IDs',
+    'assignments': 'Assignments',
+    'timestamps': 'Timestamps',
+    'last grade id': 'Last Grade ID',
+}
+
+
+class ParseError(ValueError):
+    """
+    A grade book file that is not valid JSON, so the students after the error cannot be read.
+
+    Attributes:
+        line (int): The line the error is on.
+        message (str): What is wrong.
+    """
+
+    def __init__(self, line, message):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+        self.message = message
+
+
+class _JsonReader:
+    """
+    Reads a JSON document piece by piece from a text file, keeping track of the line number.
+
+    Only the text that has not been decoded yet is buffered, so memory use is bounded by the
+    largest value decoded at once rather than by the file.
+    """
+
+    def __init__(self, f, max_record_size=MAX_RECORD_SIZE):
+        self._f = f
+        self._max_record_size = max_record_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+        self.line = 1
+
+    def _more(self):
+        """
+        Read the next piece of the file, dropping the text already decoded.
+
+        Returns:
+            bool: False at the end of the file.
+        """
+        if self._eof:
+            return False
+        text = self._f.read(READ_SIZE)
+        if not text:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._position:] + text
+        self._position = 0
+        return True
+
+    def _advance(self, end):
+        self.line += self._buffer.count('\n', self._position, end)
+        self._position = end
+
+    def peek(self):
+        """
+        Skip whitespace and look at the next character.
+
+        Returns:
+            str: The character, or '' at the end of the file.
+        """
+        while True:
+            self._advance(WHITESPACE.match(self._buffer, self._position).end())
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._more():
+                return ''
+
+    def expect(self, characters):
+        """
+        Skip whitespace and read one of some punctuation characters.
+
+        Args:
+            characters (str): The characters allowed, such as ',}'.
+
+        Returns:
+            str: The character read.
+
+        Raises:
+            ParseError: If the next character is not one of them.
+        """
+        character = self.peek()
+        if not character or character not in characters:
+            found = repr(character) if character else 'the end of the file'
+            raise ParseError(self.line, f"expected {' or '.join(map(repr, characters))}, found {found}")
+        self._advance(self._position + 1)
+        return character
+
+    def value(self):
+        """
+        Skip whitespace and decode the next JSON value.
+
+        Returns:
+            The value.
+
+        Raises:
+            ParseError: If the value is not valid JSON or is larger than the record size limit.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError as error:
+                if len(self._buffer) - self._position <= self._max_record_size and self._more():
+                    continue
+                line = self.line + self._buffer.count('\n', self._position, error.pos)
+                if len(self._buffer) - self._position > self._max_record_size:
+                    raise ParseError(self.line, f"a record is larger than {self._max_record_size} characters") from None
+                raise ParseError(line, error.msg) from None
+            # A number that ends with the buffer may go on in the next piece.
+            if end < len(self._buffer) or not self._more():
+                self._advance(end)
+                return value
+
+
+def read_members(f, max_record_size=MAX_RECORD_SIZE):
+    """
+    Read the members of a top-level JSON object, or the items of a top-level array, one at a time.
+
+    Args:
+        f (file): A text file open for reading.
+        max_record_size (int): The most characters one member may take up.
+
+    Yields:
+        tuple: The line the member starts on, its key (None in an array) and its decoded value.
+            The first item yielded is the layout instead: 'object' or 'array'.
+
+    Raises:
+        ParseError: If the file is not valid JSON, or its top level is neither an object nor an array.
+    """
+    reader = _JsonReader(f, max_record_size)
+    if reader.peek() == '\ufeff':
+        # Files saved by some Windows editors start with a byte order mark.
+        reader.expect('\ufeff')
+    opening = reader.expect('{[')
+    closing = '}' if opening == '{' else ']'
+    yield 'object' if opening == '{' else 'array'
+    if reader.peek() == closing:
+        reader.expect(closing)
+    else:
+        while True:
+            reader.peek()
+            line = reader.line
+            key = None
+            if opening == '{':
+                if reader.peek() != '"':
+                    reader.expect('"')
+                key = reader.value()
+                reader.expect(':')
+            yield line, key, reader.value()
+            if reader.expect(',' + closing) == closing:
+                break
+    if reader.peek():
+        raise ParseError(reader.line, 'unexpected data after the end of the grade book')
+
+
+def normalize_student(key, student_info):
+    """
+    Check a student in any known layout and convert it to a record.
+
+    Field names are matched ignoring case, so both {'ID', 'Name', 'Class', 'Grades'} and the older
+    {'name', 'class', 'grades'} keyed by ID are read. A missing ID is taken from the key, numeric
+    IDs and classes become text, a missing grade list is empty, and grades written as text are
+    read as numbers.
+
+    Args:
+        key (str): The key the student is stored under, or None in an array.
+        student_info (dict): The student.
+
+    Returns:
+        tuple: The StudentRecord, and the variant of its field names: 'canonical', 'lowercase' or 'mixed'.
+
+    Raises:
+        ValueError: If the student cannot be converted.
+    """
+    if not isinstance(student_info, dict):
+        raise ValueError(f"expected a student object, found {type(student_info).__name__}")
+    fields = {}
+    spellings = set()
+    for name, value in student_info.items():
+        field = FIELDS.get(name.casefold())
+        if field is None:
+            raise ValueError(f"unknown field {name!r}")
+        if field in fields:
+            raise ValueError(f"field {field!r} appears more than once")
+        fields[field] = value
+        spellings.add('canonical' if name == field else 'lowercase' if name == field.lower() else 'mixed')
+    variant = spellings.pop() if len(spellings) == 1 else 'mixed'
+
+    student_id = fields.get('ID', key)
+    if isinstance(student_id, int) and not isinstance(student_id, bool):
+        student_id = str(student_id)
+    if not isinstance(student_id, str) or not student_id:
+        raise ValueError('the student has no ID')
+    if key is not None and student_id != key:
+        raise ValueError(f"the ID {student_id!r} does not match the key {key!r}")
+    name = fields.get('Name')
+    if not isinstance(name, str):
+        raise ValueError('the student has no Name' if name is None else f"invalid Name {name!r}")
+    class_name = fields.get('Class')
+    if isinstance(class_name, int) and not isinstance(class_name, bool):
+        class_name = str(class_name)
+    if not isinstance(class_name, str):
+        raise ValueError('the student has no Class' if class_name is None else f"invalid Class {class_name!r}")
+
+    grades = fields.get('Grades')
+    if grades is None:
+        grades = []
+    if not isinstance(grades, list):
+        raise ValueError(f"Grades should be a list, found {type(grades).__name__}")
+    checked = []
+    for grade in grades:
+        try:
+            if isinstance(grade, bool):
+                raise ValueError
+            value = float(grade)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid grade {grade!r}") from None
+        if not math.isfinite(value):
+            raise ValueError(f"invalid grade {grade!r}")
+        checked.append(value)
+
+    entries = None
+    if 'Grade IDs' in fields:
+        lists = {field: fields.get(field) for field in ('Grade IDs', 'Assignments', 'Timestamps')}
+        for field, values in lists.items():
+            if values is not None and (not isinstance(values, list) or len(values) != len(checked)):
+                raise ValueError(f"{field} should be a list with one item per grade")
+        try:
+            entries = GradeEntries.build(lists['Grade IDs'], lists['Assignments'], lists['Timestamps'], fields.get('Last Grade ID', 0))
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError('invalid Grade IDs, Assignments, Timestamps or Last Grade ID') from None
+    elif 'Assignments' in fields or 'Timestamps' in fields or 'Last Grade ID' in fields:
+        raise ValueError('Assignments, Timestamps and Last Grade ID need Grade IDs')
+    return StudentRecord(student_id, name, class_name, checked, entries), variant
+
+
+def convert(source, destination=None, format=None, compression=None, progress=None, max_record_size=MAX_RECORD_SIZE):
+    """
+    Check a grade book JSON file in any known layout and write it out in the layout of gradebook.json.
+
+    The source is read and the destination written one student at a time, so files far larger
+    than memory can be converted; only the IDs seen so far are kept, to catch duplicates. The
+    source may be an object keyed by student ID or an array of students, with the field names of
+    gradebook.json or the older lowercase ones (see normalize_student), optionally compressed.
+    Students that fail are reported with the line they start on and left out. A file that is not
+    valid JSON stops the conversion, and nothing is written.
+
+    Args:
+        source (str): The file to read, such as 'data.json' or 'export.json.gz'.
+        destination (str): The file to write, or None to only check the source. It is written under
+            a temporary name first, so it may be the source itself.
+        format (str): One of EXPORT_FORMATS. Defaults to the one matching the destination's extension.
+        compression (str): 'gzip' or 'lzma'. Defaults to the one matching the destination's extension, if any.
+        progress (function): Called as progress(students, errors) every thousand students, or None.
+        max_record_size (int): The most characters one student may take up in the source.
+
+    Returns:
+        dict: The 'layout' of the source ('object' or 'array', or None if it could not be read), how
+            many students used each field name 'variants', the number of 'students' read and
+            'written', and the 'errors' as (line number, message) pairs in file order.
+    """
+    result = {'layout': None, 'variants': {}, 'students': 0, 'written': 0, 'errors': []}
+    seen = {}
+
+    def students(members):
+        result['layout'] = next(members)
+        for line, key, student_info in members:
+            result['students'] += 1
+            try:
+                record, variant = normalize_student(key, student_info)
+                if record.id in seen:
+                    raise ValueError(f"duplicate student ID {record.id!r}, first seen on line {seen[record.id]}")
+            except ValueError as error:
+                result['errors'].append((line, str(error) if key is None else f"Student {key}: {error}"))
+            else:
+                seen[record.id] = line
+                result['variants'][variant] = result['variants'].get(variant, 0) + 1
+                yield record
+            if progress is not None and result['students'] % 1000 == 0:
+                progress(result['students'], len(result['errors']))
+
+    with open_import(source) as f:
+        members = read_members(f, max_record_size)
+        try:
+            if destination is None:
+                for _ in students(members):
+                    pass
+            else:
+                guessed_format, guessed_compression = guess_export(destination)
+                format = format or guessed_format
+                if format not in EXPORT_FORMATS:
+                    raise ValueError(f"Unknown export format: {format}")
+                temp_path = destination + '.tmp'
+                try:
+                    with open_export(temp_path, compression or guessed_compression) as out:
+                        result['written'] = write_students(students(members), out, format)
+                except BaseException:
+                    os.remove(temp_path)
+                    raise
+                os.replace(temp_path, destination)
+        except ParseError as error:
+            result['errors'].append((error.line, error.message))
+            result['written'] = 0
+    if progress is not None:
+        progress(result['students'], len(result['errors']))
+    return result
+
+
+def main(argv=None):
+    """
+    Check or convert a grade book file from the command line.
+
+    Args:
+        argv (list): The arguments, or None to use sys.argv.
+
+    Returns:
+        int: The exit status: 0 if every student was valid, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(description='Check a grade book JSON file in any known layout and convert it to the current one.')
+    parser.add_argument('source', help='the file to read, optionally ending in .gz or .xz')
+    parser.add_argument('destination', nargs='?', help='the file to write (default: only check the source)')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help='the output format (default: from the extension)')
+    parser.add_argument('--max-errors', type=int, default=20, help='the most errors to print')
+    args = parser.parse_args(argv)
+
+    result = convert(args.source, args.destination, args.format,
+                     progress=lambda students, errors: print(f"\r{students} students read, {errors} errors", end='', flush=True))
+    print()
+    for line_number, message in result['errors'][:args.max_errors]:
+        print(f"Line {line_number}: {message}")
+    if len(result['errors']) > args.max_errors:
+        print(f"... and {len(result['errors']) - args.max_errors} more errors")
+    variants = ', '.join(f"{count} {variant}" for variant, count in sorted(result['variants'].items()))
+    print(f"Read {result['students']} students from a JSON {result['layout'] or 'file'} ({variants or 'none valid'}).")
+    if args.destination is not None:
+        print(f"Wrote {result['written']} students to {args.destination}.")
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
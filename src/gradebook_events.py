@@ -0,0 +1,222 @@
+import threading
+
+
+class StudentAdded:
+    """
+    A student was added.
+
+    Attributes:
+        student_id (str): The ID of the student.
+        student (StudentRecord): The student as added.
+    """
+
+    def __init__(self, student_id, student):
+        self.student_id = student_id
+        self.student = student
+
+    def key(self):
+        return ('student', self.student_id)
+
+    def cancels(self, event):
+        # Undoing a deletion puts the same record back.
+        return isinstance(event, StudentDeleted) and event.student is self.student
+
+    def __repr__(self):
+        return f"StudentAdded({self.student_id!r})"
+
+
+class StudentDeleted:
+    """
+    A student was deleted, with their grades.
+
+    Attributes:
+        student_id (str): The ID of the student.
+        student (StudentRecord): The student as they were when deleted.
+    """
+
+    def __init__(self, student_id, student):
+        self.student_id = student_id
+        self.student = student
+
+    def key(self):
+        return ('student', self.student_id)
+
+    def cancels(self, event):
+        return isinstance(event, StudentAdded)
+
+    def __repr__(self):
+        return f"StudentDeleted({self.student_id!r})"
+
+
+class GradeAdded:
+    """
+    A grade was added for a student.
+
+    Attributes:
+        student_id (str): The ID of the student.
+        grade (float): The grade.
+        entry_id (int): The entry ID of the grade.
+    """
+
+    def __init__(self, student_id, grade, entry_id):
+        self.student_id = student_id
+        self.grade = grade
+        self.entry_id = entry_id
+
+    def key(self):
+        return ('grade', self.student_id, self.entry_id)
+
+    def cancels(self, event):
+        # Only the same grade coming back under the same entry undoes a removal.
+        return isinstance(event, GradeRemoved) and event.grade == self.grade
+
+    def __repr__(self):
+        return f"GradeAdded({self.student_id!r}, {self.grade!r}, {self.entry_id!r})"
+
+
+class GradeRemoved:
+    """
+    A grade of a student was deleted.
+
+    Attributes:
+        student_id (str): The ID of the student.
+        grade (float): The grade.
+        entry_id (int): The entry ID the grade had.
+    """
+
+    def __init__(self, student_id, grade, entry_id):
+        self.student_id = student_id
+        self.grade = grade
+        self.entry_id = entry_id
+
+    def key(self):
+        return ('grade', self.student_id, self.entry_id)
+
+    def cancels(self, event):
+        return isinstance(event, GradeAdded) and event.grade == self.grade
+
+    def __repr__(self):
+        return f"GradeRemoved({self.student_id!r}, {self.grade!r}, {self.entry_id!r})"
+
+
+class GradeBookReloaded:
+    """
+    Every student was replaced, such as when the grade book was loaded again from storage.
+    Subscribers should rebuild whatever they keep from the grade book.
+    """
+
+    student_id = None
+
+    def __repr__(self):
+        return 'GradeBookReloaded()'
+
+
+def coalesce(events):
+    """
+    Reduce a sequence of events to their net effect.
+
+    The same grade added and then removed again under the same entry ID, or a student added and
+    then deleted with everything that happened to them in between, leave no events, and neither
+    do changes that were undone. A reload replaces every other event.
+
+    Args:
+        events (list): The events, in the order they happened.
+
+    Returns:
+        list: The remaining events, in order.
+    """
+    if any(isinstance(event, GradeBookReloaded) for event in events):
+        return [GradeBookReloaded()]
+    kept = []
+    latest = {}
+    by_student = {}
+    for event in events:
+        key = event.key()
+        earlier = latest.pop(key, None)
+        if earlier is not None and event.cancels(kept[earlier]):
+            if isinstance(event, StudentDeleted):
+                # Nothing that happened to a student who no longer exists is worth reporting.
+                positions = by_student[event.student_id]
+                for position in positions:
+                    if position >= earlier and kept[position] is not None:
+                        latest.pop(kept[position].key(), None)
+                        kept[position] = None
+                by_student[event.student_id] = [position for position in positions if position < earlier]
+            kept[earlier] = None
+            continue
+        latest[key] = len(kept)
+        by_student.setdefault(event.student_id, []).append(len(kept))
+        kept.append(event)
+    return [event for event in kept if event is not None]
+
+
+class EventBus:
+    """
+    Tells subscribers about changes to the students of a grade book.
+
+    The grade book emits an event for every change it applies in memory, including changes it
+    undoes and changes other processes made. Events are held until the grade book flushes them,
+    once the change, or the whole batch, has been persisted or rolled back. Subscribers are then
+    called with the net effect, in the order they subscribed, on the thread that made the change.
+    Nothing is held while there are no subscribers.
+    """
+
+    def __init__(self):
+        """
+        Initialize a bus with no subscribers.
+        """
+        self._subscribers = []
+        self._held = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """
+        Start calling a function with the events of each flush.
+
+        Args:
+            callback (function): Called as callback(events) with a non-empty list of events. It
+                must not raise, because the changes it is told about are already persisted.
+
+        Returns:
+            function: Call it with no arguments to unsubscribe.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+        return lambda: self.unsubscribe(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling a function. Unknown functions are ignored.
+
+        Args:
+            callback (function): A function passed to subscribe.
+        """
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+            if not self._subscribers:
+                self._held.clear()
+
+    def emit(self, event):
+        """
+        Hold an event until the next flush.
+
+        Args:
+            event: The event, such as a StudentAdded.
+        """
+        if self._subscribers:
+            self._held.append(event)
+
+    def flush(self):
+        """
+        Coalesce the held events and call every subscriber with the result, if anything is left.
+        """
+        if not self._held:
+            return
+        events = coalesce(self._held)
+        self._held = []
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if events:
+            for callback in subscribers:
+                callback(events)
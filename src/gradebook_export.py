@@ -0,0 +1,180 @@
+import csv
+import json
+import os
+
+from gradebook_records import LAST_ID_KEY
+
+EXPORT_FORMATS = ('json', 'jsonl', 'csv', 'csv-grades')
+COMPRESSIONS = {'.gz': 'gzip', '.xz': 'lzma', '.lzma': 'lzma'}
+EXTENSIONS = {'.json': 'json', '.jsonl': 'jsonl', '.csv': 'csv'}
+PROGRESS_EVERY = 1000
+
+
+def guess_export(path):
+    """
+    Work out the export format and compression from a file name.
+
+    Args:
+        path (str): The path to export to, such as 'grades.csv' or 'grades.jsonl.gz'.
+
+    Returns:
+        tuple: The format ('json', 'jsonl' or 'csv') and the compression ('gzip', 'lzma' or None).
+            Unknown extensions give 'json'.
+    """
+    root, extension = os.path.splitext(path.lower())
+    compression = COMPRESSIONS.get(extension)
+    if compression is not None:
+        root, extension = os.path.splitext(root)
+    return EXTENSIONS.get(extension, 'json'), compression
+
+
+def open_export(path, compression=None):
+    """
+    Open a text file for writing, compressing it if asked.
+
+    Args:
+        path (str): The path to write to.
+        compression (str): 'gzip', 'lzma' or None.
+
+    Returns:
+        file: The open file.
+    """
+    # The compression modules are imported on first use, since most grade books never compress.
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    if compression == 'lzma':
+        import lzma
+        return lzma.open(path, 'wt', encoding='utf-8', newline='')
+    if compression is None:
+        return open(path, 'w', encoding='utf-8', newline='')
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def write_students(records, f, format='json', progress=None, total=None):
+    """
+    Write student records to an open file one at a time.
+
+    Only one student is formatted at a time, so memory use does not grow with the grade book.
+
+    Formats:
+        json: The indented layout of gradebook.json, an object keyed by student ID.
+        jsonl: One compact JSON object per line.
+        csv: One row per student with ID, Name, Class, Grade Count, Final Grade and the grades
+            separated by semicolons.
+        csv-grades: One row per grade with ID, Name, Class and Grade. Students without grades get
+            a row with an empty grade.
+
+    Args:
+        records (iterable): The StudentRecord objects to write.
+        f (file): A text file open for writing.
+        format (str): One of EXPORT_FORMATS.
+        progress (function): Called as progress(written, total) every PROGRESS_EVERY students and
+            once at the end, or None.
+        total (int): The number of students expected, passed on to progress. May be None.
+
+    Returns:
+        int: The number of students written.
+    """
+    if format == 'json':
+        write = _json_writer(f)
+    elif format == 'jsonl':
+        def write(record):
+            f.write(json.dumps(record.to_dict()))
+            f.write('\n')
+    elif format == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(['ID', 'Name', 'Class', 'Grade Count', 'Final Grade', 'Grades'])
+
+        def write(record):
+            grades = record.grades
+            final_grade = sum(grades) / len(grades) if grades else ''
+            writer.writerow([record.id, record.name, record.class_name, len(grades), final_grade,
+                             ';'.join(repr(grade) for grade in grades)])
+    elif format == 'csv-grades':
+        writer = csv.writer(f)
+        writer.writerow(['ID', 'Name', 'Class', 'Grade'])
+
+        def write(record):
+            if not record.grades:
+                writer.writerow([record.id, record.name, record.class_name, ''])
+            writer.writerows([record.id, record.name, record.class_name, grade] for grade in record.grades)
+    else:
+        raise ValueError(f"Unknown export format: {format}")
+
+    written = 0
+    for record in records:
+        write(record)
+        written += 1
+        if progress is not None and written % PROGRESS_EVERY == 0:
+            progress(written, total)
+    if format == 'json':
+        f.write('\n}' if written else '}')
+    if progress is not None:
+        progress(written, total)
+    return written
+
+
+def _json_writer(f):
+    """
+    Make a function that writes records as members of an indented JSON object.
+
+    The output matches json.dump(students, f, indent=4) byte for byte. The caller writes the
+    closing brace.
+
+    Args:
+        f (file): A text file open for writing.
+
+    Returns:
+        function: Writes one record.
+    """
+    f.write('{')
+    separator = '\n    '
+
+    def write(record):
+        nonlocal separator
+        # Formatting the indented layout by hand is several times faster than json.dumps(indent=4),
+        # which falls back to the pure-Python encoder.
+        if record.grades:
+            grades = json.dumps(record.grades.tolist()).replace(', ', ',\n            ')
+            grades = f"[\n            {grades[1:-1]}\n        ]"
+        else:
+            grades = '[]'
+        entries = ''
+        if record.entries is not None and record.entries.ids:
+            ids = _indented(map(str, record.entries.ids))
+            if record.entries.assignments is None:
+                assignments = _indented(['null'] * len(record.entries))
+            else:
+                assignments = _indented(map(json.dumps, record.entries.assignments))
+            # json.dumps writes floats with float.__repr__ too, and infinities as Infinity;
+            # unknown timestamps are NaN.
+            timestamps = _indented(map(float.__repr__, record.entries.timestamps)).replace('nan', 'null').replace('inf', 'Infinity')
+            entries = (f",\n        \"Grade IDs\": {ids},\n"
+                       f"        \"Assignments\": {assignments},\n"
+                       f"        \"Timestamps\": {timestamps}")
+        elif record.entries is not None:
+            entries = ',\n        "Grade IDs": [],\n        "Assignments": [],\n        "Timestamps": []'
+        if record.entries is not None and record.entries.deleted_latest():
+            entries += f",\n        \"{LAST_ID_KEY}\": {record.entries.last_id}"
+        f.write(f"{separator}{json.dumps(record.id)}: {{\n"
+                f"        \"ID\": {json.dumps(record.id)},\n"
+                f"        \"Name\": {json.dumps(record.name)},\n"
+                f"        \"Class\": {json.dumps(record.class_name)},\n"
+                f"        \"Grades\": {grades}{entries}\n"
+                f"    }}")
+        separator = ',\n    '
+    return write
+
+
+def _indented(items):
+    """
+    Lay out JSON list items the way json.dump(indent=4) does for a list inside a student.
+
+    Args:
+        items (iterable): The items, already encoded as JSON. There must be at least one.
+
+    Returns:
+        str: The list.
+    """
+    return '[\n            ' + ',\n            '.join(items) + '\n        ]'
@@ -0,0 +1,225 @@
+import math
+from contextlib import nullcontext
+
+import PySimpleGUI as sg
+
+from gradebook_events import GradeAdded, GradeRemoved, StudentAdded, StudentDeleted
+
+CHANGED_EVENT = '-CHANGED-'
+PAGE_SIZE = 50
+TABLE_HEADINGS = ['ID', 'Name', 'Class', 'Grades', 'Final Grade']
+SORTABLE_COLUMNS = {'ID': 'ID', 'Name': 'Name', 'Class': 'Class', 'Grades': 'Final Grade', 'Final Grade': 'Final Grade'}
+
+
+class StudentPager:
+    """
+    Pages through the students of a grade book in a chosen order.
+
+    Only the students on the current page are looked up and formatted. The ordered list of IDs
+    is kept until the sort order changes. The pager subscribes to the grade book's events and
+    patches the list as students come and go; it is only rebuilt when a change can move students
+    around in the current order, such as a new grade while sorted by final grade.
+
+    Attributes:
+        gradebook (GradeBook): The grade book to page through.
+        page_size (int): The number of students per page.
+        page (int): The current page, counting from 0.
+        sort_by (str): The column the students are sorted by, or None for the order they were added.
+        reverse (bool): True if the sort order is descending.
+    """
+
+    def __init__(self, gradebook, page_size=PAGE_SIZE, on_change=None):
+        """
+        Initialize the pager on the first page.
+
+        Args:
+            gradebook (GradeBook): The grade book to page through.
+            page_size (int): The number of students per page.
+            on_change (function): Called with no arguments, on the thread that changed the grade
+                book, when a change may have altered the current page, or None.
+        """
+        self.gradebook = gradebook
+        self.page_size = page_size
+        self.page = 0
+        self.sort_by = None
+        self.reverse = False
+        self._ids = None
+        self._on_change = on_change
+        self._unsubscribe = gradebook.events.subscribe(self._follow)
+
+    def close(self):
+        """
+        Stop following changes to the grade book.
+        """
+        self._unsubscribe()
+
+    def _follow(self, events):
+        if self.changed(events) and self._on_change is not None:
+            self._on_change()
+
+    def changed(self, events):
+        """
+        Patch the order for changes to the grade book.
+
+        Args:
+            events (list): The events from the grade book.
+
+        Returns:
+            bool: True if the current page may look different now.
+        """
+        if self._ids is None:
+            return True
+        visible = set(self._ids[self.page * self.page_size:(self.page + 1) * self.page_size])
+        redraw = False
+        for event in events:
+            if isinstance(event, StudentAdded) and self.sort_by is None:
+                self._ids.append(event.student_id)
+                redraw = True
+            elif isinstance(event, StudentDeleted):
+                try:
+                    self._ids.remove(event.student_id)
+                except ValueError:
+                    pass
+                redraw = True
+            elif isinstance(event, (GradeAdded, GradeRemoved)) and self.sort_by != 'Final Grade':
+                redraw = redraw or event.student_id in visible
+            else:
+                self._ids = None
+                return True
+        return redraw
+
+    def _order(self):
+        """
+        Get the student IDs in the current sort order.
+
+        Returns:
+            list: The student IDs.
+        """
+        if self._ids is None:
+            self._ids = self.gradebook.student_ids(self.sort_by, self.reverse)
+        self.page = max(0, min(self.page, math.ceil(len(self._ids) / self.page_size) - 1))
+        return self._ids
+
+    def page_count(self):
+        """
+        Count the pages.
+
+        Returns:
+            int: The number of pages, at least 1.
+        """
+        return max(1, math.ceil(len(self._order()) / self.page_size))
+
+    def sort(self, column):
+        """
+        Sort by a column, or flip the order if it is already sorted by that column.
+
+        Args:
+            column (str): The table heading that was clicked.
+        """
+        sort_by = SORTABLE_COLUMNS.get(column)
+        if sort_by is None:
+            return
+        self.reverse = not self.reverse if sort_by == self.sort_by else False
+        self.sort_by = sort_by
+        self._ids = None
+        self.page = 0
+
+    def go_to(self, page):
+        """
+        Move to a page, staying within the first and last page.
+
+        Args:
+            page (int): The page to show, counting from 0.
+        """
+        self.page = max(0, min(page, self.page_count() - 1))
+
+    def rows(self):
+        """
+        Format the students on the current page as table rows.
+
+        Rows come from the grade book's report cache, so paging back to a page only formats the
+        students that changed since.
+
+        Returns:
+            list: One [ID, Name, Class, Grades, Final Grade] row per student.
+        """
+        start = self.page * self.page_size
+        rows = []
+        for student_id in self._order()[start:start + self.page_size]:
+            row = self.gradebook.reports.render(student_id, 'row')
+            if row is not None:
+                rows.append(list(row))
+        return rows
+
+    def status(self):
+        """
+        Describe the current page.
+
+        Returns:
+            str: The page number, page count and number of students.
+        """
+        return f"Page {self.page + 1} of {self.page_count()} ({len(self._order())} students)"
+
+
+def show_students_table(gradebook, page_size=PAGE_SIZE, lock=None):
+    """
+    Show every student in a paged table window with sortable columns and jump-to-page.
+
+    Clicking a column heading sorts by that column; clicking it again reverses the order.
+    Changes made while the window is open, such as by an import running in the background,
+    show up as they are saved; only the students on the current page are formatted again.
+
+    Args:
+        gradebook (GradeBook): The grade book to show.
+        page_size (int): The number of students per page.
+        lock (threading.RLock): Held while reading the grade book, if a background worker may change it.
+    """
+    lock = lock or nullcontext()
+    window = None
+
+    def refresh():
+        if window is not None:
+            window.write_event_value(CHANGED_EVENT, None)
+    with lock:
+        pager = StudentPager(gradebook, page_size, refresh)
+        rows, status = pager.rows(), pager.status()
+    layout = [
+        [sg.Table(values=rows, headings=TABLE_HEADINGS, key='-TABLE-', num_rows=page_size,
+                  auto_size_columns=False, col_widths=[10, 20, 10, 40, 10], justification='left',
+                  enable_click_events=True, expand_x=True, expand_y=True)],
+        [sg.Button('<< First'), sg.Button('< Prev'),
+         sg.Text(status, key='-PAGE-', size=(35, 1), justification='center'),
+         sg.Button('Next >'), sg.Button('Last >>')],
+        [sg.Text('Go to page'), sg.InputText(key='-JUMP-', size=(8, 1)), sg.Button('Go'), sg.Button('Close')],
+    ]
+    window = sg.Window('All Students', layout, modal=True, resizable=True, finalize=True)
+
+    while True:
+        event, values = window.read()
+        if event in (sg.WINDOW_CLOSED, 'Close'):
+            with lock:
+                pager.close()
+            break
+        with lock:
+            if isinstance(event, tuple) and event[0] == '-TABLE-':
+                row, column = event[2]
+                if row == -1 and column is not None and column >= 0:
+                    pager.sort(TABLE_HEADINGS[column])
+            elif event == '<< First':
+                pager.go_to(0)
+            elif event == '< Prev':
+                pager.go_to(pager.page - 1)
+            elif event == 'Next >':
+                pager.go_to(pager.page + 1)
+            elif event == 'Last >>':
+                pager.go_to(pager.page_count() - 1)
+            elif event == 'Go':
+                try:
+                    pager.go_to(int(values['-JUMP-']) - 1)
+                except ValueError:
+                    pass
+            rows, status = pager.rows(), pager.status()
+        window['-TABLE-'].update(values=rows)
+        window['-PAGE-'].update(status)
+
+    window.close()
@@ -0,0 +1,320 @@
+import argparse
+import csv
+import gzip
+import json
+import lzma
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from gradebook_export import COMPRESSIONS, guess_export
+
+CHUNK_SIZE = 10000
+
+
+def open_import(path):
+    """
+    Open a text file for reading, decompressing it if its extension says so.
+
+    Args:
+        path (str): The path to read, such as 'roster.csv' or 'grades.jsonl.gz'.
+
+    Returns:
+        file: The open file.
+    """
+    compression = COMPRESSIONS.get(os.path.splitext(path.lower())[1])
+    if compression == 'gzip':
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    if compression == 'lzma':
+        return lzma.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def read_chunks(f, format, chunk_size=CHUNK_SIZE):
+    """
+    Split a CSV or JSON Lines file into chunks of raw lines without parsing them.
+
+    CSV chunks are only cut between records, so a quoted field that spans lines stays whole.
+
+    Args:
+        f (file): The open file. For CSV, the header line must already have been read.
+        format (str): 'csv' or 'jsonl'.
+        chunk_size (int): The number of lines per chunk.
+
+    Yields:
+        tuple: The line number of the first line and the list of lines.
+    """
+    line_number = 2 if format == 'csv' else 1
+    while True:
+        lines = list(islice(f, chunk_size))
+        if not lines:
+            return
+        if format == 'csv':
+            # An odd number of quotes in a chunk means it ends inside a quoted field.
+            quotes = sum(line.count('"') for line in lines)
+            while quotes % 2:
+                line = f.readline()
+                if not line:
+                    break
+                lines.append(line)
+                quotes += line.count('"')
+        yield line_number, lines
+        line_number += len(lines)
+
+
+def parse_chunk(format, columns, line_number, lines):
+    """
+    Parse and check one chunk of rows. This runs in a worker process.
+
+    A row may describe a student (ID, Name and Class), a grade (ID and Grade), or both. Grades can
+    also be given as a list ('Grades' in JSON Lines) or separated by semicolons ('Grades' in CSV),
+    as written by the exporter. Column names are matched ignoring case.
+
+    Args:
+        format (str): 'csv' or 'jsonl'.
+        columns (list): The CSV header, or None for JSON Lines.
+        line_number (int): The line number of the first line.
+        lines (list): The raw lines.
+
+    Returns:
+        tuple: A list of (line number, ID, name, class, grades) rows, with None for a missing name
+            or class, and a list of (line number, message) errors.
+    """
+    rows = []
+    errors = []
+    if format == 'csv':
+        records = _csv_records(columns, line_number, lines)
+    else:
+        records = _json_records(line_number, lines, errors)
+    for position, row in records:
+        try:
+            rows.append((position,) + _check_row(row, format))
+        except ValueError as error:
+            errors.append((position, str(error)))
+    return rows, errors
+
+
+def _csv_records(columns, line_number, lines):
+    """
+    Decode CSV lines, skipping blank ones.
+
+    Args:
+        columns (list): The CSV header.
+        line_number (int): The line number of the first line.
+        lines (list): The raw lines.
+
+    Yields:
+        tuple: The line number where the row starts and the row, keyed by case-folded column name.
+    """
+    keys = [column.strip().casefold() for column in columns]
+    reader = csv.reader(lines)
+    start = 0
+    for values in reader:
+        if values:
+            yield line_number + start, dict(zip(keys, values))
+        start = reader.line_num
+
+
+def _json_records(line_number, lines, errors):
+    """
+    Decode JSON Lines, recording lines that are not JSON objects as errors.
+
+    Args:
+        line_number (int): The line number of the first line.
+        lines (list): The raw lines.
+        errors (list): The list to add errors to.
+
+    Yields:
+        tuple: The line number and the object, with keys case-folded.
+    """
+    for position, line in enumerate(lines, line_number):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            errors.append((position, f"invalid JSON: {error}"))
+            continue
+        if not isinstance(row, dict):
+            errors.append((position, 'expected a JSON object'))
+            continue
+        yield position, {str(key).casefold(): value for key, value in row.items()}
+
+
+def _check_row(row, format):
+    """
+    Check one row and pull out its fields.
+
+    Args:
+        row (dict): The row, keyed by case-folded column name.
+        format (str): 'csv' or 'jsonl'.
+
+    Returns:
+        tuple: The ID, name, class and a tuple of grades.
+
+    Raises:
+        ValueError: If the row is missing an ID, has only one of name and class, has no student
+            information and no grades, or has a grade that is not a finite number.
+    """
+    student_id = row.get('id')
+    if isinstance(student_id, (int, float)) and not isinstance(student_id, bool):
+        student_id = str(student_id)
+    if not isinstance(student_id, str) or not student_id.strip():
+        raise ValueError('missing ID')
+    name = row.get('name') or None
+    class_name = row.get('class') or None
+    if (name is None) != (class_name is None):
+        raise ValueError('Name and Class must be given together')
+    if name is not None and not (isinstance(name, str) and isinstance(class_name, str)):
+        raise ValueError('Name and Class must be text')
+    raw = []
+    if row.get('grade') not in (None, ''):
+        raw.append(row['grade'])
+    grades = row.get('grades')
+    if isinstance(grades, list):
+        raw.extend(grades)
+    elif isinstance(grades, str) and grades.strip():
+        raw.extend(grades.split(';'))
+    elif grades not in (None, ''):
+        raise ValueError(f"invalid grades {grades!r}")
+    checked = []
+    for grade in raw:
+        try:
+            if isinstance(grade, bool):
+                raise ValueError
+            value = float(grade)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid grade {grade!r}") from None
+        if not math.isfinite(value):
+            raise ValueError(f"invalid grade {grade!r}")
+        checked.append(value)
+    if name is None and not checked:
+        raise ValueError('row has neither student information nor a grade')
+    return student_id, name, class_name, tuple(checked)
+
+
+def import_file(gradebook, path, workers=None, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Import students and grades from a CSV or JSON Lines file, optionally gzip- or lzma-compressed.
+
+    The file is read in chunks that are parsed and checked in a pool of worker processes, a few
+    chunks ahead of the one being applied, so memory stays bounded. Rows that fail are recorded
+    and skipped without stopping the import. Everything else is applied to the grade book in one
+    batch, which is persisted once at the end.
+
+    A row that names a student already in the grade book (or earlier in the file) with the same
+    Name and Class only adds its grades; a different Name or Class is an error. A grade for a
+    student that does not exist is an error.
+
+    Args:
+        gradebook (GradeBook): The grade book to import into.
+        path (str): The file to import. The extension picks the format: .csv or .jsonl, optionally
+            followed by .gz or .xz.
+        workers (int): The number of worker processes. Defaults to the number of CPUs; 1 parses in
+            this process.
+        chunk_size (int): The number of lines per chunk.
+        progress (function): Called as progress(rows, errors) after each chunk is applied, or None.
+
+    Returns:
+        dict: The number of 'rows' read, 'students' added and 'grades' added, and the 'errors' as a
+            list of (line number, message) pairs in file order.
+    """
+    format, _ = guess_export(path)
+    if format not in ('csv', 'jsonl'):
+        raise ValueError(f"Cannot import {path}: expected a .csv or .jsonl file")
+    workers = workers or os.cpu_count() or 1
+    result = {'rows': 0, 'students': 0, 'grades': 0, 'errors': []}
+    with open_import(path) as f:
+        columns = next(csv.reader([f.readline()]), []) if format == 'csv' else None
+        if columns is not None and 'id' not in [column.strip().casefold() for column in columns]:
+            raise ValueError(f"Cannot import {path}: the header has no ID column")
+        chunks = read_chunks(f, format, chunk_size)
+        with gradebook.batch():
+            if workers == 1:
+                for line_number, lines in chunks:
+                    _apply_chunk(gradebook, parse_chunk(format, columns, line_number, lines), result, progress)
+            else:
+                with ProcessPoolExecutor(workers) as executor:
+                    running = deque()
+                    for line_number, lines in chunks:
+                        running.append(executor.submit(parse_chunk, format, columns, line_number, lines))
+                        if len(running) >= workers * 2:
+                            _apply_chunk(gradebook, running.popleft().result(), result, progress)
+                    while running:
+                        _apply_chunk(gradebook, running.popleft().result(), result, progress)
+    result['errors'].sort()
+    return result
+
+
+def _apply_chunk(gradebook, parsed, result, progress):
+    """
+    Apply the rows of a parsed chunk to the grade book.
+
+    Args:
+        gradebook (GradeBook): The grade book, inside a batch.
+        parsed (tuple): The rows and errors returned by parse_chunk.
+        result (dict): The running totals, updated in place.
+        progress (function): Called as progress(rows, errors), or None.
+    """
+    rows, errors = parsed
+    result['errors'].extend(errors)
+    students = gradebook.students
+    for line_number, student_id, name, class_name, grades in rows:
+        student = students.get(student_id)
+        if name is not None:
+            if student is None:
+                gradebook.add_student({'ID': student_id, 'Name': name, 'Class': class_name})
+                result['students'] += 1
+            elif student['Name'] != name or student['Class'] != class_name:
+                result['errors'].append((line_number, f"student with ID {student_id} already exists with a different Name or Class"))
+                continue
+        elif student is None:
+            result['errors'].append((line_number, f"student with ID {student_id} does not exist"))
+            continue
+        for grade in grades:
+            gradebook.add_grade(student_id, grade)
+        result['grades'] += len(grades)
+    result['rows'] += len(rows) + len(errors)
+    if progress is not None:
+        progress(result['rows'], len(result['errors']))
+
+
+def main(argv=None):
+    """
+    Import a roster or gradesheet from the command line.
+
+    Args:
+        argv (list): The arguments, or None to use sys.argv.
+
+    Returns:
+        int: The exit status: 0 if every row was imported, 1 if some rows failed.
+    """
+    parser = argparse.ArgumentParser(description='Import students and grades from CSV or JSON Lines into a grade book.')
+    parser.add_argument('gradebook', help='the grade book file (JSON, binary snapshot or SQLite)')
+    parser.add_argument('source', help='the .csv or .jsonl file to import, optionally ending in .gz or .xz')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='lines per chunk')
+    parser.add_argument('--max-errors', type=int, default=20, help='the most row errors to print')
+    args = parser.parse_args(argv)
+
+    # Imported here so worker processes do not load the grade book modules.
+    from gradebook import GradeBook
+    gradebook = GradeBook(args.gradebook)
+    try:
+        result = import_file(gradebook, args.source, args.workers, args.chunk_size,
+                             lambda rows, errors: print(f"\r{rows} rows read, {errors} errors", end='', flush=True))
+    finally:
+        gradebook.close()
+    print()
+    for line_number, message in result['errors'][:args.max_errors]:
+        print(f"Line {line_number}: {message}")
+    if len(result['errors']) > args.max_errors:
+        print(f"... and {len(result['errors']) - args.max_errors} more errors")
+    print(f"Added {result['students']} students and {result['grades']} grades from {result['rows']} rows.")
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,106 @@
+from bisect import bisect_left, insort
+
+
+class StudentIndex:
+    """
+    Secondary indexes over student records: a hash index on class and a sorted index on name.
+
+    Names are compared case-folded, so prefix searches ignore case. The sorted name index holds
+    (folded name, student ID) pairs, which keeps students with the same name apart.
+    """
+
+    def __init__(self, students=()):
+        """
+        Initialize the indexes.
+
+        Args:
+            students (iterable): The StudentRecord objects to index.
+        """
+        self._by_class = {}
+        self._by_name = []
+        for student in students:
+            self._by_class.setdefault(student.class_name, {})[student.id] = None
+            self._by_name.append((student.name.casefold(), student.id))
+        self._by_name.sort()
+
+    def add(self, student):
+        """
+        Index a student that was added.
+
+        Args:
+            student (StudentRecord): The student.
+        """
+        self._by_class.setdefault(student.class_name, {})[student.id] = None
+        insort(self._by_name, (student.name.casefold(), student.id))
+
+    def remove(self, student):
+        """
+        Drop a student that was removed.
+
+        Args:
+            student (StudentRecord): The student.
+        """
+        members = self._by_class[student.class_name]
+        del members[student.id]
+        if not members:
+            del self._by_class[student.class_name]
+        key = (student.name.casefold(), student.id)
+        position = bisect_left(self._by_name, key)
+        if position < len(self._by_name) and self._by_name[position] == key:
+            del self._by_name[position]
+
+    def by_class(self, class_name, limit=None):
+        """
+        List the students in a class, in the order they were indexed.
+
+        Args:
+            class_name (str): The class.
+            limit (int): The most IDs to return, or None for all of them.
+
+        Returns:
+            list: The student IDs.
+        """
+        members = self._by_class.get(class_name, {})
+        if limit is None:
+            return list(members)
+        return [student_id for student_id, _ in zip(members, range(limit))]
+
+    def by_name_prefix(self, prefix, limit=None):
+        """
+        List the students whose name starts with a prefix, ignoring case, in name order.
+
+        Args:
+            prefix (str): The start of the name.
+            limit (int): The most IDs to return, or None for all of them.
+
+        Returns:
+            list: The student IDs.
+        """
+        prefix = prefix.casefold()
+        found = []
+        position = bisect_left(self._by_name, (prefix,))
+        while position < len(self._by_name) and (limit is None or len(found) < limit):
+            name, student_id = self._by_name[position]
+            if not name.startswith(prefix):
+                break
+            found.append(student_id)
+            position += 1
+        return found
+
+    def class_names(self):
+        """
+        List the classes that have students, in sorted order.
+
+        Returns:
+            list: The class names.
+        """
+        return sorted(self._by_class, key=str)
+
+    def names(self):
+        """
+        List every student in name order.
+
+        Returns:
+            list: The student IDs.
+        """
+        return [student_id for _, student_id in self._by_name]
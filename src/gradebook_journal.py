@@ -0,0 +1,158 @@
+import json
+import os
+
+
+def snapshot_signature(path):
+    """
+    Describe the current state of a snapshot file.
+
+    Args:
+        path (str): The path to the snapshot file.
+
+    Returns:
+        list: The [size, mtime_ns] of the file, or None if the file does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+class Journal:
+    """
+    An append-only log of grade book mutations, one JSON record per line.
+
+    The first line of the log names the snapshot it was started against. Once the snapshot
+    is rewritten the header no longer matches, so a log that was already folded into the
+    snapshot is never replayed twice.
+
+    By default every append is fsynced before it returns, so records survive a power loss as
+    well as a crash of the process.
+
+    Attributes:
+        path (str): The path to the journal file.
+        size (int): The number of bytes currently in the journal.
+        durable (bool): Whether appends and resets are fsynced.
+    """
+
+    def __init__(self, path, durable=True):
+        """
+        Initialize the journal.
+
+        Args:
+            path (str): The path to the journal file.
+            durable (bool): Fsync every append and reset. Without it records are only flushed to
+                the operating system, which is faster but can lose the latest ones on power loss.
+        """
+        self.path = path
+        self.durable = durable
+        self.size = 0
+        self._file = None
+
+    def replay(self, snapshot_path):
+        """
+        Read back the records logged since the snapshot was last written.
+
+        A partially written last line (from a crash mid-append) is dropped and trimmed off the file.
+
+        Args:
+            snapshot_path (str): The path to the snapshot the journal belongs to.
+
+        Returns:
+            list: The mutation records in the order they were logged.
+        """
+        self.close()
+        records = []
+        if not os.path.exists(self.path):
+            self.size = 0
+            return records
+        valid_end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                records.append(record)
+                valid_end += len(line)
+        if valid_end != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+        self.size = valid_end
+        if not records or records[0].get('op') != 'snapshot':
+            return records
+        header = records.pop(0)
+        if header.get('signature') != snapshot_signature(snapshot_path):
+            # The snapshot was rewritten after this log was started, so it already holds these changes.
+            self.reset(snapshot_path)
+            return []
+        return records
+
+    def tail(self):
+        """
+        Read the records other processes appended since this journal was last read or written.
+
+        Returns:
+            list: The new mutation records, or None if the journal shrank or was restarted, in
+                which case it has to be replayed from the beginning.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return None if self.size else []
+        if size < self.size or self.size == 0:
+            return None if size != self.size else []
+        records = []
+        with open(self.path, 'rb') as f:
+            f.seek(self.size)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                record = json.loads(line)
+                if record.get('op') == 'snapshot':
+                    return None
+                records.append(record)
+                self.size += len(line)
+        return records
+
+    def append(self, records):
+        """
+        Append mutation records to the end of the journal.
+
+        Args:
+            records (list): The mutation records to write.
+        """
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        data = ''.join(json.dumps(record) + '\n' for record in records)
+        self._file.write(data)
+        self._file.flush()
+        if self.durable:
+            os.fsync(self._file.fileno())
+        self.size += len(data.encode('utf-8'))
+
+    def reset(self, snapshot_path):
+        """
+        Empty the journal and start it against the current snapshot.
+
+        Args:
+            snapshot_path (str): The path to the snapshot that now holds every change.
+        """
+        self.close()
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'op': 'snapshot', 'signature': snapshot_signature(snapshot_path)}) + '\n')
+            if self.durable:
+                f.flush()
+                os.fsync(f.fileno())
+        self.size = os.path.getsize(self.path)
+
+    def close(self):
+        """
+        Close the journal file if it is open.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
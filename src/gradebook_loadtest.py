@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+
+async def request(reader, writer, method, path, payload=None):
+    """
+    Send one request on a keep-alive connection and read the response.
+
+    Args:
+        reader (asyncio.StreamReader): The connection input.
+        writer (asyncio.StreamWriter): The connection output.
+        method (str): The HTTP method.
+        path (str): The URL path and query.
+        payload: The JSON body, or None.
+
+    Returns:
+        tuple: The status code and the raw response body.
+    """
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                  f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode('latin-1') + body)
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def seed(host, port, student_ids):
+    """
+    Add students on one connection.
+
+    Args:
+        host (str): The server address.
+        port (int): The server port.
+        student_ids (list): The IDs of the students to add.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for student_id in student_ids:
+            number = int(student_id.rsplit('-', 1)[1])
+            await request(reader, writer, 'POST', '/students', {'ID': student_id, 'Name': f"Student {number}", 'Class': f"Class {number % 20}"})
+    finally:
+        writer.close()
+
+
+async def client(host, port, student_ids, write_ratio, deadline, latencies, errors):
+    """
+    Send a mix of reads and writes on one connection until the deadline.
+
+    Args:
+        host (str): The server address.
+        port (int): The server port.
+        student_ids (list): The IDs to read and write.
+        write_ratio (float): The share of requests that add a grade.
+        deadline (float): The time.perf_counter() value to stop at.
+        latencies (dict): Lists of seconds per request, keyed by 'read' and 'write'.
+        errors (list): Unexpected status codes are added here.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            student_id = random.choice(student_ids)
+            if random.random() < write_ratio:
+                kind, call = 'write', ('POST', f"/students/{student_id}/grades", {'grade': random.randint(50, 100)})
+            else:
+                path = random.choice((f"/students/{student_id}", f"/students/{student_id}/final-grade",
+                                      f"/search?q={student_id[:3]}&limit=10"))
+                kind, call = 'read', ('GET', path, None)
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, *call)
+            latencies[kind].append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def percentile(values, fraction):
+    """
+    Get a percentile of a list of values.
+
+    Args:
+        values (list): The values.
+        fraction (float): The percentile as a fraction, such as 0.99.
+
+    Returns:
+        float: The value, or None if there are none.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def load_test(host, port, clients, duration, write_ratio, students):
+    """
+    Seed students, then run concurrent clients against a server and summarize the results.
+
+    Args:
+        host (str): The server address.
+        port (int): The server port.
+        clients (int): The number of concurrent connections.
+        duration (float): The seconds to run for.
+        write_ratio (float): The share of requests that add a grade.
+        students (int): The number of students to seed.
+
+    Returns:
+        dict: Requests, requests per second, errors, and p50/p99 latency in milliseconds for reads and writes.
+    """
+    student_ids = [f"load-{number:06d}" for number in range(students)]
+    await asyncio.gather(*(seed(host, port, student_ids[start::clients]) for start in range(clients)))
+
+    latencies = {'read': [], 'write': []}
+    errors = []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(client(host, port, student_ids, write_ratio, deadline, latencies, errors) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    total = len(latencies['read']) + len(latencies['write'])
+    result = {'clients': clients, 'seconds': round(elapsed, 2), 'requests': total,
+              'requests_per_second': round(total / elapsed, 1), 'errors': len(errors)}
+    for kind, values in latencies.items():
+        result[kind] = {'requests': len(values),
+                        'p50_ms': None if not values else round(percentile(values, 0.5) * 1000, 2),
+                        'p99_ms': None if not values else round(percentile(values, 0.99) * 1000, 2)}
+    return result
+
+
+def main(argv=None):
+    """
+    Run the load test from the command line.
+
+    Without --port a server is started on a temporary grade book and stopped afterwards.
+
+    Args:
+        argv (list): The arguments, or None to use sys.argv.
+    """
+    parser = argparse.ArgumentParser(description='Measure requests per second against a grade book server.')
+    parser.add_argument('--host', default='127.0.0.1', help='the server address')
+    parser.add_argument('--port', type=int, help='the server port (default: start a server on a temporary grade book)')
+    parser.add_argument('--clients', type=int, default=50, help='concurrent connections')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run for')
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='share of requests that add a grade')
+    parser.add_argument('--students', type=int, default=1000, help='students to seed before the run')
+    parser.add_argument('--journal', action='store_true', help='start the temporary server in journal mode')
+    args = parser.parse_args(argv)
+
+    server = None
+    port = args.port
+    if port is None:
+        directory = tempfile.mkdtemp()
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gradebook_server.py'),
+                   os.path.join(directory, 'loadtest.json'), '--host', args.host, '--port', '0']
+        if args.journal:
+            command.append('--journal')
+        server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        port = int(server.stdout.readline().rsplit(':', 1)[1])
+    try:
+        result = asyncio.run(load_test(args.host, port, args.clients, args.duration, args.write_ratio, args.students))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == '__main__':
+    main()
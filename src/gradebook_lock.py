@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+GENERATION_WIDTH = 20
+
+
+class FileLock:
+    """
+    An advisory lock shared between processes, held on a small file next to the data file.
+
+    fcntl.flock is used where it exists; on Windows, msvcrt.locking locks the first byte of the
+    lock file instead. Within a process the lock belongs to one thread at a time, through a
+    threading.RLock, and is reentrant for that thread, so storage methods that take it can call
+    each other; the file is only locked on the owning thread's outermost acquire. The lock file
+    stays open between uses, so taking a free lock costs one system call.
+
+    The lock file also holds a generation counter that every writer bumps while it holds the lock.
+    A process that remembers the generation it last saw can tell whether anyone has written since,
+    even on file systems whose timestamps are too coarse to show it.
+
+    Attributes:
+        path (str): The path to the lock file.
+        timeout (float): The most seconds to wait for the lock, or None to wait as long as it takes.
+    """
+
+    def __init__(self, path, timeout=None):
+        """
+        Initialize the lock without taking it.
+
+        Args:
+            path (str): The path to the lock file.
+            timeout (float): The most seconds to wait for the lock, or None to wait as long as it takes.
+        """
+        self.path = path
+        self.timeout = timeout
+        self._file = None
+        self._depth = 0
+        self._owner = None
+        self._thread_lock = threading.RLock()
+
+    def acquire(self):
+        """
+        Take the lock, waiting for other threads and processes to release it.
+
+        Raises:
+            TimeoutError: If the lock is still held by another thread or process after timeout seconds.
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        if not self._thread_lock.acquire(timeout=-1 if deadline is None else self.timeout):
+            raise TimeoutError(f"Timed out waiting for the lock on {self.path}")
+        if self._depth:
+            self._depth += 1
+            return
+        try:
+            if self._file is None:
+                self._file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT), 'r+b')
+            while not self._try_lock(self._file, blocking=deadline is None):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for the lock on {self.path}")
+                time.sleep(0.05)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._depth = 1
+        self._owner = threading.get_ident()
+
+    def release(self):
+        """
+        Release the lock once every acquire on this thread has been matched. Threads that do not
+        hold the lock release nothing.
+        """
+        if self._depth == 0 or self._owner != threading.get_ident():
+            return
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                self._owner = None
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._thread_lock.release()
+
+    def close(self):
+        """
+        Close the lock file, unless the lock is held.
+        """
+        if not self._thread_lock.acquire(blocking=False):
+            return
+        try:
+            if self._depth == 0 and self._file is not None:
+                self._file.close()
+                self._file = None
+        finally:
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def generation(self):
+        """
+        Read the generation counter. The lock must be held.
+
+        Returns:
+            int: The number of writes recorded so far, 0 for a new lock file.
+        """
+        self._file.seek(0)
+        data = self._file.read(GENERATION_WIDTH)
+        try:
+            return int(data)
+        except ValueError:
+            return 0
+
+    def bump(self):
+        """
+        Record a write by incrementing the generation counter. The lock must be held.
+
+        Returns:
+            int: The new generation.
+        """
+        generation = self.generation() + 1
+        # A fixed-width counter is overwritten in place, without truncating the file.
+        self._file.seek(0)
+        self._file.write(str(generation).zfill(GENERATION_WIDTH).encode('ascii'))
+        self._file.flush()
+        return generation
+
+    @staticmethod
+    def _try_lock(f, blocking):
+        """
+        Try to lock an open lock file.
+
+        Args:
+            f (file): The lock file.
+            blocking (bool): Wait until the lock is free instead of giving up at once.
+
+        Returns:
+            bool: True if the lock was taken.
+        """
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            return True
+        # msvcrt has no indefinitely blocking lock, so a blocking wait polls too.
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.05)
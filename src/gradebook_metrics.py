@@ -0,0 +1,345 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+
+# Upper bounds of the latency histogram buckets, in seconds. Slower calls land in a last, open bucket.
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _bucket_label(bound):
+    """
+    Name a histogram bucket by its upper bound.
+
+    Args:
+        bound (float): The upper bound in seconds, or None for the open last bucket.
+
+    Returns:
+        str: A label such as '<=0.5ms' or '>5s'.
+    """
+    if bound is None:
+        return f">{LATENCY_BUCKETS[-1]:g}s"
+    if bound < 1:
+        return f"<={bound * 1000:g}ms"
+    return f"<={bound:g}s"
+
+
+BUCKET_LABELS = tuple(_bucket_label(bound) for bound in LATENCY_BUCKETS + (None,))
+
+
+class Metrics:
+    """
+    Call counts, latency histograms and counters for an instrumented grade book.
+
+    Nothing is measured until methods are wrapped with instrument(), and unwrapping them with
+    uninstrument() restores the original methods, so a grade book without metrics pays nothing.
+    Recording takes a lock, since a GUI or server may read a snapshot while a worker thread writes.
+
+    Attributes:
+        started (float): The time.time() at which collection started or was last reset.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty metrics.
+        """
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._counters = {}
+        self._wrapped = []
+        self._dump_stop = None
+        self._dump_thread = None
+
+    def record(self, name, seconds, failed=False):
+        """
+        Record one timed call.
+
+        Args:
+            name (str): The operation, such as 'gradebook.add_grade'.
+            seconds (float): How long the call took.
+            failed (bool): Whether the call raised.
+        """
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                # calls, errors, total seconds, slowest seconds, bucket counts
+                timing = self._timings[name] = [0, 0, 0.0, 0.0, [0] * len(BUCKET_LABELS)]
+            timing[0] += 1
+            if failed:
+                timing[1] += 1
+            timing[2] += seconds
+            if seconds > timing[3]:
+                timing[3] = seconds
+            timing[4][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def count(self, name, amount=1):
+        """
+        Add to a counter.
+
+        Args:
+            name (str): The counter, such as 'storage.bytes_written'.
+            amount (int): The amount to add.
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Time a block of code as one call of an operation.
+
+        Args:
+            name (str): The operation.
+        """
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.record(name, time.perf_counter() - start, failed)
+
+    def wrap(self, name, function):
+        """
+        Make a version of a function that records every call.
+
+        Args:
+            name (str): The operation the calls are recorded as.
+            function (function): The function to time.
+
+        Returns:
+            function: The timed function.
+        """
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self.record(name, time.perf_counter() - start, failed)
+        return timed
+
+    def instrument(self, target, prefix, names, wrapper=None):
+        """
+        Time methods of one object by setting timed versions on the instance, in front of the class methods.
+
+        Args:
+            target: The object.
+            prefix (str): Put before each method name to name its operation, such as 'gradebook.'.
+            names (iterable): The methods to time.
+            wrapper (function): Called as wrapper(name, method) to make the timed version. Defaults to wrap.
+        """
+        wrapper = wrapper or self.wrap
+        for name in names:
+            setattr(target, name, wrapper(prefix + name, getattr(target, name)))
+            self._wrapped.append((target, name))
+
+    def uninstrument(self):
+        """
+        Remove every timed method set by instrument, so the class methods are used again.
+        """
+        for target, name in reversed(self._wrapped):
+            target.__dict__.pop(name, None)
+        self._wrapped = []
+
+    def reset(self):
+        """
+        Forget everything recorded so far.
+        """
+        with self._lock:
+            self._timings = {}
+            self._counters = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        """
+        Get a copy of everything recorded so far.
+
+        Returns:
+            dict: 'started' (ISO time), 'uptime_seconds', 'counters' keyed by name, and 'operations'
+                keyed by name, each with 'calls', 'errors', 'total_ms', 'mean_ms', 'max_ms' and a
+                'histogram' of call counts keyed by bucket label.
+        """
+        with self._lock:
+            timings = {name: (calls, errors, total, slowest, list(buckets))
+                       for name, (calls, errors, total, slowest, buckets) in self._timings.items()}
+            counters = dict(self._counters)
+            started = self.started
+        operations = {}
+        for name in sorted(timings):
+            calls, errors, total, slowest, buckets = timings[name]
+            operations[name] = {
+                'calls': calls,
+                'errors': errors,
+                'total_ms': round(total * 1000, 3),
+                'mean_ms': round(total * 1000 / calls, 4),
+                'max_ms': round(slowest * 1000, 4),
+                'histogram': {label: bucket for label, bucket in zip(BUCKET_LABELS, buckets) if bucket},
+            }
+        return {
+            'started': datetime.fromtimestamp(started, timezone.utc).isoformat(timespec='seconds'),
+            'uptime_seconds': round(time.time() - started, 3),
+            'counters': dict(sorted(counters.items())),
+            'operations': operations,
+        }
+
+    def dump(self, path):
+        """
+        Write a snapshot to a JSON file, replacing it in one step so readers never see half a file.
+
+        Args:
+            path (str): The file to write.
+        """
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=4)
+        os.replace(temp_path, path)
+
+    def start_dumps(self, path, interval=60.0):
+        """
+        Dump a snapshot to a file every interval seconds on a background thread, and once more when stopped.
+
+        Args:
+            path (str): The file to write.
+            interval (float): The seconds between dumps.
+        """
+        self.stop_dumps()
+        stop = self._dump_stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.dump(path)
+            self.dump(path)
+        self._dump_thread = threading.Thread(target=run, name='gradebook-metrics', daemon=True)
+        self._dump_thread.start()
+
+    def stop_dumps(self):
+        """
+        Stop periodic dumps, after writing a final one.
+        """
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            self._dump_thread = None
+            self._dump_stop = None
+
+
+def stored_bytes(storage):
+    """
+    Get the size of the files a storage keeps its data in, as listed by its stored_files method:
+    the data file and any journal or SQLite write-ahead log, or the manifest and shards of a sharded storage.
+
+    Args:
+        storage (Storage): The storage.
+
+    Returns:
+        int: The total size in bytes.
+    """
+    total = 0
+    for path in storage.stored_files():
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def instrument_storage(storage, metrics):
+    """
+    Time the persistence path of a storage and count the bytes it reads and writes.
+
+    load, write, save and compact are timed as 'storage.<method>', and the lock and journal
+    operations as 'lock.acquire' and 'journal.<method>'. The counters are:
+
+        storage.bytes_read: The bytes read from the stored files, as the storage reads them: whole
+            JSON files and journals, the header of a binary snapshot, and the manifest, ID lists
+            and shards of a sharded storage. Reads SQLite makes itself are not counted.
+        storage.bytes_written: The growth of the stored files for appends, or their whole size
+            after a save or compaction rewrote them.
+        storage.saves: The number of times every student was written out.
+
+    Args:
+        storage (Storage): The storage.
+        metrics (Metrics): Where the measurements go.
+    """
+    calls = {'depth': 0, 'rewrote': False}
+
+    def wrapper(name, method):
+        timed = metrics.wrap(name, method)
+        operation = name.rsplit('.', 1)[1]
+
+        @wraps(method)
+        def measured(*args, **kwargs):
+            # Only the outermost call counts bytes, since write may call save.
+            outermost = calls['depth'] == 0
+            if outermost:
+                calls['rewrote'] = False
+                before = stored_bytes(storage)
+            if operation in ('save', 'compact'):
+                calls['rewrote'] = True
+                if operation == 'save':
+                    metrics.count('storage.saves')
+            calls['depth'] += 1
+            try:
+                return timed(*args, **kwargs)
+            finally:
+                calls['depth'] -= 1
+                if outermost and operation != 'load':
+                    after = stored_bytes(storage)
+                    if calls['rewrote']:
+                        metrics.count('storage.bytes_written', after)
+                    elif after > before:
+                        metrics.count('storage.bytes_written', after - before)
+        return measured
+
+    def counter(name, method):
+        # The storage reports its reads through _read, which otherwise does nothing.
+        def read(size):
+            metrics.count('storage.bytes_read', size)
+        return read
+
+    metrics.instrument(storage, 'storage.', ('load', 'write', 'save', 'compact'), wrapper)
+    metrics.instrument(storage, 'storage.', ('_read',), counter)
+    lock = storage.lock()
+    if hasattr(lock, 'acquire'):
+        metrics.instrument(lock, 'lock.', ('acquire',))
+    journal = getattr(storage, 'journal', None)
+    if journal is not None:
+        metrics.instrument(journal, 'journal.', ('append', 'replay', 'tail'))
+
+
+def format_metrics(snapshot):
+    """
+    Lay out a metrics snapshot as a text table.
+
+    Args:
+        snapshot (dict): A snapshot from Metrics.snapshot.
+
+    Returns:
+        str: One line per operation with its call count, errors, mean, slowest and total time,
+            followed by the counters and any report cache statistics.
+    """
+    lines = [f"Collecting since {snapshot['started']} ({snapshot['uptime_seconds']:.0f} s)", '',
+             f"{'Operation':<36}{'Calls':>9}{'Errors':>8}{'Mean ms':>11}{'Max ms':>11}{'Total ms':>13}"]
+    for name, timing in snapshot['operations'].items():
+        lines.append(f"{name:<36}{timing['calls']:>9}{timing['errors']:>8}{timing['mean_ms']:>11.3f}"
+                     f"{timing['max_ms']:>11.3f}{timing['total_ms']:>13.1f}")
+    if snapshot['counters']:
+        lines.append('')
+        for name, value in snapshot['counters'].items():
+            lines.append(f"{name:<36}{value:>9}")
+    reports = snapshot.get('reports')
+    if reports:
+        lines.append('')
+        lines.append(f"Report cache: {reports['hits']} hits, {reports['misses']} misses "
+                     f"({reports['invalidations']} invalidated), {reports['evictions']} evictions, "
+                     f"{reports['size']} of {reports['max_size']} cached")
+    return '\n'.join(lines)
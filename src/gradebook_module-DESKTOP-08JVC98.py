@@ -1,33 +1,42 @@
 import traceback
 import os
-import json
 import PySimpleGUI as sg
-from gradebook import GradeBook
+from gradebook import GradeBook, authenticate
+from gradebook_gui import show_students_table
+from gradebook_metrics import format_metrics
+from gradebook_worker import PROGRESS_EVENT, WORKER_EVENT, GradeBookWorker, open_in_background
+
+IMPORT_FILE_TYPES = (('CSV', '*.csv'), ('JSON Lines', '*.jsonl'), ('Compressed', '*.gz *.xz'), ('All Files', '*.*'))
+EXPORT_FILE_TYPES = (('JSON', '*.json'), ('JSON Lines', '*.jsonl'), ('CSV', '*.csv'),
+                     ('Compressed', '*.gz *.xz'), ('All Files', '*.*'))
 
 # File path for the JSON data
 json_file_path = r'C:\Users\erika\OneDrive\Documents\projects\Grade_Book\src\gradebook.json'
 
-def load_json(json_file_path):
-    """
-    Load JSON data from a file.
+# Set GRADEBOOK_METRICS_FILE to collect metrics from startup and dump them to that file every minute.
+metrics_file_path = os.environ.get('GRADEBOOK_METRICS_FILE')
 
-    Args:
-        json_file_path (str): The path to the JSON file.
+def open_gradebook():
+    """
+    Open the grade book the application works on.
 
     Returns:
-        dict: The data loaded from the JSON file, or an empty dictionary if the file does not exist.
+        GradeBook: The grade book, collecting metrics if GRADEBOOK_METRICS_FILE is set.
     """
-    if os.path.exists(json_file_path):
-        with open(json_file_path, 'r') as file:
-            return json.load(file)
-    return {}
+    gradebook = GradeBook(json_file_path, metrics=bool(metrics_file_path))
+    if metrics_file_path:
+        gradebook.enable_metrics(dump_path=metrics_file_path)
+    return gradebook
 
 def login():
     """
     Display a login window for user authentication.
 
-    If the login is successful, the main application window is opened.
+    The grade book starts loading in the background as soon as the window is up, so it is
+    usually ready by the time the user has typed their password. If the login is successful,
+    the main application window is opened with it.
     """
+    loading = open_in_background(open_gradebook)
     sg.theme('DarkBlue13')  # Set the same theme as the main application
     layout = [
         [sg.Text('Username:', size=(10, 1)), sg.InputText(key='username')],
@@ -44,22 +53,21 @@ def login():
         if event == 'Login':
             username = values['username']
             password = values['password']
-            gradebook = GradeBook(json_file_path)
-            if gradebook.authenticate(username, password):
+            if authenticate(username, password):
                 window.close()
-                main_app()
+                main_app(loading)
             else:
                 sg.popup('Login Failed', 'Invalid username or password')
 
     window.close()
 
-def main_app():
+def main_app(loading=None):
     """
     Display the main application window for managing student and grade data.
-    """
-    gradebook = GradeBook(json_file_path)
-    gradebook.students = load_json(json_file_path)
 
+    Args:
+        loading (Future): The grade book being opened by open_in_background, or None to start opening it now.
+    """
     sg.theme('Dark')
 
     layout = [
@@ -92,129 +100,238 @@ def main_app():
             sg.Tab('Other Operations', [
                 [sg.Button('Print All Students', size=(30, 1), expand_x=True)],
                 [sg.Button('Search Student', size=(30, 1), expand_x=True)],
+                [sg.Button('Import Data', size=(30, 1), expand_x=True)],
                 [sg.Button('Export Data', size=(30, 1), expand_x=True)],
                 [sg.Button('Help', size=(30, 1), expand_x=True)]
+            ]),
+            sg.Tab('Diagnostics', [
+                [sg.Checkbox('Collect metrics', key='collect_metrics', default=bool(metrics_file_path), enable_events=True),
+                 sg.Button('Refresh Metrics', size=(15, 1)),
+                 sg.Button('Reset Metrics', size=(15, 1)),
+                 sg.Button('Save Metrics', size=(15, 1))],
+                [sg.Multiline(size=(80, 12), key='metrics', font=('courier', 10), disabled=True, expand_x=True, expand_y=True)]
             ])
         ]])],
         [sg.Multiline(size=(80, 20), key='output', font=('arial', 12), disabled=True, expand_x=True, expand_y=True)],
+        [sg.Text('Loading grade book...', key='status', size=(40, 1), expand_x=True)],
         [sg.Button('Exit', size=(25, 2), expand_x=True)]  # Increase the size of the Exit button
     ]
 
     window = sg.Window('Health Net Scholars Application', layout, element_justification='center', finalize=True, resizable=True, size=(800, 600))
     window.Maximize()
 
-    while True:
-        try:
-            event, values = window.read()
+    def time_output(metrics):
+        # Printing results is timed too; disable_metrics removes the timer again.
+        if 'print' not in vars(window['output']):
+            metrics.instrument(window['output'], 'gui.', ('print',))
 
-            if event in (sg.WINDOW_CLOSED, 'Exit'):
-                gradebook.save_data()
-                break
+    def show_metrics(snapshot):
+        window['metrics'].update(format_metrics(snapshot) if snapshot else 'Metrics are off. Tick "Collect metrics" to start.')
+
+    if loading is None:
+        loading = open_in_background(open_gradebook)
+    worker = GradeBookWorker(window, loading.result)
+    if metrics_file_path:
+        worker.submit(lambda gradebook: gradebook.instrumentation, time_output)
+
+    def handle_event(event, values):
+        if event == 'Add Student':
+            student_id = values['student_id']
+            student_name = values['student_name']
+            class_name = values['class']
+            if student_id and student_name and class_name:
+                student_info = {
+                    'ID': student_id,
+                    'Name': student_name,
+                    'Class': class_name
+                }
+                print(f"Adding student: {student_info}")
 
-            if event == 'Add Student':
-                student_id = values['student_id']
-                student_name = values['student_name']
-                class_name = values['class']
-                if student_id and student_name and class_name:
-                    student_info = {
-                        'ID': student_id,
-                        'Name': student_name,
-                        'Class': class_name
-                    }
-                    print(f"Adding student: {student_info}")
-                    if gradebook.add_student(student_info):
+                def done(added):
+                    if added:
                         window['output'].print(f"Student {student_name} (ID: {student_id}) added.")
                     else:
                         window['output'].print(f"Student with ID {student_id} already exists.")
-                else:
-                    window['output'].print("Please provide all student information.")
+                worker.submit(lambda gradebook: gradebook.add_student(student_info), done)
+            else:
+                window['output'].print("Please provide all student information.")
+
+        if event == 'Delete Student':
+            student_id = values['student_id']
+            if student_id:
+                print(f"Deleting student ID: {student_id}")
 
-            if event == 'Delete Student':
-                student_id = values['student_id']
-                if student_id:
-                    print(f"Deleting student ID: {student_id}")
-                    if gradebook.delete_student(student_id):
+                def done(deleted):
+                    if deleted:
                         window['output'].print(f"Student with ID {student_id} deleted.")
                     else:
                         window['output'].print(f"Student with ID {student_id} does not exist.")
-                else:
-                    window['output'].print("Please provide the student ID.")
-
-            if event == 'Add Grade':
-                student_id = values['grade_student_id']
-                try:
-                    grade = float(values['grade'])
-                    print(f"Adding grade: {grade} for student ID: {student_id}")
-                    if gradebook.add_grade(student_id, grade):
+                worker.submit(lambda gradebook: gradebook.delete_student(student_id), done)
+            else:
+                window['output'].print("Please provide the student ID.")
+
+        if event == 'Add Grade':
+            student_id = values['grade_student_id']
+            try:
+                grade = float(values['grade'])
+                print(f"Adding grade: {grade} for student ID: {student_id}")
+
+                def done(added):
+                    if added:
                         window['output'].print(f"Grade {grade} added for student ID {student_id}.")
                     else:
                         window['output'].print(f"Student with ID {student_id} does not exist.")
-                except ValueError:
-                    window['output'].print("Invalid grade. Please enter a numeric value.")
-
-            if event == 'Delete Grade':
-                student_id = values['grade_student_id']
-                try:
-                    grade = float(values['grade'])
-                    print(f"Deleting grade: {grade} for student ID: {student_id}")
-                    if gradebook.delete_grade(student_id, grade):
+                worker.submit(lambda gradebook: gradebook.add_grade(student_id, grade), done)
+            except ValueError:
+                window['output'].print("Invalid grade. Please enter a numeric value.")
+
+        if event == 'Delete Grade':
+            student_id = values['grade_student_id']
+            try:
+                grade = float(values['grade'])
+                print(f"Deleting grade: {grade} for student ID: {student_id}")
+
+                def done(deleted):
+                    if deleted:
                         window['output'].print(f"Grade {grade} deleted for student ID {student_id}.")
                     else:
                         window['output'].print(f"Grade {grade} not found for student ID {student_id}.")
-                except ValueError:
-                    window['output'].print("Invalid grade. Please enter a numeric value.")
-
-            if event == 'Get Grades':
-                student_id = values['get_grades_student_id']
-                grades = gradebook.get_grades(student_id)
-                print(f"Getting grades for student ID: {student_id}")
-                if grades is not None:
-                    window['output'].print(f"Grades for student ID {student_id}: {grades}")
+                worker.submit(lambda gradebook: gradebook.delete_grade(student_id, grade), done)
+            except ValueError:
+                window['output'].print("Invalid grade. Please enter a numeric value.")
+
+        if event == 'Get Grades':
+            student_id = values['get_grades_student_id']
+            print(f"Getting grades for student ID: {student_id}")
+
+            def done(report):
+                if report is not None:
+                    window['output'].print(report)
                 else:
                     window['output'].print(f"Student with ID {student_id} does not exist.")
+            worker.submit(lambda gradebook: gradebook.reports.render(student_id, 'grades'), done)
+
+        if event == 'Calculate Final Grade':
+            student_id = values['get_grades_student_id']
+            print(f"Calculating final grade for student ID: {student_id}")
 
-            if event == 'Calculate Final Grade':
-                student_id = values['get_grades_student_id']
-                final_grade = gradebook.calculate_final_grade(student_id)
-                print(f"Calculating final grade for student ID: {student_id}")
-                if final_grade is not None:
-                    window['output'].print(f"Final grade for student ID {student_id}: {final_grade:.2f}")
+            def done(report):
+                if report is not None:
+                    window['output'].print(report)
                 else:
                     window['output'].print(f"Student with ID {student_id} does not exist or has no grades.")
+            worker.submit(lambda gradebook: gradebook.reports.render(student_id, 'final_grade'), done)
 
-            if event == 'Print All Students':
-                students = gradebook.print_all_students()
-                print("Printing all students")
-                if students:
-                    for student_id, info in students.items():
-                        window['output'].print(f"Student ID: {student_id}, Name: {info['Name']}, Class: {info['Class']}, Grades: {info['Grades']}")
+        if event == 'Print All Students':
+            print("Printing all students")
+
+            def done(count):
+                if count:
+                    show_students_table(worker.gradebook, lock=worker.lock)
                 else:
                     window['output'].print("No students in the grade book.")
+            worker.submit(lambda gradebook: len(gradebook.print_all_students()), done)
+
+        if event == 'Search Student':
+            search_text = sg.popup_get_text('Enter a Student ID, the start of a name, or a class to search', 'Search Student')
+            if search_text:
+                print(f"Searching for student: {search_text}")
 
-            if event == 'Search Student':
-                search_id = sg.popup_get_text('Enter Student ID to search', 'Search Student')
-                if search_id:
-                    student = gradebook.students.get(search_id)
-                    print(f"Searching for student ID: {search_id}")
+                def search(gradebook):
+                    student = gradebook.students.get(search_text)
                     if student:
-                        window['output'].print(f"Found student: ID: {student['ID']}, Name: {student['Name']}, Class: {student['Class']}, Grades: {student['Grades']}")
+                        matches = [student]
                     else:
-                        window['output'].print(f"No student found with ID: {search_id}")
+                        matches = gradebook.find_by_name_prefix(search_text, limit=100) or gradebook.find_by_class(search_text, limit=100)
+                    return [gradebook.reports.render(student.id, 'summary') for student in matches]
+
+                def done(matches):
+                    for summary in matches:
+                        window['output'].print(f"Found student: {summary}")
+                    if not matches:
+                        window['output'].print(f"No student found matching: {search_text}")
+                worker.submit(search, done)
+
+        if event == 'Import Data':
+            import_path = sg.popup_get_file('Import Students and Grades', no_window=True, file_types=IMPORT_FILE_TYPES)
+            if import_path:
+                # The import pipeline pulls in multiprocessing, so it is only loaded when first used.
+                from gradebook_import import import_file
+                print(f"Importing: {import_path}")
+                progress = worker.progress('Importing... {0} rows read, {1} errors')
+
+                def done(result):
+                    for line_number, message in result['errors'][:20]:
+                        window['output'].print(f"Line {line_number}: {message}")
+                    if len(result['errors']) > 20:
+                        window['output'].print(f"... and {len(result['errors']) - 20} more errors")
+                    window['output'].print(f"Added {result['students']} students and {result['grades']} grades from {import_path}.")
+                worker.submit(lambda gradebook: import_file(gradebook, import_path, progress=progress), done)
+
+        if event == 'Export Data':
+            export_path = sg.popup_get_file('Save Data As', save_as=True, no_window=True, file_types=EXPORT_FILE_TYPES)
+            if export_path:
+                progress = worker.progress('Exporting... {0} of {1} students')
+                worker.submit(lambda gradebook: gradebook.export_data(export_path, progress=progress),
+                              lambda count: window['output'].print(f"{count} students exported to {export_path}"))
+
+        if event == 'collect_metrics':
+            if values['collect_metrics']:
+                worker.submit(lambda gradebook: gradebook.enable_metrics(), time_output)
+            else:
+                worker.submit(lambda gradebook: gradebook.disable_metrics(), lambda _: show_metrics(None))
+
+        if event == 'Refresh Metrics':
+            worker.submit(lambda gradebook: gradebook.metrics(), show_metrics)
 
-            if event == 'Export Data':
-                export_path = sg.popup_get_file('Save Data As', save_as=True, no_window=True)
-                if export_path:
-                    gradebook.export_data(export_path)
-                    window['output'].print(f"Data exported to {export_path}")
+        if event == 'Reset Metrics':
+            def reset(gradebook):
+                if gradebook.instrumentation is not None:
+                    gradebook.instrumentation.reset()
+                return gradebook.metrics()
+            worker.submit(reset, show_metrics)
 
-            if event == 'Help':
-                sg.popup('Help', 'This is the Health Net Scholars application.\n\nUse the tabs to manage students and grades.\nClick "Export Data" to save the current data to a file.\nContact support for more help at Eferr6@uis.edu.')
+        if event == 'Save Metrics':
+            metrics_path = sg.popup_get_file('Save Metrics As', save_as=True, no_window=True, file_types=(('JSON', '*.json'),))
+            if metrics_path:
+                def save(gradebook):
+                    if gradebook.instrumentation is None:
+                        return False
+                    gradebook.instrumentation.dump(metrics_path)
+                    return True
+                worker.submit(save, lambda saved: window['output'].print(
+                    f"Metrics saved to {metrics_path}." if saved else "Metrics are off. Tick \"Collect metrics\" on the Diagnostics tab first."))
+
+        if event == 'Help':
+            sg.popup('Help', 'This is the Health Net Scholars application.\n\nUse the tabs to manage students and grades.\nClick "Export Data" to save the current data to a file. The file extension picks the format: .json, .jsonl or .csv, optionally followed by .gz or .xz to compress it.\nClick "Import Data" to add students and grades from a .csv or .jsonl file.\nContact support for more help at Eferr6@uis.edu.')
+
+    while True:
+        try:
+            event, values = window.read()
+
+            if event in (sg.WINDOW_CLOSED, 'Exit'):
+                worker.submit(lambda gradebook: gradebook.save_data())
+                break
+
+            if event == PROGRESS_EVENT:
+                window['status'].update(values[PROGRESS_EVENT])
+                continue
+
+            if event == WORKER_EVENT:
+                error = worker.handle(values[WORKER_EVENT])
+                if error:
+                    window['output'].print(f"An error occurred: {error}")
+                    print(f"An error occurred: {error}")
+            else:
+                handle_event(event, values)
+            window['status'].update(worker.status())
 
         except Exception as e:
             error_message = traceback.format_exc()
             window['output'].print(f"An error occurred: {str(e)}\n{error_message}")
             print(f"An error occurred: {str(e)}\n{error_message}")
 
+    worker.stop()
     window.close()
 
 if __name__ == '__main__':
@@ -1,12 +1,14 @@
 from os import path
 import PySimpleGUI as sg
 from gradebook import GradeBook
+from gradebook_gui import show_students_table
+from gradebook_worker import PROGRESS_EVENT, WORKER_EVENT, GradeBookWorker
 import traceback
 
+IMPORT_FILE_TYPES = (('CSV', '*.csv'), ('JSON Lines', '*.jsonl'), ('Compressed', '*.gz *.xz'), ('All Files', '*.*'))
 
-def main():
-    gradebook = GradeBook()
 
+def main():
     layout = [
         # [sg.Image(image_path)],  # Display the image
         [sg.Text('Health Net Scholars', size=(25, 1), justification='center', font=("Arial", 36, "bold"), text_color="blue")],
@@ -29,102 +31,160 @@ def main():
         ], title='Get/Calculate Grades', title_color='blue', relief=sg.RELIEF_SUNKEN, element_justification='center', expand_x=True)],
         [sg.Button('Print All Students', size=(30, 1), expand_x=True)],
         [sg.Button('Search Student', size=(30, 1), expand_x=True)],
+        [sg.Button('Import Data', size=(30, 1), expand_x=True)],
         [sg.Multiline(size=(80, 20), key='output', font=('arial', 12), disabled=True, expand_x=True, expand_y=True)],
+        [sg.Text('Loading grade book...', key='status', size=(40, 1), expand_x=True)],
         [sg.Button('Exit', size=(25, 1), expand_x=True)]
     ]
 
     window = sg.Window('Health Net Scholars Application', layout, element_justification='center', finalize=True, resizable=True)
     window.Maximize()
+    worker = GradeBookWorker(window, GradeBook)
 
-    while True:
-        try:
-            event, values = window.read()
-
-            if event == sg.WINDOW_CLOSED or event == 'Exit':
-                break
+    def handle_event(event, values):
+        if event == 'Add Student':
+            student_id = values['student_id']
+            student_name = values['student_name']
+            class_name = values['class']
+            if student_id and student_name and class_name:
+                student_info = {
+                    'ID': student_id,
+                    'Name': student_name,
+                    'Class': class_name
+                }
+                print(f"Adding student: {student_info}")
 
-            if event == 'Add Student':
-                student_id = values['student_id']
-                student_name = values['student_name']
-                class_name = values['class']
-                if student_id and student_name and class_name:
-                    student_info = {
-                        'ID': student_id,
-                        'Name': student_name,
-                        'Class': class_name
-                    }
-                    print(f"Adding student: {student_info}")
-                    if gradebook.add_student(student_info):
+                def done(added):
+                    if added:
                         window['output'].print(f"Student {student_name} (ID: {student_id}) added.")
                     else:
                         window['output'].print(f"Student with ID {student_id} already exists.")
-                else:
-                    window['output'].print("Please provide all student information.")
-
-            if event == 'Add Grade':
-                student_id = values['grade_student_id']
-                try:
-                    grade = float(values['grade'])
-                    print(f"Adding grade: {grade} for student ID: {student_id}")
-                    if gradebook.add_grade(student_id, grade):
+                worker.submit(lambda gradebook: gradebook.add_student(student_info), done)
+            else:
+                window['output'].print("Please provide all student information.")
+
+        if event == 'Add Grade':
+            student_id = values['grade_student_id']
+            try:
+                grade = float(values['grade'])
+                print(f"Adding grade: {grade} for student ID: {student_id}")
+
+                def done(added):
+                    if added:
                         window['output'].print(f"Grade {grade} added for student ID {student_id}.")
                     else:
                         window['output'].print(f"Student with ID {student_id} does not exist.")
-                except ValueError:
-                    window['output'].print("Invalid grade. Please enter a numeric value.")
-
-            if event == 'Delete Grade':
-                student_id = values['grade_student_id']
-                try:
-                    grade = float(values['grade'])
-                    print(f"Deleting grade: {grade} for student ID: {student_id}")
-                    if gradebook.delete_grade(student_id, grade):
+                worker.submit(lambda gradebook: gradebook.add_grade(student_id, grade), done)
+            except ValueError:
+                window['output'].print("Invalid grade. Please enter a numeric value.")
+
+        if event == 'Delete Grade':
+            student_id = values['grade_student_id']
+            try:
+                grade = float(values['grade'])
+                print(f"Deleting grade: {grade} for student ID: {student_id}")
+
+                def done(deleted):
+                    if deleted:
                         window['output'].print(f"Grade {grade} deleted for student ID {student_id}.")
                     else:
                         window['output'].print(f"Grade {grade} not found for student ID {student_id}.")
-                except ValueError:
-                    window['output'].print("Invalid grade. Please enter a numeric value.")
-
-            if event == 'Get Grades':
-                student_id = values['get_grades_student_id']
-                grades = gradebook.get_grades(student_id)
-                print(f"Getting grades for student ID: {student_id}")
-                if grades is not None:
-                    window['output'].print(f"Grades for student ID {student_id}: {grades}")
+                worker.submit(lambda gradebook: gradebook.delete_grade(student_id, grade), done)
+            except ValueError:
+                window['output'].print("Invalid grade. Please enter a numeric value.")
+
+        if event == 'Get Grades':
+            student_id = values['get_grades_student_id']
+            print(f"Getting grades for student ID: {student_id}")
+
+            def done(report):
+                if report is not None:
+                    window['output'].print(report)
                 else:
                     window['output'].print(f"Student with ID {student_id} does not exist.")
+            worker.submit(lambda gradebook: gradebook.reports.render(student_id, 'grades'), done)
 
-            if event == 'Calculate Final Grade':
-                student_id = values['get_grades_student_id']
-                final_grade = gradebook.calculate_final_grade(student_id)
-                print(f"Calculating final grade for student ID: {student_id}")
-                if final_grade is not None:
-                    window['output'].print(f"Final grade for student ID {student_id}: {final_grade:.2f}")
+        if event == 'Calculate Final Grade':
+            student_id = values['get_grades_student_id']
+            print(f"Calculating final grade for student ID: {student_id}")
+
+            def done(report):
+                if report is not None:
+                    window['output'].print(report)
                 else:
                     window['output'].print(f"Student with ID {student_id} does not exist or has no grades.")
+            worker.submit(lambda gradebook: gradebook.reports.render(student_id, 'final_grade'), done)
+
+        if event == 'Print All Students':
+            print("Printing all students")
 
-            if event == 'Print All Students':
-                students = gradebook.print_all_students()
-                print("Printing all students")
-                if students:
-                    for student_id, info in students.items():
-                        window['output'].print(f"Student ID: {student_id}, Name: {info['Name']}, Class: {info['Class']}, Grades: {info['Grades']}")
+            def done(count):
+                if count:
+                    show_students_table(worker.gradebook, lock=worker.lock)
                 else:
                     window['output'].print("No students in the grade book.")
+            worker.submit(lambda gradebook: len(gradebook.print_all_students()), done)
 
-            if event == 'Search Student':
-                search_id = sg.popup_get_text('Enter Student ID to search', 'Search Student')
-                if search_id:
-                    student = gradebook.students.get(search_id)
-                    print(f"Searching for student ID: {search_id}")
+        if event == 'Search Student':
+            search_text = sg.popup_get_text('Enter a Student ID, the start of a name, or a class to search', 'Search Student')
+            if search_text:
+                print(f"Searching for student: {search_text}")
+
+                def search(gradebook):
+                    student = gradebook.students.get(search_text)
                     if student:
-                        window['output'].print(f"Found student: ID: {student['ID']}, Name: {student['Name']}, Class: {student['Class']}, Grades: {student['Grades']}")
+                        matches = [student]
                     else:
-                        window['output'].print(f"No student found with ID: {search_id}")
+                        matches = gradebook.find_by_name_prefix(search_text, limit=100) or gradebook.find_by_class(search_text, limit=100)
+                    return [gradebook.reports.render(student.id, 'summary') for student in matches]
+
+                def done(matches):
+                    for summary in matches:
+                        window['output'].print(f"Found student: {summary}")
+                    if not matches:
+                        window['output'].print(f"No student found matching: {search_text}")
+                worker.submit(search, done)
+
+        if event == 'Import Data':
+            import_path = sg.popup_get_file('Import Students and Grades', no_window=True, file_types=IMPORT_FILE_TYPES)
+            if import_path:
+                # The import pipeline pulls in multiprocessing, so it is only loaded when first used.
+                from gradebook_import import import_file
+                print(f"Importing: {import_path}")
+                progress = worker.progress('Importing... {0} rows read, {1} errors')
+
+                def done(result):
+                    for line_number, message in result['errors'][:20]:
+                        window['output'].print(f"Line {line_number}: {message}")
+                    if len(result['errors']) > 20:
+                        window['output'].print(f"... and {len(result['errors']) - 20} more errors")
+                    window['output'].print(f"Added {result['students']} students and {result['grades']} grades from {import_path}.")
+                worker.submit(lambda gradebook: import_file(gradebook, import_path, progress=progress), done)
+
+    while True:
+        try:
+            event, values = window.read()
+
+            if event == sg.WINDOW_CLOSED or event == 'Exit':
+                break
+
+            if event == PROGRESS_EVENT:
+                window['status'].update(values[PROGRESS_EVENT])
+                continue
+
+            if event == WORKER_EVENT:
+                error = worker.handle(values[WORKER_EVENT])
+                if error:
+                    window['output'].print(f"An error occurred: {error}")
+                    print(f"An error occurred: {error}")
+            else:
+                handle_event(event, values)
+            window['status'].update(worker.status())
 
         except Exception as e:
             error_message = traceback.format_exc()
             window['output'].print(f"An error occurred: {str(e)}\n{error_message}")
             print(f"An error occurred: {str(e)}\n{error_message}")
 
+    worker.stop()
     window.close()
\ No newline at end of file
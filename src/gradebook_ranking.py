@@ -0,0 +1,216 @@
+import math
+from bisect import bisect_left, insort
+
+
+def _final_grade(student):
+    """
+    Get the final grade a student is ranked by.
+
+    Args:
+        student (StudentRecord): The student, with their running aggregates.
+
+    Returns:
+        float: The final grade, or None if the student has no grades or a grade that is not a number.
+    """
+    final_grade = student.stats.mean()
+    if final_grade is None or math.isnan(final_grade):
+        return None
+    return final_grade
+
+
+class RankingIndex:
+    """
+    Students with grades ordered by final grade, across the grade book and within each class.
+
+    Each ranking is a sorted list of (final grade, student ID) pairs, so the best and worst
+    students are at its ends and binary search finds a grade range or the rank of a student.
+    Students without grades are not ranked, and neither are students with a grade that is not a number.
+
+    Changes are not applied as they happen. The grade book marks the students that changed, and
+    the marked students are re-ranked the next time the index is queried. After many changes, such
+    as an import, the owner rebuilds the index instead, which is cheaper than moving each student.
+
+    Attributes:
+        REBUILD_AFTER (int): The number of marked students beyond which rebuilding is cheaper.
+    """
+
+    REBUILD_AFTER = 1000
+
+    def __init__(self, students=()):
+        """
+        Initialize the index.
+
+        Args:
+            students (iterable): The StudentRecord objects to rank, with their running aggregates.
+        """
+        self._ranked = []
+        self._by_class = {}
+        self._keys = {}
+        self._pending = set()
+        for student in students:
+            final_grade = _final_grade(student)
+            if final_grade is not None:
+                key = (final_grade, student.id)
+                self._ranked.append(key)
+                self._by_class.setdefault(student.class_name, []).append(key)
+                self._keys[student.id] = (key, student.class_name)
+        self._ranked.sort()
+        for ranked in self._by_class.values():
+            ranked.sort()
+
+    def __len__(self):
+        return len(self._ranked)
+
+    def __contains__(self, student_id):
+        return student_id in self._keys
+
+    def mark(self, student_id):
+        """
+        Note that a student was added or deleted or their grades changed.
+
+        Args:
+            student_id (str): The ID of the student.
+        """
+        # Past REBUILD_AFTER the index is rebuilt anyway, so the set stops growing.
+        if len(self._pending) <= self.REBUILD_AFTER:
+            self._pending.add(student_id)
+
+    def needs_rebuild(self):
+        """
+        Check whether so many students changed that rebuilding is cheaper than re-ranking them.
+
+        Returns:
+            bool: True if the index should be rebuilt.
+        """
+        return len(self._pending) > self.REBUILD_AFTER
+
+    def refresh(self, students):
+        """
+        Re-rank the students marked since the last refresh.
+
+        Args:
+            students (Mapping): The current StudentRecord objects, keyed by student ID.
+        """
+        for student_id in self._pending:
+            self._remove(student_id)
+            student = students.get(student_id)
+            if student is not None:
+                self._insert(student)
+        self._pending.clear()
+
+    def top(self, count, class_name=None):
+        """
+        List the students with the highest final grades.
+
+        Args:
+            count (int): The most students to list.
+            class_name (str): Only rank students in this class. Defaults to every student.
+
+        Returns:
+            list: (student ID, final grade) pairs, highest first.
+        """
+        ranked = self._ranking(class_name)
+        return [(student_id, final_grade) for final_grade, student_id in reversed(ranked[max(0, len(ranked) - count):])]
+
+    def bottom(self, count, class_name=None):
+        """
+        List the students with the lowest final grades.
+
+        Args:
+            count (int): The most students to list.
+            class_name (str): Only rank students in this class. Defaults to every student.
+
+        Returns:
+            list: (student ID, final grade) pairs, lowest first.
+        """
+        return [(student_id, final_grade) for final_grade, student_id in self._ranking(class_name)[:max(0, count)]]
+
+    def between(self, low, high, class_name=None):
+        """
+        List the students whose final grade is in a range, bounds included.
+
+        Args:
+            low (float): The lowest final grade.
+            high (float): The highest final grade.
+            class_name (str): Only list students in this class. Defaults to every student.
+
+        Returns:
+            list: (student ID, final grade) pairs, highest first.
+        """
+        ranked = self._ranking(class_name)
+        start = bisect_left(ranked, (low,))
+        end = bisect_left(ranked, (math.nextafter(high, math.inf),))
+        return [(student_id, final_grade) for final_grade, student_id in reversed(ranked[start:end])]
+
+    def rank(self, student_id, in_class=False):
+        """
+        Rank a student by final grade. The highest final grade is rank 1, and tied students share the best rank.
+
+        Args:
+            student_id (str): The ID of the student.
+            in_class (bool): Rank the student among their class instead of the whole grade book.
+
+        Returns:
+            int: The rank, or None if the student is not ranked.
+        """
+        entry = self._keys.get(student_id)
+        if entry is None:
+            return None
+        (final_grade, _), class_name = entry
+        ranked = self._by_class[class_name] if in_class else self._ranked
+        return len(ranked) - bisect_left(ranked, (math.nextafter(final_grade, math.inf),)) + 1
+
+    def ids(self):
+        """
+        List every ranked student, lowest final grade first.
+
+        Returns:
+            list: The student IDs.
+        """
+        return [student_id for _, student_id in self._ranked]
+
+    def _ranking(self, class_name):
+        """
+        Get the ranking of the whole grade book or of one class.
+
+        Args:
+            class_name (str): The class, or None for the whole grade book.
+
+        Returns:
+            list: The sorted (final grade, student ID) pairs.
+        """
+        if class_name is None:
+            return self._ranked
+        return self._by_class.get(class_name, [])
+
+    def _insert(self, student):
+        """
+        Rank a student, if they have grades.
+
+        Args:
+            student (StudentRecord): The student.
+        """
+        final_grade = _final_grade(student)
+        if final_grade is None:
+            return
+        key = (final_grade, student.id)
+        insort(self._ranked, key)
+        insort(self._by_class.setdefault(student.class_name, []), key)
+        self._keys[student.id] = (key, student.class_name)
+
+    def _remove(self, student_id):
+        """
+        Stop ranking a student, if they are ranked.
+
+        Args:
+            student_id (str): The ID of the student.
+        """
+        entry = self._keys.pop(student_id, None)
+        if entry is None:
+            return
+        key, class_name = entry
+        del self._ranked[bisect_left(self._ranked, key)]
+        ranked = self._by_class[class_name]
+        del ranked[bisect_left(ranked, key)]
+        if not ranked:
+            del self._by_class[class_name]
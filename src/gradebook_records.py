@@ -0,0 +1,481 @@
+import math
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, MutableMapping
+from itertools import islice
+from operator import lt
+
+ENTRY_KEYS = ('Grade IDs', 'Assignments', 'Timestamps')
+
+# Stored next to the entry lists only when the latest entries were deleted.
+LAST_ID_KEY = 'Last Grade ID'
+
+
+class GradeEntries:
+    """
+    The entry IDs, assignment labels and timestamps of a student's grades, held in the same order
+    as StudentRecord.grades.
+
+    Entry IDs only ever increase within a student, so an entry is found by a binary search over
+    the IDs instead of a scan comparing grades. Deleting an entry still removes it from the arrays,
+    which moves every later entry down: O(n) in the student's grades, like the list.remove it
+    replaced, although as one memmove rather than a scan comparing floats. The grades stay in one
+    contiguous array with no deleted slots, so the aggregates, exports, statistics and snapshots
+    that read it directly need not skip any. Like SQLite AUTOINCREMENT
+    row IDs, the highest ID ever handed out is remembered, so an ID is never given to a second
+    grade even after the latest entry is deleted, and a repeated delete by entry ID cannot remove
+    a newer grade.
+
+    Attributes:
+        ids (array): The entry IDs as an ascending array('q').
+        last_id (int): The highest ID handed out so far, at least the highest ID in ids.
+        timestamps (array): The times the grades were recorded, in seconds since the epoch, as an
+            array('d'). NaN where the time is unknown.
+        assignments (list): The assignment label of each grade, or None for grades without one.
+            None instead of a list while no grade has a label.
+    """
+
+    __slots__ = ('ids', 'timestamps', 'assignments', 'last_id')
+
+    def __init__(self, ids=(), assignments=None, timestamps=None, last_id=0):
+        """
+        Initialize the entries.
+
+        Args:
+            ids (iterable): The entry IDs, in ascending order.
+            assignments (iterable): The assignment labels, with None for grades without one. Defaults to none.
+            timestamps (iterable): The timestamps, with None for unknown ones. Defaults to unknown.
+            last_id (int): The highest ID handed out before, if higher than the last of ids.
+
+        Raises:
+            ValueError: If the IDs do not ascend or the lists differ in length.
+        """
+        self.ids = array('q', ids)
+        if timestamps is None:
+            self.timestamps = array('d', [math.nan]) * len(self.ids)
+        else:
+            timestamps = list(timestamps)
+            if None in timestamps:
+                timestamps = [math.nan if timestamp is None else timestamp for timestamp in timestamps]
+            self.timestamps = array('d', timestamps)
+        self.assignments = None
+        if assignments is not None:
+            assignments = list(assignments)
+            if assignments.count(None) != len(assignments):
+                self.assignments = assignments
+        if len(self.timestamps) != len(self.ids) or (self.assignments is not None and len(self.assignments) != len(self.ids)):
+            raise ValueError('Grade IDs, assignments and timestamps must have one value per grade')
+        if not all(map(lt, self.ids, islice(self.ids, 1, None))):
+            raise ValueError('Grade IDs must ascend')
+        self.last_id = max(int(last_id or 0), self.ids[-1] if self.ids else 0)
+
+    @classmethod
+    def from_dict(cls, student_info):
+        """
+        Read the entries from a student dictionary.
+
+        Args:
+            student_info (dict): A dictionary that may have the keys 'Grade IDs', 'Assignments',
+                'Timestamps' and 'Last Grade ID'.
+
+        Returns:
+            GradeEntries: The entries, or None if the dictionary has none, so the grades are numbered from 1.
+        """
+        if 'Grade IDs' not in student_info:
+            return None
+        return cls.build(student_info['Grade IDs'], student_info.get('Assignments'), student_info.get('Timestamps'),
+                         student_info.get(LAST_ID_KEY, 0))
+
+    @classmethod
+    def build(cls, ids, assignments=None, timestamps=None, last_id=0):
+        """
+        Make entries, or None when they would only number the grades from 1 without labels or
+        timestamps, which is what a record without entries means.
+
+        Args:
+            ids (list): The entry IDs.
+            assignments (list): The assignment labels, or None.
+            timestamps (list): The timestamps, or None.
+            last_id (int): The highest ID handed out before, or 0 if none was deleted since.
+
+        Returns:
+            GradeEntries: The entries, or None.
+        """
+        entries = cls(ids, assignments, timestamps, last_id)
+        numbered = entries.ids == array('q', range(1, len(entries.ids) + 1)) and entries.last_id == len(entries.ids)
+        if numbered and entries.assignments is None and all(map(math.isnan, entries.timestamps)):
+            return None
+        return entries
+
+    def __len__(self):
+        return len(self.ids)
+
+    def next_id(self):
+        """
+        Get the ID for a new entry.
+
+        Returns:
+            int: One past the highest ID ever handed out, or 1 for the first entry.
+        """
+        return self.last_id + 1
+
+    def position(self, entry_id):
+        """
+        Find an entry by ID with a binary search.
+
+        Args:
+            entry_id (int): The entry ID.
+
+        Returns:
+            int: The position of the entry, which is also the position of its grade, or None if there is no such entry.
+        """
+        index = bisect_left(self.ids, entry_id)
+        if index < len(self.ids) and self.ids[index] == entry_id:
+            return index
+        return None
+
+    def insert(self, index, entry_id, assignment=None, timestamp=None):
+        """
+        Insert an entry at a position.
+
+        Args:
+            index (int): The position.
+            entry_id (int): The entry ID. It must keep the IDs ascending.
+            assignment (str): The assignment label, or None.
+            timestamp (float): The timestamp, or None if unknown.
+        """
+        self.ids.insert(index, entry_id)
+        self.last_id = max(self.last_id, entry_id)
+        self.timestamps.insert(index, math.nan if timestamp is None else timestamp)
+        if assignment is not None and self.assignments is None:
+            self.assignments = [None] * (len(self.ids) - 1)
+        if self.assignments is not None:
+            self.assignments.insert(index, assignment)
+
+    def append(self, entry_id, assignment=None, timestamp=None):
+        """
+        Add an entry at the end.
+
+        Args:
+            entry_id (int): The entry ID. It must be higher than every other.
+            assignment (str): The assignment label, or None.
+            timestamp (float): The timestamp, or None if unknown.
+        """
+        self.ids.append(entry_id)
+        self.last_id = max(self.last_id, entry_id)
+        self.timestamps.append(math.nan if timestamp is None else timestamp)
+        if assignment is not None and self.assignments is None:
+            self.assignments = [None] * (len(self.ids) - 1)
+        if self.assignments is not None:
+            self.assignments.append(assignment)
+
+    def pop(self, index):
+        """
+        Remove the entry at a position.
+
+        Args:
+            index (int): The position.
+
+        Returns:
+            tuple: The entry ID, assignment label and timestamp, ready to pass back to insert.
+        """
+        entry_id = self.ids.pop(index)
+        timestamp = self.timestamps.pop(index)
+        assignment = None if self.assignments is None else self.assignments.pop(index)
+        return entry_id, assignment, None if math.isnan(timestamp) else timestamp
+
+    def entry(self, index):
+        """
+        Get the entry at a position.
+
+        Args:
+            index (int): The position.
+
+        Returns:
+            tuple: The entry ID, assignment label and timestamp.
+        """
+        timestamp = self.timestamps[index]
+        return self.ids[index], None if self.assignments is None else self.assignments[index], None if math.isnan(timestamp) else timestamp
+
+    def to_dict(self):
+        """
+        Convert the entries to the lists stored next to 'Grades' in a student dictionary.
+
+        Returns:
+            dict: The lists keyed by 'Grade IDs', 'Assignments' and 'Timestamps', and the
+                'Last Grade ID' if the latest entries were deleted.
+        """
+        entries = {
+            'Grade IDs': self.ids.tolist(),
+            'Assignments': [None] * len(self.ids) if self.assignments is None else list(self.assignments),
+            'Timestamps': [None if math.isnan(timestamp) else timestamp for timestamp in self.timestamps],
+        }
+        if self.deleted_latest():
+            entries[LAST_ID_KEY] = self.last_id
+        return entries
+
+    def deleted_latest(self):
+        """
+        Check whether the highest ID handed out is no longer in use, so it has to be stored.
+
+        Returns:
+            bool: True if last_id is higher than every current ID.
+        """
+        return self.last_id > (self.ids[-1] if self.ids else 0)
+
+
+class StudentRecord(Mapping):
+    """
+    A compact in-memory student record.
+
+    Grades are held in an array of doubles instead of a list of float objects, the class name is
+    interned so students in the same class share one string, and __slots__ removes the per-record
+    attribute dictionary. The record still reads like the student dictionaries stored in the JSON
+    file: record['ID'], record['Name'], record['Class'] and record['Grades'] all work, and
+    record['Grades'] returns a plain list. Records whose grades have entry IDs, assignments or
+    timestamps also have the keys 'Grade IDs', 'Assignments' and 'Timestamps'.
+
+    Attributes:
+        id (str): The student ID.
+        name (str): The student name.
+        class_name (str): The student class.
+        grades (array): The grades as an array('d').
+        stats (RunningStats): The running grade aggregates kept by the grade book.
+        entries (GradeEntries): The entry IDs, assignments and timestamps of the grades, or None
+            while the grades are simply numbered from 1, with no labels or timestamps.
+    """
+
+    __slots__ = ('id', 'name', 'class_name', 'grades', 'stats', 'entries')
+
+    _KEYS = ('ID', 'Name', 'Class', 'Grades')
+
+    def __init__(self, student_id, name, class_name, grades=(), entries=None):
+        """
+        Initialize the record.
+
+        Args:
+            student_id (str): The student ID.
+            name (str): The student name.
+            class_name (str): The student class.
+            grades (iterable): The grades.
+            entries (GradeEntries): The entries of the grades, or None to number them from 1.
+
+        Raises:
+            ValueError: If there is not one entry per grade.
+        """
+        self.id = student_id
+        self.name = name
+        self.class_name = sys.intern(class_name) if isinstance(class_name, str) else class_name
+        self.grades = array('d', grades)
+        self.stats = None
+        if entries is not None and len(entries) != len(self.grades):
+            raise ValueError(f"Student {student_id} has {len(self.grades)} grades but {len(entries)} grade IDs")
+        self.entries = entries
+
+    @classmethod
+    def from_dict(cls, student_info):
+        """
+        Build a record from a student dictionary.
+
+        Args:
+            student_info (dict): A dictionary with keys 'ID', 'Name', 'Class' and optionally 'Grades',
+                'Grade IDs', 'Assignments', 'Timestamps' and 'Last Grade ID'.
+
+        Returns:
+            StudentRecord: The record.
+        """
+        return cls(student_info['ID'], student_info['Name'], student_info['Class'], student_info.get('Grades', ()),
+                   GradeEntries.from_dict(student_info))
+
+    def to_dict(self):
+        """
+        Convert the record to a student dictionary.
+
+        Returns:
+            dict: A dictionary with keys 'ID', 'Name', 'Class' and 'Grades', and 'Grade IDs',
+                'Assignments' and 'Timestamps' if the grades have entries.
+        """
+        student = {'ID': self.id, 'Name': self.name, 'Class': self.class_name, 'Grades': self.grades.tolist()}
+        if self.entries is not None:
+            student.update(self.entries.to_dict())
+        return student
+
+    def grade_entries(self):
+        """
+        Get the entries of the grades, numbering the grades from 1 if they have none yet.
+
+        Returns:
+            GradeEntries: The entries, kept on the record from then on.
+        """
+        if self.entries is None:
+            self.entries = GradeEntries(range(1, len(self.grades) + 1))
+        return self.entries
+
+    def __getitem__(self, key):
+        if key == 'ID':
+            return self.id
+        if key == 'Name':
+            return self.name
+        if key == 'Class':
+            return self.class_name
+        if key == 'Grades':
+            return self.grades.tolist()
+        if key in ENTRY_KEYS and self.entries is not None:
+            return self.entries.to_dict()[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        if self.entries is not None:
+            return iter(self._KEYS + ENTRY_KEYS)
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS) + (0 if self.entries is None else len(ENTRY_KEYS))
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class LazyStudents(MutableMapping):
+    """
+    A student dictionary that reads records from a storage source on first access.
+
+    The source is anything that can count, list, look up and decode students, such as a binary
+    snapshot or a database. Records are kept once they have been read, and students added or
+    deleted in memory are tracked on top of the source until the source catches up.
+
+    Attributes:
+        source: The object records are read from, or None once every record has been loaded.
+    """
+
+    def __init__(self, source):
+        """
+        Initialize the dictionary.
+
+        Args:
+            source: The source to read records from. It must support len(), `in`, read(student_id),
+                ids(), records(), class_aggregates() and close().
+        """
+        self.source = source
+        self._loaded = {}
+        self._added = {}
+        self._deleted = set()
+
+    def __getitem__(self, student_id):
+        record = self._loaded.get(student_id)
+        if record is not None:
+            return record
+        if student_id in self._deleted or self.source is None:
+            raise KeyError(student_id)
+        record = self.source.read(student_id)
+        if record is None:
+            raise KeyError(student_id)
+        self._loaded[student_id] = record
+        return record
+
+    def __setitem__(self, student_id, record):
+        if student_id in self._deleted:
+            self._deleted.discard(student_id)
+        elif student_id not in self._loaded and (self.source is None or student_id not in self.source):
+            self._added[student_id] = None
+        self._loaded[student_id] = record
+
+    def __delitem__(self, student_id):
+        if student_id not in self:
+            raise KeyError(student_id)
+        self._loaded.pop(student_id, None)
+        if student_id in self._added:
+            del self._added[student_id]
+        else:
+            self._deleted.add(student_id)
+
+    def __contains__(self, student_id):
+        if student_id in self._loaded:
+            return True
+        if student_id in self._deleted or self.source is None:
+            return False
+        return student_id in self.source
+
+    def __iter__(self):
+        if self.source is not None:
+            for student_id in self.source.ids():
+                if student_id not in self._deleted:
+                    yield student_id
+        yield from list(self._added)
+
+    def __len__(self):
+        base = 0 if self.source is None else len(self.source)
+        return base - len(self._deleted) + len(self._added)
+
+    def iter_records(self):
+        """
+        Yield every record in order without keeping the ones that were not read yet.
+
+        Yields:
+            StudentRecord: Each student record.
+        """
+        if self.source is not None:
+            for record in self.source.records():
+                if record.id not in self._deleted:
+                    yield self._loaded.get(record.id, record)
+        for student_id in list(self._added):
+            yield self._loaded[student_id]
+
+    def class_aggregates(self):
+        """
+        Read the per-class aggregates of a freshly opened source.
+
+        Returns:
+            tuple: A dictionary of RunningStats and a dictionary of student counts, both keyed by class.
+        """
+        return self.source.class_aggregates()
+
+    def forget(self, student_ids):
+        """
+        Drop records that were read from the source, so they are read again when next accessed.
+        Students added in memory and not yet in the source are kept.
+
+        Args:
+            student_ids (iterable): The IDs of the students.
+        """
+        for student_id in student_ids:
+            if student_id not in self._added:
+                self._loaded.pop(student_id, None)
+
+    def synced(self):
+        """
+        Forget the in-memory additions and deletions once the source holds them.
+        """
+        if self.source is not None:
+            self._added.clear()
+            self._deleted.clear()
+
+    def rebase(self, source):
+        """
+        Switch to a new source that holds every change made so far.
+
+        Args:
+            source: The new source.
+        """
+        self.close()
+        self.source = source
+        self.synced()
+
+    def materialize(self):
+        """
+        Read every record into memory and detach from the source.
+        """
+        records = list(self.iter_records())
+        self.close()
+        self.source = None
+        self._loaded = {record.id: record for record in records}
+        self._added = dict.fromkeys(self._loaded)
+        self._deleted.clear()
+
+    def close(self):
+        """
+        Close the source.
+        """
+        if self.source is not None:
+            self.source.close()
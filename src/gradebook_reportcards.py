@@ -0,0 +1,325 @@
+import argparse
+import csv
+import html
+import io
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from gradebook_binary import BinarySnapshot, write_snapshot
+from gradebook_records import LazyStudents
+
+CHUNK_SIZE = 500
+
+EXTENSIONS = {'text': '.txt', 'csv': '.csv', 'html': '.html'}
+
+# The snapshot each worker process opens once, in _open_snapshot.
+_snapshot = None
+
+
+def _grade_rows(student):
+    """
+    List the grades of a student with their entry IDs, assignments and timestamps.
+
+    Args:
+        student (StudentRecord): The student.
+
+    Returns:
+        list: (entry ID, assignment, timestamp, grade) tuples in the order the grades were added.
+            The assignment is '' and the timestamp is an ISO 8601 date and time in UTC, or '', when unknown.
+    """
+    rows = []
+    for index, grade in enumerate(student.grades):
+        if student.entries is None:
+            entry_id, assignment, timestamp = index + 1, None, None
+        else:
+            entry_id, assignment, timestamp = student.entries.entry(index)
+        if timestamp is not None:
+            timestamp = datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='seconds')
+        rows.append((entry_id, assignment or '', timestamp or '', grade))
+    return rows
+
+
+def _final_grade(student):
+    """
+    Calculate the final grade of a student, as GradeBook.calculate_final_grade does.
+
+    Args:
+        student (StudentRecord): The student, with their running aggregates.
+
+    Returns:
+        float: The mean of the grades, or None if the student has no grades.
+    """
+    if student.stats is not None:
+        return student.stats.mean()
+    return sum(student.grades) / len(student.grades) if student.grades else None
+
+
+def render_report_card(student, format='text'):
+    """
+    Render the report card of a student: their details, every grade and their final grade.
+
+    Args:
+        student (StudentRecord): The student.
+        format (str): 'text', 'csv' or 'html'.
+
+    Returns:
+        str: The report card.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    rows = _grade_rows(student)
+    final_grade = _final_grade(student)
+    final_text = 'none' if final_grade is None else f"{final_grade:.2f}"
+    if format == 'text':
+        lines = [f"Report card for {student.name}", f"ID: {student.id}", f"Class: {student.class_name}", '']
+        lines.extend(f"{entry_id:>4}  {grade:>8g}  {assignment}  {timestamp}".rstrip() for entry_id, assignment, timestamp, grade in rows)
+        lines.extend(['' if rows else 'No grades.', f"Final grade: {final_text}", ''])
+        return '\n'.join(lines)
+    if format == 'csv':
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerows([('ID', student.id), ('Name', student.name), ('Class', student.class_name), ()])
+        writer.writerow(('Entry', 'Assignment', 'Timestamp', 'Grade'))
+        writer.writerows((entry_id, assignment, timestamp, repr(grade)) for entry_id, assignment, timestamp, grade in rows)
+        writer.writerow(('Final Grade', '', '', '' if final_grade is None else repr(final_grade)))
+        return out.getvalue()
+    if format == 'html':
+        name = html.escape(student.name)
+        body = ''.join(f"<tr><td>{entry_id}</td><td>{html.escape(assignment)}</td><td>{timestamp}</td><td>{grade:g}</td></tr>\n"
+                       for entry_id, assignment, timestamp, grade in rows)
+        return (f"<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>Report card for {name}</title></head>\n<body>\n"
+                f"<h1>Report card for {name}</h1>\n"
+                f"<p>ID: {html.escape(student.id)}<br>Class: {html.escape(student.class_name)}</p>\n"
+                f"<table>\n<tr><th>Entry</th><th>Assignment</th><th>Timestamp</th><th>Grade</th></tr>\n{body}</table>\n"
+                f"<p>Final grade: {final_text}</p>\n</body>\n</html>\n")
+    raise ValueError(f"Unknown report card format: {format}")
+
+
+def report_card_path(directory, student_id, format='text'):
+    """
+    Get the file a student's report card is written to.
+
+    The student ID is percent-encoded, so every ID maps to its own file name. The name of an ID
+    with capital letters ends in '@' and a hexadecimal mask of where they are, so IDs that differ
+    only in case, such as 'ab' and 'AB', get different files on case-insensitive file systems too.
+    An '@' in the ID itself is percent-encoded, so the mask cannot be mistaken for part of an ID.
+
+    Args:
+        directory (str): The output directory.
+        student_id (str): The ID of the student.
+        format (str): 'text', 'csv' or 'html'.
+
+    Returns:
+        str: The path, such as 'cards/s001.txt' or 'cards/S001@1.txt'.
+    """
+    name = quote(student_id, safe='')
+    # Other characters are percent-encoded, and the escapes always use upper-case hexadecimal.
+    mask = sum(1 << position for position, char in enumerate(student_id) if 'A' <= char <= 'Z')
+    if mask:
+        name += f"@{mask:x}"
+    return os.path.join(directory, name + EXTENSIONS[format])
+
+
+def partition_students(records, partition='class', chunk_size=CHUNK_SIZE):
+    """
+    Split students into chunks of work.
+
+    Args:
+        records (iterable): The StudentRecord objects.
+        partition (str): 'class' keeps each chunk within one class, splitting large classes;
+            'range' cuts the students sorted by ID into consecutive ranges.
+        chunk_size (int): The most students per chunk.
+
+    Returns:
+        list: The chunks, each a list of student IDs.
+
+    Raises:
+        ValueError: If the partition is unknown.
+    """
+    if partition == 'class':
+        by_class = {}
+        for student in records:
+            by_class.setdefault(student.class_name, []).append(student.id)
+        groups = [by_class[class_name] for class_name in sorted(by_class, key=str)]
+    elif partition == 'range':
+        groups = [sorted(student.id for student in records)]
+    else:
+        raise ValueError(f"Unknown partition: {partition}")
+    return [group[start:start + chunk_size] for group in groups for start in range(0, len(group), chunk_size)]
+
+
+def write_report_cards(students, student_ids, directory, format='text'):
+    """
+    Render and write the report cards of some students.
+
+    Args:
+        students: Looks students up by ID with get(), such as a dictionary of StudentRecord objects.
+        student_ids (list): The IDs of the students.
+        directory (str): The output directory, which must exist.
+        format (str): 'text', 'csv' or 'html'.
+
+    Returns:
+        tuple: The number of files written, and the errors as (student ID, message) pairs.
+    """
+    written = 0
+    errors = []
+    for student_id in student_ids:
+        try:
+            student = students.get(student_id)
+            if student is None:
+                raise LookupError('the student does not exist')
+            with open(report_card_path(directory, student_id, format), 'w', encoding='utf-8', newline='') as f:
+                f.write(render_report_card(student, format))
+            written += 1
+        except (OSError, ValueError, LookupError) as error:
+            errors.append((student_id, str(error)))
+    return written, errors
+
+
+class _SnapshotStudents:
+    """
+    Look students up by ID in the snapshot a worker process opened.
+    """
+
+    def get(self, student_id):
+        return _snapshot.read(student_id)
+
+
+def _open_snapshot(path):
+    """
+    Open the shared snapshot once per worker process.
+
+    Args:
+        path (str): The binary snapshot of the grade book.
+    """
+    global _snapshot
+    _snapshot = BinarySnapshot(path)
+
+
+def _write_chunk(student_ids, directory, format):
+    """
+    Write the report cards of a chunk of students in a worker process.
+
+    Args:
+        student_ids (list): The IDs of the students.
+        directory (str): The output directory.
+        format (str): 'text', 'csv' or 'html'.
+
+    Returns:
+        tuple: The number of students in the chunk, the number of files written, and the errors.
+    """
+    written, errors = write_report_cards(_SnapshotStudents(), student_ids, directory, format)
+    return len(student_ids), written, errors
+
+
+def generate_report_cards(gradebook, directory, format='text', partition='class', workers=None,
+                          chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Write one report card file per student, such as at the end of a term.
+
+    The students are split into chunks by class or by ID range and rendered in a pool of worker
+    processes. The grade book is written once to a binary snapshot in the output directory, which
+    every worker maps instead of loading the grade book itself; the operating system shares the
+    mapped pages between them. A student that fails is recorded and skipped without stopping the rest.
+
+    Args:
+        gradebook (GradeBook): The grade book.
+        directory (str): The output directory. It is created if it does not exist.
+        format (str): 'text', 'csv' or 'html'.
+        partition (str): 'class' or 'range'; see partition_students.
+        workers (int): The number of worker processes. Defaults to the number of CPUs; 1 renders in
+            this process, straight from the grade book.
+        chunk_size (int): The most students per chunk.
+        progress (function): Called as progress(done, total, errors) after each chunk, or None.
+
+    Returns:
+        dict: The number of 'students', the number of 'files' written, and the 'errors' as a list
+            of (student ID, message) pairs ordered by student ID.
+
+    Raises:
+        ValueError: If the format or partition is unknown.
+    """
+    if format not in EXTENSIONS:
+        raise ValueError(f"Unknown report card format: {format}")
+    workers = workers or os.cpu_count() or 1
+    students = gradebook.students
+    records = students.iter_records() if isinstance(students, LazyStudents) else students.values()
+    chunks = partition_students(records, partition, chunk_size)
+    os.makedirs(directory, exist_ok=True)
+    result = {'students': 0, 'files': 0, 'errors': []}
+
+    def finish(counts):
+        count, written, errors = counts
+        result['students'] += count
+        result['files'] += written
+        result['errors'].extend(errors)
+        if progress is not None:
+            progress(result['students'], len(students), len(result['errors']))
+
+    if workers == 1:
+        for chunk in chunks:
+            finish((len(chunk),) + write_report_cards(students, chunk, directory, format))
+    else:
+        handle, snapshot_path = tempfile.mkstemp(prefix='.snapshot-', suffix='.gbk', dir=directory)
+        os.close(handle)
+        try:
+            write_snapshot(students, snapshot_path)
+            with ProcessPoolExecutor(workers, initializer=_open_snapshot, initargs=(snapshot_path,)) as executor:
+                running = deque()
+                for chunk in chunks:
+                    running.append(executor.submit(_write_chunk, chunk, directory, format))
+                    if len(running) >= workers * 2:
+                        finish(running.popleft().result())
+                while running:
+                    finish(running.popleft().result())
+        finally:
+            os.remove(snapshot_path)
+    result['errors'].sort()
+    return result
+
+
+def main(argv=None):
+    """
+    Write report cards from the command line.
+
+    Args:
+        argv (list): The arguments, or None to use sys.argv.
+
+    Returns:
+        int: The exit status: 0 if every report card was written, 1 if some failed.
+    """
+    parser = argparse.ArgumentParser(description='Write one report card file per student.')
+    parser.add_argument('gradebook', help='the grade book file (JSON, binary snapshot or SQLite)')
+    parser.add_argument('directory', help='the directory to write the report cards to')
+    parser.add_argument('--format', choices=tuple(EXTENSIONS), default='text', help='the report card format')
+    parser.add_argument('--partition', choices=('class', 'range'), default='class',
+                        help='split the work by class or by ID range')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='students per chunk')
+    parser.add_argument('--max-errors', type=int, default=20, help='the most errors to print')
+    args = parser.parse_args(argv)
+
+    # Imported here so worker processes do not load the grade book modules.
+    from gradebook import GradeBook
+    gradebook = GradeBook(args.gradebook)
+    try:
+        result = generate_report_cards(gradebook, args.directory, args.format, args.partition, args.workers, args.chunk_size,
+                                       lambda done, total, errors: print(f"\r{done}/{total} students, {errors} errors", end='', flush=True))
+    finally:
+        gradebook.close()
+    print()
+    for student_id, message in result['errors'][:args.max_errors]:
+        print(f"Student {student_id}: {message}")
+    if len(result['errors']) > args.max_errors:
+        print(f"... and {len(result['errors']) - args.max_errors} more errors")
+    print(f"Wrote {result['files']} report cards for {result['students']} students to {args.directory}.")
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,196 @@
+import threading
+from collections import OrderedDict
+
+
+def summary_report(gradebook, student):
+    """
+    Describe a student on one line, as search results show them.
+
+    Args:
+        gradebook (GradeBook): The grade book.
+        student (StudentRecord): The student.
+
+    Returns:
+        str: The ID, name, class and grades of the student.
+    """
+    return f"ID: {student['ID']}, Name: {student['Name']}, Class: {student['Class']}, Grades: {student['Grades']}"
+
+
+def grades_report(gradebook, student):
+    """
+    List the grades of a student.
+
+    Args:
+        gradebook (GradeBook): The grade book.
+        student (StudentRecord): The student.
+
+    Returns:
+        str: The grades, as Get Grades shows them.
+    """
+    return f"Grades for student ID {student.id}: {student['Grades']}"
+
+
+def final_grade_report(gradebook, student):
+    """
+    State the final grade of a student.
+
+    Args:
+        gradebook (GradeBook): The grade book.
+        student (StudentRecord): The student.
+
+    Returns:
+        str: The final grade to two decimals, or None if the student has no grades.
+    """
+    final_grade = gradebook.calculate_final_grade(student.id)
+    if final_grade is None:
+        return None
+    return f"Final grade for student ID {student.id}: {final_grade:.2f}"
+
+
+def row_report(gradebook, student):
+    """
+    Format a student as a row of the All Students table.
+
+    Args:
+        gradebook (GradeBook): The grade book.
+        student (StudentRecord): The student.
+
+    Returns:
+        tuple: The ID, name, class, grades and final grade, as text.
+    """
+    final_grade = gradebook.calculate_final_grade(student.id)
+    return (
+        student.id,
+        student.name,
+        student.class_name,
+        ', '.join(f"{grade:g}" for grade in student.grades),
+        '' if final_grade is None else f"{final_grade:.2f}",
+    )
+
+
+REPORTS = {
+    'summary': summary_report,
+    'grades': grades_report,
+    'final_grade': final_grade_report,
+    'row': row_report,
+}
+
+
+class ReportCache:
+    """
+    A bounded cache of reports rendered for one student at a time, such as the summary line of a
+    search result or the final grade text, keyed by student ID and report kind.
+
+    Each entry remembers the version of its student when it was rendered. The grade book moves a
+    student's version on whenever that student is added or deleted or their grades change, so a
+    change only invalidates the reports of the student it touched. When the cache is full, the
+    least recently used report is dropped. A report must depend on nothing but its student.
+
+    Attributes:
+        gradebook (GradeBook): The grade book the reports are rendered from.
+        max_size (int): The most reports kept.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that had to render the report.
+        invalidations (int): Misses caused by a cached report whose student had changed.
+        evictions (int): Reports dropped to stay within max_size.
+    """
+
+    def __init__(self, gradebook, max_size=1024):
+        """
+        Initialize an empty cache with the built-in report kinds: 'summary', 'grades', 'final_grade' and 'row'.
+
+        Args:
+            gradebook (GradeBook): The grade book the reports are rendered from.
+            max_size (int): The most reports kept.
+        """
+        self.gradebook = gradebook
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._renderers = dict(REPORTS)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, kind, renderer):
+        """
+        Add a report kind, or replace one. Cached reports of that kind are dropped.
+
+        Args:
+            kind (str): The name of the report, such as 'transcript'.
+            renderer (function): Called as renderer(gradebook, student) to render the report.
+        """
+        with self._lock:
+            self._renderers[kind] = renderer
+            for key in [key for key in self._entries if key[1] == kind]:
+                del self._entries[key]
+
+    def render(self, student_id, kind):
+        """
+        Get a report of a student, rendering it only if it is not cached or the student has changed since.
+
+        Args:
+            student_id (str): The ID of the student.
+            kind (str): The report kind.
+
+        Returns:
+            The report, or None if the student does not exist.
+
+        Raises:
+            ValueError: If the report kind is unknown.
+        """
+        renderer = self._renderers.get(kind)
+        if renderer is None:
+            raise ValueError(f"Unknown report: {kind}")
+        key = (student_id, kind)
+        version = self.gradebook.student_version(student_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.invalidations += 1
+            self.misses += 1
+        student = self.gradebook.students.get(student_id)
+        if student is None:
+            return None
+        report = renderer(self.gradebook, student)
+        with self._lock:
+            self._entries[key] = (version, report)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return report
+
+    def clear(self):
+        """
+        Drop every cached report and reset the statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.invalidations = self.evictions = 0
+
+    def stats(self):
+        """
+        Get the cache statistics.
+
+        Returns:
+            dict: 'hits', 'misses', 'invalidations', 'evictions', 'size', 'max_size' and 'hit_rate',
+                the fraction of lookups answered from the cache (None before the first lookup).
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,607 @@
+import argparse
+import asyncio
+import json
+import re
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from gradebook import GradeBook
+from gradebook_export import EXPORT_FORMATS, write_students
+from gradebook_records import LazyStudents
+
+MAX_BODY = 1024 * 1024
+EXPORT_CHUNK = 64 * 1024
+CONTENT_TYPES = {'json': 'application/json', 'jsonl': 'application/x-ndjson', 'csv': 'text/csv', 'csv-grades': 'text/csv'}
+
+
+class HTTPError(Exception):
+    """
+    An error that is sent back to the client as an HTTP status and a JSON message.
+
+    Attributes:
+        status (int): The HTTP status code.
+        message (str): The message.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class GradeBookServer:
+    """
+    A local HTTP/JSON service for one shared GradeBook, built on asyncio streams.
+
+    Reads are answered straight from memory on the event loop. Writes are applied in memory as
+    they arrive, inside a batch that stays open for flush_interval seconds; the whole batch is
+    then persisted in one write on a worker thread, and every write request in it is answered
+    once it is on disk. Further writes wait for the flush to finish, while reads carry on, unless
+    another process has written in the meantime: then the flush reloads the grade book in memory,
+    and requests wait until it is done.
+
+    Reads see the open batch, so they can return writes that are not on disk yet. If persisting
+    the batch then fails, its writes are rolled back and their requests get an error, but a read
+    answered in between has already shown them.
+
+    Endpoints:
+        GET    /students?limit=&offset=&sort=      List students, one page at a time.
+        POST   /students                           Add a student: {"ID", "Name", "Class"}.
+        GET    /students/{id}                      Get a student and their final grade.
+        DELETE /students/{id}                      Delete a student.
+        GET    /students/{id}/grades               Get a student's grades.
+        POST   /students/{id}/grades               Add grades: {"grade": 90} or {"grades": [90, 85]}, optionally with an "assignment".
+        DELETE /students/{id}/grades/{grade}       Delete one grade, the earliest if the value is there more than once.
+        GET    /students/{id}/entries              Get a student's grades with their entry IDs, assignments and timestamps.
+        DELETE /students/{id}/entries/{entry}      Delete one grade by entry ID.
+        GET    /students/{id}/final-grade          Get a student's final grade.
+        GET    /search?q=&limit=                   Find by ID, start of name, or class, like the GUI.
+        GET    /export?format=&class=              Stream the students as json, jsonl, csv or csv-grades.
+        GET    /metrics                            Get the grade book metrics, when they are enabled.
+
+    Attributes:
+        gradebook (GradeBook): The grade book being served.
+        flush_interval (float): The seconds writes are collected before they are persisted together.
+    """
+
+    def __init__(self, gradebook, flush_interval=0.01):
+        """
+        Initialize the service.
+
+        Args:
+            gradebook (GradeBook): The grade book to serve.
+            flush_interval (float): The seconds writes are collected before they are persisted together.
+        """
+        self.gradebook = gradebook
+        self.flush_interval = flush_interval
+        self._write_lock = asyncio.Lock()
+        self._batch = None
+        self._waiting = []
+        self._flush_task = None
+        self._readable = asyncio.Event()
+        self._readable.set()
+        self._routes = [
+            ('GET', re.compile(r'/students'), self._list_students),
+            ('POST', re.compile(r'/students'), self._add_student),
+            ('GET', re.compile(r'/students/([^/]+)'), self._get_student),
+            ('DELETE', re.compile(r'/students/([^/]+)'), self._delete_student),
+            ('GET', re.compile(r'/students/([^/]+)/grades'), self._get_grades),
+            ('POST', re.compile(r'/students/([^/]+)/grades'), self._add_grades),
+            ('DELETE', re.compile(r'/students/([^/]+)/grades/([^/]+)'), self._delete_grade),
+            ('GET', re.compile(r'/students/([^/]+)/entries'), self._get_entries),
+            ('DELETE', re.compile(r'/students/([^/]+)/entries/([^/]+)'), self._delete_entry),
+            ('GET', re.compile(r'/students/([^/]+)/final-grade'), self._final_grade),
+            ('GET', re.compile(r'/search'), self._search),
+            ('GET', re.compile(r'/metrics'), self._metrics),
+        ]
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        """
+        Start listening.
+
+        Args:
+            host (str): The address to listen on.
+            port (int): The port to listen on, or 0 for any free port.
+
+        Returns:
+            asyncio.Server: The running server.
+        """
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def close(self):
+        """
+        Persist any writes still waiting.
+        """
+        if self._flush_task is not None:
+            await self._flush_task
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Answer the requests on one keep-alive connection until the client closes it.
+
+        Args:
+            reader (asyncio.StreamReader): The connection input.
+            writer (asyncio.StreamWriter): The connection output.
+        """
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as error:
+                    # Without a usable length the body cannot be skipped, so the connection ends here.
+                    self._send(writer, error.status, {'error': error.message}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                url = urlsplit(target)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    if method == 'GET' and url.path == '/export':
+                        await self._export(writer, query, keep_alive)
+                    else:
+                        status, payload = await self._dispatch(method, url.path, query, body)
+                        self._send(writer, status, payload, keep_alive)
+                except HTTPError as error:
+                    self._send(writer, error.status, {'error': error.message}, keep_alive)
+                except ConnectionError:
+                    raise
+                except Exception as error:
+                    self._send(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(error)}, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        """
+        Read one HTTP request.
+
+        Args:
+            reader (asyncio.StreamReader): The connection input.
+
+        Returns:
+            tuple: The method, target, headers (lower-case names) and body, or None at end of stream.
+
+        Raises:
+            HTTPError: If the Content-Length is not a non-negative whole number.
+        """
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split()
+        except ValueError:
+            raise ConnectionError('Malformed request line') from None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Content-Length must be a whole number') from None
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Content-Length must not be negative')
+        if length > MAX_BODY:
+            raise ConnectionError('Request body too large')
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    def _send(writer, status, payload, keep_alive):
+        """
+        Queue a JSON response.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection output.
+            status (int): The HTTP status code.
+            payload: The JSON body, or None for no body.
+            keep_alive (bool): Keep the connection open afterwards.
+        """
+        status = HTTPStatus(status)
+        body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+
+    async def _dispatch(self, method, path, query, body):
+        """
+        Route a request to its handler.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The URL path.
+            query (dict): The query parameters.
+            body (bytes): The request body.
+
+        Returns:
+            tuple: The status code and the JSON payload.
+        """
+        await self._readable.wait()
+        allowed = False
+        for route_method, pattern, handler in self._routes:
+            match = pattern.fullmatch(path)
+            if match is None:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            arguments = [unquote(group) for group in match.groups()]
+            data = None
+            if method == 'POST':
+                try:
+                    data = json.loads(body or b'{}')
+                except ValueError:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, 'The body is not valid JSON') from None
+                if not isinstance(data, dict):
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, 'The body must be a JSON object')
+            result = handler(*arguments, query=query, data=data)
+            if asyncio.iscoroutine(result):
+                result = await result
+            return result
+        if allowed:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not allowed on {path}")
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No such endpoint: {path}")
+
+    async def _write(self, change):
+        """
+        Apply a change in memory now and wait until the batch it joined has been persisted.
+
+        Args:
+            change (function): Makes the change on the grade book and returns its result.
+
+        Returns:
+            The result of change.
+        """
+        async with self._write_lock:
+            if self._batch is None:
+                self._batch = self.gradebook.batch()
+                self._batch.__enter__()
+            # Scheduled before the change, so the batch is closed even if the change fails.
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later())
+            result = change(self.gradebook)
+            done = asyncio.get_running_loop().create_future()
+            self._waiting.append(done)
+        await done
+        # The caller reads the grade book next, which must not happen during another flush's reload.
+        await self._readable.wait()
+        return result
+
+    async def _flush_later(self):
+        """
+        Persist the open batch after flush_interval seconds.
+        """
+        await asyncio.sleep(self.flush_interval)
+        async with self._write_lock:
+            await self._flush()
+
+    async def _flush(self):
+        """
+        Persist the open batch, if any, and answer the writes waiting on it. Call with the write lock held.
+        """
+        if self._batch is None:
+            return
+        loop = asyncio.get_running_loop()
+        batch, waiting = self._batch, self._waiting
+        self._batch, self._waiting, self._flush_task = None, [], None
+
+        def persist():
+            with self.gradebook.storage.lock():
+                # Catching up with another process undoes, reloads and re-applies changes in
+                # memory, so requests are held back until that is done. Otherwise reads keep
+                # being served from memory while the batch is written out.
+                if self.gradebook.storage.changed():
+                    asyncio.run_coroutine_threadsafe(self._pause_reads(), loop).result()
+                batch.__exit__(None, None, None)
+
+        try:
+            await loop.run_in_executor(None, persist)
+        except Exception as error:
+            for done in waiting:
+                done.set_exception(HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, f"The change was not saved: {error}"))
+            return
+        finally:
+            self._readable.set()
+        for done in waiting:
+            done.set_result(None)
+
+    async def _pause_reads(self):
+        """
+        Hold back new requests until the current flush ends. Run on the event loop, so no request
+        is half-way through reading the grade book when it returns.
+        """
+        self._readable.clear()
+
+    def _student(self, student_id):
+        """
+        Look up a student.
+
+        Args:
+            student_id (str): The ID of the student.
+
+        Returns:
+            StudentRecord: The student.
+
+        Raises:
+            HTTPError: If the student does not exist.
+        """
+        student = self.gradebook.students.get(student_id)
+        if student is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Student with ID {student_id} does not exist.")
+        return student
+
+    def _describe(self, student):
+        """
+        Convert a student to JSON, with their final grade.
+
+        Args:
+            student (StudentRecord): The student.
+
+        Returns:
+            dict: The student dictionary plus 'Final Grade'.
+        """
+        info = student.to_dict()
+        info['Final Grade'] = self.gradebook.calculate_final_grade(student.id)
+        return info
+
+    @staticmethod
+    def _limit(query, default=100):
+        """
+        Read the limit and offset query parameters.
+
+        Args:
+            query (dict): The query parameters.
+            default (int): The limit when none is given.
+
+        Returns:
+            tuple: The limit and the offset.
+        """
+        try:
+            return max(0, int(query.get('limit', default))), max(0, int(query.get('offset', 0)))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'limit and offset must be whole numbers') from None
+
+    def _list_students(self, query, data):
+        limit, offset = self._limit(query)
+        try:
+            student_ids = self.gradebook.student_ids(query.get('sort'), query.get('reverse') == 'true')
+        except ValueError as error:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(error)) from None
+        page = [self._describe(self.gradebook.students[student_id]) for student_id in student_ids[offset:offset + limit]]
+        return HTTPStatus.OK, {'total': len(student_ids), 'offset': offset, 'students': page}
+
+    async def _add_student(self, query, data):
+        missing = [key for key in ('ID', 'Name', 'Class') if not isinstance(data.get(key), str) or not data[key]]
+        if missing:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Missing {', '.join(missing)}")
+        if not await self._write(lambda gradebook: gradebook.add_student(data)):
+            raise HTTPError(HTTPStatus.CONFLICT, f"Student with ID {data['ID']} already exists.")
+        return HTTPStatus.CREATED, self._describe(self._student(data['ID']))
+
+    def _get_student(self, student_id, query, data):
+        return HTTPStatus.OK, self._describe(self._student(student_id))
+
+    async def _delete_student(self, student_id, query, data):
+        if not await self._write(lambda gradebook: gradebook.delete_student(student_id)):
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Student with ID {student_id} does not exist.")
+        return HTTPStatus.NO_CONTENT, None
+
+    def _get_grades(self, student_id, query, data):
+        self._student(student_id)
+        return HTTPStatus.OK, {'ID': student_id, 'Grades': self.gradebook.get_grades(student_id)}
+
+    async def _add_grades(self, student_id, query, data):
+        grades = data.get('grades', [data['grade']] if 'grade' in data else None)
+        if not isinstance(grades, list) or not grades:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Give a "grade" or a list of "grades"')
+        if any(isinstance(grade, bool) or not isinstance(grade, (int, float)) for grade in grades):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Grades must be numbers')
+        assignment = data.get('assignment')
+        if assignment is not None and not isinstance(assignment, str):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'The assignment must be a string')
+        self._student(student_id)
+        try:
+            await self._write(lambda gradebook: gradebook.add_grades((student_id, float(grade), assignment) for grade in grades))
+        except ValueError:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Student with ID {student_id} does not exist.") from None
+        return HTTPStatus.CREATED, {'ID': student_id, 'Grades': self.gradebook.get_grades(student_id)}
+
+    async def _delete_grade(self, student_id, grade, query, data):
+        try:
+            grade = float(grade)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid grade {grade}") from None
+        self._student(student_id)
+        if not await self._write(lambda gradebook: gradebook.delete_grade(student_id, grade)):
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Grade {grade} not found for student ID {student_id}.")
+        return HTTPStatus.NO_CONTENT, None
+
+    def _get_entries(self, student_id, query, data):
+        self._student(student_id)
+        return HTTPStatus.OK, {'ID': student_id, 'Entries': self.gradebook.grade_entries(student_id)}
+
+    async def _delete_entry(self, student_id, entry_id, query, data):
+        try:
+            entry_id = int(entry_id)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid entry ID {entry_id}") from None
+        self._student(student_id)
+        if not await self._write(lambda gradebook: gradebook.delete_grade_entry(student_id, entry_id)):
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Grade entry {entry_id} not found for student ID {student_id}.")
+        return HTTPStatus.NO_CONTENT, None
+
+    def _final_grade(self, student_id, query, data):
+        self._student(student_id)
+        return HTTPStatus.OK, {'ID': student_id, 'Final Grade': self.gradebook.calculate_final_grade(student_id)}
+
+    def _search(self, query, data):
+        text = query.get('q', '')
+        if not text:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Give the search text as q')
+        limit, _ = self._limit(query)
+        student = self.gradebook.students.get(text)
+        if student:
+            matches = [student]
+        else:
+            matches = self.gradebook.find_by_name_prefix(text, limit=limit) or self.gradebook.find_by_class(text, limit=limit)
+        return HTTPStatus.OK, {'students': [self._describe(student) for student in matches]}
+
+    def _metrics(self, query, data):
+        snapshot = self.gradebook.metrics()
+        if snapshot is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'Metrics are not enabled; start the server with --metrics.')
+        return HTTPStatus.OK, snapshot
+
+    async def _export(self, writer, query, keep_alive):
+        """
+        Stream an export with chunked transfer encoding.
+
+        Writes collected but not yet persisted are flushed first, so the export only contains
+        saved changes. The export is then written on a worker thread while writes are held back,
+        so it sees one consistent grade book; reads are still served meanwhile.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection output.
+            query (dict): 'format' and optionally 'class' (repeat or comma-separate for several).
+            keep_alive (bool): Keep the connection open afterwards.
+        """
+        format = query.get('format', 'json')
+        if format not in EXPORT_FORMATS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Unknown export format: {format}")
+        classes = set(query['class'].split(',')) if 'class' in query else None
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(maxsize=8)
+
+        def export():
+            students = self.gradebook.students
+            records = students.iter_records() if isinstance(students, LazyStudents) else students.values()
+            if classes is not None:
+                records = (student for student in records if student.class_name in classes)
+            out = _ChunkWriter(chunks, loop)
+            try:
+                write_students(records, out, format)
+                out.flush()
+            finally:
+                asyncio.run_coroutine_threadsafe(chunks.put(None), loop).result()
+
+        async with self._write_lock:
+            await self._flush()
+            task = loop.run_in_executor(None, export)
+            writer.write((f"HTTP/1.1 200 OK\r\n"
+                          f"Content-Type: {CONTENT_TYPES[format]}\r\n"
+                          f"Transfer-Encoding: chunked\r\n"
+                          f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1'))
+            while True:
+                data = await chunks.get()
+                if data is None:
+                    break
+                writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b'\r\n')
+                await writer.drain()
+            try:
+                await task
+            except Exception:
+                # The status line has gone out already, so the only way to report the failure
+                # is to drop the connection before the final chunk.
+                raise ConnectionError('Export failed') from None
+            writer.write(b'0\r\n\r\n')
+
+
+class _ChunkWriter:
+    """
+    A text file that hands what is written to it to the event loop in chunks of EXPORT_CHUNK characters.
+
+    It is written on a worker thread and blocks while the loop's queue is full, so a slow client
+    slows the export down instead of letting it pile up in memory.
+    """
+
+    def __init__(self, chunks, loop):
+        """
+        Initialize the writer.
+
+        Args:
+            chunks (asyncio.Queue): The queue the encoded chunks are put on.
+            loop (asyncio.AbstractEventLoop): The loop that owns the queue.
+        """
+        self.chunks = chunks
+        self.loop = loop
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= EXPORT_CHUNK:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            data = ''.join(self.parts).encode('utf-8')
+            self.parts, self.size = [], 0
+            asyncio.run_coroutine_threadsafe(self.chunks.put(data), self.loop).result()
+
+
+async def run(filename, host, port, flush_interval, journal, metrics=False, metrics_file=None):
+    """
+    Open a grade book and serve it until interrupted.
+
+    Args:
+        filename (str): The grade book file.
+        host (str): The address to listen on.
+        port (int): The port to listen on, or 0 for any free port.
+        flush_interval (float): The seconds writes are collected before they are persisted together.
+        journal (bool): Open the grade book in journal mode.
+        metrics (bool): Collect metrics and serve them at /metrics.
+        metrics_file (str): A JSON file to dump the metrics to every minute, or None. Implies metrics.
+    """
+    gradebook = GradeBook(filename, journal=journal, metrics=metrics or metrics_file is not None)
+    if metrics_file is not None:
+        gradebook.enable_metrics(dump_path=metrics_file)
+    service = GradeBookServer(gradebook, flush_interval)
+    server = await service.serve(host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Serving {filename} on http://{address[0]}:{address[1]}", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+        gradebook.close()
+
+
+def main(argv=None):
+    """
+    Run the service from the command line.
+
+    Args:
+        argv (list): The arguments, or None to use sys.argv.
+    """
+    parser = argparse.ArgumentParser(description='Serve a grade book over HTTP/JSON.')
+    parser.add_argument('gradebook', nargs='?', default='gradebook.json', help='the grade book file')
+    parser.add_argument('--host', default='127.0.0.1', help='the address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='the port to listen on (0 for any free port)')
+    parser.add_argument('--flush-interval', type=float, default=0.01, help='seconds to collect writes before persisting them together')
+    parser.add_argument('--journal', action='store_true', help='append changes to a journal instead of rewriting the file')
+    parser.add_argument('--metrics', action='store_true', help='collect timings and counters and serve them at /metrics')
+    parser.add_argument('--metrics-file', help='also dump the metrics to this JSON file every minute')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(run(args.gradebook, args.host, args.port, args.flush_interval, args.journal, args.metrics, args.metrics_file))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
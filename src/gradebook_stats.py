@@ -0,0 +1,233 @@
+from array import array
+
+import numpy as np
+
+from gradebook_records import LazyStudents
+
+
+class GradeStatistics:
+    """
+    Class-wide and whole-book grade statistics computed with NumPy.
+
+    Every grade in the book is packed once into a single float64 array, alongside the grade
+    count and class of each student. Means, medians, percentiles, standard deviations,
+    histograms, ranks and z-scores are then computed in vectorized passes over those arrays
+    instead of calling calculate_final_grade student by student. The packed arrays and results
+    are cached, and rebuilt only after the grade book version changes.
+
+    Standard deviations are population standard deviations, matching GradeBook.grade_statistics.
+
+    Attributes:
+        gradebook (GradeBook): The grade book to summarize.
+        percentiles (tuple): The percentiles reported by the summaries.
+        bins (int): The number of histogram bins.
+        range (tuple): The (low, high) grade range covered by the histogram.
+    """
+
+    def __init__(self, gradebook, percentiles=(10, 25, 50, 75, 90), bins=10, range=(0, 100)):
+        """
+        Initialize the statistics.
+
+        Args:
+            gradebook (GradeBook): The grade book to summarize.
+            percentiles (tuple): The percentiles reported by the summaries.
+            bins (int): The number of histogram bins.
+            range (tuple): The (low, high) grade range covered by the histogram. Grades outside it
+                are counted in the first or last bin.
+        """
+        self.gradebook = gradebook
+        self.percentiles = percentiles
+        self.bins = bins
+        self.range = range
+        self._version = None
+        self._results = {}
+
+    def _pack(self):
+        """
+        Pack the grade book into arrays, unless the cached ones are still current.
+        """
+        if self._version == self.gradebook.version:
+            return
+        students = self.gradebook.students
+        records = students.iter_records() if isinstance(students, LazyStudents) else students.values()
+        ids = []
+        class_codes = {}
+        student_class = array('q')
+        counts = array('q')
+        grades = array('d')
+        for student in records:
+            ids.append(student.id)
+            student_class.append(class_codes.setdefault(student.class_name, len(class_codes)))
+            counts.append(len(student.grades))
+            grades.extend(student.grades)
+        self.ids = ids
+        self.class_names = list(class_codes)
+        self.student_class = np.frombuffer(student_class, dtype=np.int64)
+        self.counts = np.frombuffer(counts, dtype=np.int64)
+        self.grades = np.frombuffer(grades, dtype=np.float64)
+        self.grade_class = np.repeat(self.student_class, self.counts)
+        student_number = np.repeat(np.arange(len(ids)), self.counts)
+        totals = np.bincount(student_number, weights=self.grades, minlength=len(ids))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.final_grades = totals / self.counts
+        self._version = self.gradebook.version
+        self._results = {}
+
+    def _summaries(self, values, groups, group_count):
+        """
+        Summarize values split into groups.
+
+        Args:
+            values (ndarray): The values.
+            groups (ndarray): The group number of each value.
+            group_count (int): The number of groups.
+
+        Returns:
+            list: One summary dictionary per group.
+        """
+        counts = np.bincount(groups, minlength=group_count)
+        totals = np.bincount(groups, weights=values, minlength=group_count)
+        squares = np.bincount(groups, weights=values * values, minlength=group_count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = totals / counts
+            stds = np.sqrt(np.maximum(squares / counts - means * means, 0.0))
+        # A stable sort on small integer keys is a radix sort, so grouping costs one linear pass.
+        grouped = values if group_count == 1 else values[np.argsort(groups, kind='stable')]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        low, high = self.range
+        bin_numbers = np.clip(((values - low) / (high - low) * self.bins).astype(np.int64), 0, self.bins - 1)
+        histograms = np.bincount(groups * self.bins + bin_numbers, minlength=group_count * self.bins).reshape(group_count, self.bins)
+        summaries = []
+        for group in range(group_count):
+            count = int(counts[group])
+            if count == 0:
+                summaries.append({'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None,
+                                  'median': None, 'percentiles': {}, 'histogram': histograms[group].tolist()})
+                continue
+            members = grouped[starts[group]:starts[group] + count]
+            points = np.percentile(members, (50,) + tuple(self.percentiles))
+            summaries.append({
+                'count': count,
+                'mean': float(means[group]),
+                'std': float(stds[group]),
+                'min': float(members.min()),
+                'max': float(members.max()),
+                'median': float(points[0]),
+                'percentiles': dict(zip(self.percentiles, points[1:].tolist())),
+                'histogram': histograms[group].tolist(),
+            })
+        return summaries
+
+    def histogram_edges(self):
+        """
+        Get the edges of the histogram bins.
+
+        Returns:
+            list: bins + 1 grade values.
+        """
+        return np.linspace(self.range[0], self.range[1], self.bins + 1).tolist()
+
+    def class_summary(self):
+        """
+        Summarize every grade in each class.
+
+        Returns:
+            dict: For each class, a dictionary with 'count', 'mean', 'std', 'min', 'max', 'median',
+                'percentiles' (percentile -> grade) and 'histogram' (grade count per bin).
+        """
+        self._pack()
+        if 'class' not in self._results:
+            summaries = self._summaries(self.grades, self.grade_class, len(self.class_names))
+            self._results['class'] = dict(zip(self.class_names, summaries))
+        return self._results['class']
+
+    def book_summary(self):
+        """
+        Summarize every grade in the grade book.
+
+        Returns:
+            dict: The same keys as each class in class_summary.
+        """
+        self._pack()
+        if 'book' not in self._results:
+            self._results['book'] = self._summaries(self.grades, np.zeros(len(self.grades), dtype=np.int64), 1)[0]
+        return self._results['book']
+
+    def student_table(self):
+        """
+        Rank every student with grades by final grade, overall and within their class.
+
+        Ranks start at 1 for the highest final grade; tied students share the best rank.
+        Z-scores compare a final grade with the mean and standard deviation of the final grades
+        of all students (z_score) or of the students in the same class (class_z_score).
+
+        Returns:
+            dict: For each student ID, a dictionary with 'final_grade', 'rank', 'z_score',
+                'class_rank' and 'class_z_score'. Students without grades have None for each.
+        """
+        self._pack()
+        if 'students' in self._results:
+            return self._results['students']
+        graded = np.flatnonzero(self.counts > 0)
+        finals = self.final_grades[graded]
+        classes = self.student_class[graded]
+        ranks = self._ranks(finals, np.zeros(len(graded), dtype=np.int64))
+        class_ranks = self._ranks(finals, classes)
+        z_scores = self._z_scores(finals, np.zeros(len(graded), dtype=np.int64), 1)
+        class_z_scores = self._z_scores(finals, classes, len(self.class_names))
+        table = {student_id: {'final_grade': None, 'rank': None, 'z_score': None, 'class_rank': None, 'class_z_score': None}
+                 for student_id in self.ids}
+        columns = zip(graded.tolist(), finals.tolist(), ranks.tolist(), z_scores.tolist(), class_ranks.tolist(), class_z_scores.tolist())
+        for number, final, rank, z_score, class_rank, class_z_score in columns:
+            table[self.ids[number]] = {'final_grade': final, 'rank': rank, 'z_score': z_score,
+                                       'class_rank': class_rank, 'class_z_score': class_z_score}
+        self._results['students'] = table
+        return table
+
+    @staticmethod
+    def _ranks(values, groups):
+        """
+        Rank values within their groups, highest first, with ties sharing the best rank.
+
+        Args:
+            values (ndarray): The values.
+            groups (ndarray): The group number of each value.
+
+        Returns:
+            ndarray: The rank of each value.
+        """
+        if len(values) == 0:
+            return np.zeros(0, dtype=np.int64)
+        order = np.lexsort((-values, groups))
+        sorted_values = values[order]
+        sorted_groups = groups[order]
+        positions = np.arange(len(values))
+        new_group = np.concatenate(([True], sorted_groups[1:] != sorted_groups[:-1]))
+        new_value = new_group | np.concatenate(([True], sorted_values[1:] != sorted_values[:-1]))
+        group_start = np.maximum.accumulate(np.where(new_group, positions, 0))
+        value_start = np.maximum.accumulate(np.where(new_value, positions, 0))
+        ranks = np.empty(len(values), dtype=np.int64)
+        ranks[order] = value_start - group_start + 1
+        return ranks
+
+    @staticmethod
+    def _z_scores(values, groups, group_count):
+        """
+        Standardize values against the mean and standard deviation of their group.
+
+        Args:
+            values (ndarray): The values.
+            groups (ndarray): The group number of each value.
+            group_count (int): The number of groups.
+
+        Returns:
+            ndarray: The z-score of each value, 0 where a group has no spread.
+        """
+        counts = np.bincount(groups, minlength=group_count)
+        totals = np.bincount(groups, weights=values, minlength=group_count)
+        squares = np.bincount(groups, weights=values * values, minlength=group_count)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = totals / counts
+            stds = np.sqrt(np.maximum(squares / counts - means * means, 0.0))
+            z_scores = (values - means[groups]) / stds[groups]
+        return np.where(stds[groups] > 0, z_scores, 0.0)
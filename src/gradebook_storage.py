@@ -0,0 +1,1227 @@
+import json
+import os
+import sqlite3
+import sys
+from collections import OrderedDict
+from contextlib import nullcontext
+from itertools import groupby
+
+from gradebook_aggregates import RunningStats
+from gradebook_binary import BinarySnapshot, is_binary_snapshot, write_snapshot
+from gradebook_export import write_students
+from gradebook_journal import Journal, snapshot_signature
+from gradebook_lock import FileLock
+from gradebook_records import GradeEntries, LazyStudents, StudentRecord
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+SHARD_EXTENSION = '.shards'
+
+
+def open_storage(filename, **options):
+    """
+    Pick the storage backend for a data file.
+
+    Existing files are recognized by their first bytes. New files ending in .db, .sqlite or
+    .sqlite3 get a SQLite database, and directories or paths ending in .shards get a directory
+    of class shards; anything else gets a JSON or binary file.
+
+    Args:
+        filename (str): The path to the data file.
+        **options: Options passed on to FileStorage (journal, compact_size, format).
+
+    Returns:
+        Storage: The storage for the file.
+    """
+    if os.path.isdir(filename) or filename.lower().endswith(SHARD_EXTENSION):
+        return ShardedStorage(filename)
+    try:
+        with open(filename, 'rb') as f:
+            is_sqlite = f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except FileNotFoundError:
+        is_sqlite = filename.lower().endswith(SQLITE_EXTENSIONS)
+    if is_sqlite:
+        return SqliteStorage(filename)
+    return FileStorage(filename, **options)
+
+
+def write_json(students, path):
+    """
+    Write every student to a JSON file in the layout of gradebook.json.
+
+    Students are written one at a time, so the whole document is never built in memory.
+
+    Args:
+        students (Mapping): StudentRecord objects keyed by student ID.
+        path (str): The path to write to.
+    """
+    records = students.iter_records() if isinstance(students, LazyStudents) else students.values()
+    with open(path, 'w') as f:
+        write_students(records, f, 'json')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_json(path):
+    """
+    Read every student from a JSON file in the layout of gradebook.json.
+
+    Args:
+        path (str): The path to read.
+
+    Returns:
+        dict: StudentRecord objects keyed by student ID, in the order they are stored.
+
+    Raises:
+        ValueError: If the file is in another layout, such as the older lowercase one.
+    """
+    with open(path, 'r') as f:
+        students = json.load(f)
+    if not isinstance(students, dict):
+        raise ValueError(f"{path} is not in the grade book layout (it is not an object keyed by student ID); "
+                         f"convert it with gradebook_convert.py")
+    for student_id, student_info in students.items():
+        try:
+            students[student_id] = StudentRecord(student_id, student_info['Name'], student_info['Class'],
+                                                 student_info['Grades'], GradeEntries.from_dict(student_info))
+        except KeyError as error:
+            raise ValueError(f"{path} is not in the grade book layout (student {student_id!r} has no field {error}); "
+                             f"check or convert it with gradebook_convert.py") from None
+        except TypeError:
+            raise ValueError(f"{path} is not in the grade book layout (student {student_id!r} is not an object "
+                             f"with a list of grades); check it with gradebook_convert.py") from None
+    return students
+
+
+class Storage:
+    """
+    Where a GradeBook keeps its data.
+
+    A storage loads the students, persists mutation records after the GradeBook has applied
+    them in memory, and can rewrite everything at once.
+
+    Several processes may share one storage. A writer takes lock(), checks changed() to see
+    whether anyone else has written since this storage last loaded or wrote, and if so brings
+    itself up to date with catch_up() or a full load() before writing.
+
+    Attributes:
+        filename (str): The path to the data file.
+    """
+
+    def load(self):
+        """
+        Load the stored students.
+
+        Returns:
+            tuple: A mapping of StudentRecord objects keyed by student ID, and a list of mutation
+                records still to be applied on top of it.
+        """
+        raise NotImplementedError
+
+    def write(self, records, students):
+        """
+        Persist mutation records that were already applied to students.
+
+        Args:
+            records (list): The mutation records.
+            students (Mapping): The students after the change.
+        """
+        raise NotImplementedError
+
+    def save(self, students):
+        """
+        Persist every student.
+
+        Args:
+            students (Mapping): The students to store.
+        """
+        raise NotImplementedError
+
+    def compact(self, students):
+        """
+        Reclaim space used by logged changes.
+
+        Args:
+            students (Mapping): The students currently loaded.
+        """
+        self.save(students)
+
+    def stored_files(self):
+        """
+        List the files the data is kept in. Some of them may not exist.
+
+        Returns:
+            list: The paths.
+        """
+        return [self.filename]
+
+    def _read(self, size):
+        """
+        Note bytes just read from the stored files. Nothing is done with them unless metrics are
+        on, when instrument_storage counts them.
+
+        Args:
+            size (int): The number of bytes read.
+        """
+
+    def changing(self, record):
+        """
+        Note a mutation record that is about to be applied in memory. Storages that keep only
+        part of the data loaded hold on to what the record changes until it is written.
+
+        Args:
+            record (dict): The mutation record.
+        """
+
+    def close(self):
+        """
+        Release open files and connections.
+        """
+
+    def lock(self):
+        """
+        Get the lock that writers hold while they check for changes and write.
+
+        Returns:
+            A reentrant context manager.
+        """
+        return nullcontext()
+
+    def changed(self):
+        """
+        Check whether another process has written since this storage last loaded or wrote.
+
+        Call with the lock held.
+
+        Returns:
+            bool: True if the stored data has changed.
+        """
+        return False
+
+    def catch_up(self):
+        """
+        Read the changes other processes made since this storage last loaded or wrote, if they
+        can be read as mutation records. Call with the lock held.
+
+        Returns:
+            list: The mutation records to apply, or None if the students must be loaded again.
+        """
+        return None
+
+
+class FileStorage(Storage):
+    """
+    Storage in a single JSON or binary snapshot file, with an optional append-only journal.
+
+    Attributes:
+        filename (str): The path to the data file.
+        format (str): 'json' or 'binary', the format save writes.
+        journal (Journal): The mutation log used in journal mode, or None when every change rewrites the file.
+        compact_size (int): The journal size in bytes at which it is folded back into the data file.
+    """
+
+    def __init__(self, filename, journal=False, compact_size=1024 * 1024, format=None):
+        """
+        Initialize the storage.
+
+        Args:
+            filename (str): The path to the data file.
+            journal (bool): Append each change to a log next to the data file instead of rewriting the whole file.
+            compact_size (int): The journal size in bytes at which it is folded back into the data file.
+            format (str): 'json' or 'binary'. Defaults to the format of the existing file, or 'json' for a new one.
+        """
+        self.filename = filename
+        self.format = format
+        self.compact_size = compact_size
+        self.journal = Journal(filename + '.journal') if journal else None
+        self._lazy = None
+        self._lock = FileLock(filename + '.lock')
+        self._seen = None
+
+    def load(self):
+        """
+        Load the data file, detecting JSON or binary from its first bytes.
+
+        A binary snapshot is memory-mapped and its records are decoded on first access.
+        Any journal left next to the file is returned for replay.
+
+        Returns:
+            tuple: The students and the journal records to apply on top of them.
+        """
+        with self._lock:
+            return self._load()
+
+    def _load(self):
+        """
+        Load the data file. The lock must be held.
+
+        Returns:
+            tuple: The students and the journal records to apply on top of them.
+        """
+        self.close()
+        if is_binary_snapshot(self.filename):
+            self.format = self.format or 'binary'
+            snapshot = BinarySnapshot(self.filename)
+            self._read(snapshot.header_size)
+            self._lazy = LazyStudents(snapshot)
+            students = self._lazy
+        else:
+            self.format = self.format or 'json'
+            students = {}
+            if os.path.exists(self.filename):
+                students = read_json(self.filename)
+                self._read(os.path.getsize(self.filename))
+        journal = self.journal or Journal(self.filename + '.journal')
+        records = journal.replay(self.filename)
+        self._read(journal.size)
+        if self.journal is not None and self.journal.size == 0:
+            self.journal.reset(self.filename)
+        self._seen = (self._lock.generation(), snapshot_signature(self.filename))
+        return students, records
+
+    def write(self, records, students):
+        """
+        Append records to the journal, compacting it once it passes compact_size, or rewrite the
+        whole file when there is no journal.
+
+        Args:
+            records (list): The mutation records.
+            students (Mapping): The students after the change.
+        """
+        with self._lock:
+            if self.journal is None:
+                self.save(students)
+                return
+            self.journal.append(records)
+            if self.journal.size >= self.compact_size:
+                self.save(students)
+            else:
+                self._seen = (self._lock.bump(), self._seen[1])
+
+    def save(self, students):
+        """
+        Save every student to the data file in the format given by the format attribute.
+
+        The file is written to a temporary path and renamed into place, so a crash never leaves a
+        half-written grade book behind. Any journal is emptied afterwards, since the file now holds its changes.
+
+        Args:
+            students (Mapping): The students to store.
+        """
+        with self._lock:
+            self._save(students)
+            self._seen = (self._lock.bump(), snapshot_signature(self.filename))
+
+    def _save(self, students):
+        """
+        Save every student to the data file. The lock must be held.
+
+        Args:
+            students (Mapping): The students to store.
+        """
+        lazy = students if students is self._lazy else None
+        if lazy is not None and self.format != 'binary':
+            lazy.materialize()
+            lazy = self._lazy = None
+        temp_path = self.filename + '.tmp'
+        if self.format == 'binary':
+            write_snapshot(students, temp_path)
+        elif self.format == 'json':
+            write_json(students, temp_path)
+        else:
+            raise ValueError(f"Unknown grade book format: {self.format}")
+        if lazy is not None:
+            # The old snapshot must be unmapped before it can be replaced on Windows.
+            lazy.close()
+            try:
+                os.replace(temp_path, self.filename)
+            except OSError:
+                lazy.source = BinarySnapshot(self.filename)
+                raise
+            lazy.rebase(BinarySnapshot(self.filename))
+        else:
+            os.replace(temp_path, self.filename)
+        if self.journal is not None:
+            self.journal.reset(self.filename)
+        elif os.path.exists(self.filename + '.journal'):
+            os.remove(self.filename + '.journal')
+
+    def close(self):
+        """
+        Release the journal file handle and the lock file, and unmap a binary snapshot.
+        """
+        if self.journal is not None:
+            self.journal.close()
+        if self._lazy is not None:
+            self._lazy.close()
+        self._lock.close()
+
+    def lock(self):
+        """
+        Get the lock on the .lock file next to the data file.
+
+        Returns:
+            FileLock: The lock.
+        """
+        return self._lock
+
+    def changed(self):
+        """
+        Check the write generation in the lock file and the size and modification time of the
+        data file against the ones seen at the last load or write.
+
+        Returns:
+            bool: True if another process has written.
+        """
+        return self._seen != (self._lock.generation(), snapshot_signature(self.filename))
+
+    def catch_up(self):
+        """
+        Read the records other processes appended to the journal, as long as the data file itself
+        has not been rewritten.
+
+        Returns:
+            list: The new journal records, or None if the students must be loaded again.
+        """
+        if self.journal is None or self._seen[1] != snapshot_signature(self.filename):
+            return None
+        size = self.journal.size
+        records = self.journal.tail()
+        if records is not None:
+            self._read(self.journal.size - size)
+            self._seen = (self._lock.generation(), self._seen[1])
+        return records
+
+    def stored_files(self):
+        """
+        List the data file and its journal. The journal may not exist.
+
+        Returns:
+            list: The paths.
+        """
+        return [self.filename, self.filename + '.journal']
+
+
+class SqliteStorage(Storage):
+    """
+    Storage in a SQLite database with one row per student and one row per grade.
+
+    Students are read from the database on first access through indexed queries, and each
+    mutation record becomes a single-row insert or delete. The database runs in WAL mode so
+    readers are not blocked by a write in progress. The SQL strings are constant, so sqlite3
+    prepares each one once and reuses it from its statement cache.
+
+    Attributes:
+        filename (str): The path to the database.
+        connection (sqlite3.Connection): The open database connection.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS students (
+            ID TEXT PRIMARY KEY,
+            Name TEXT NOT NULL,
+            Class TEXT NOT NULL,
+            last_grade_id INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS grades (
+            student_id TEXT NOT NULL REFERENCES students (ID) ON DELETE CASCADE,
+            grade REAL NOT NULL,
+            entry_id INTEGER,
+            assignment TEXT,
+            timestamp REAL
+        );
+        CREATE INDEX IF NOT EXISTS students_class ON students (Class);
+        CREATE INDEX IF NOT EXISTS grades_student ON grades (student_id);
+    """
+
+    WRITES = {
+        'add_student': 'INSERT INTO students (ID, Name, Class, last_grade_id) VALUES (?, ?, ?, ?)',
+        'delete_student': 'DELETE FROM students WHERE ID = ?',
+        'add_grade': 'INSERT INTO grades (student_id, grade, entry_id, assignment, timestamp) VALUES (?, ?, ?, ?, ?)',
+        'delete_grade': 'DELETE FROM grades WHERE student_id = ? AND entry_id = ?',
+        'last_grade_id': 'UPDATE students SET last_grade_id = MAX(last_grade_id, ?) WHERE ID = ?',
+    }
+
+    # Databases made before grades had entry IDs get the columns added, and their grades
+    # numbered from 1 per student in the order they were added.
+    MIGRATIONS = (
+        'ALTER TABLE grades ADD COLUMN entry_id INTEGER',
+        'ALTER TABLE grades ADD COLUMN assignment TEXT',
+        'ALTER TABLE grades ADD COLUMN timestamp REAL',
+        'UPDATE grades SET entry_id = (SELECT COUNT(*) FROM grades AS earlier '
+        'WHERE earlier.student_id = grades.student_id AND earlier.rowid <= grades.rowid)',
+    )
+
+    # Databases made before entry IDs were kept from being reused start from the highest ID in use.
+    LAST_ID_MIGRATIONS = (
+        'ALTER TABLE students ADD COLUMN last_grade_id INTEGER NOT NULL DEFAULT 0',
+        'UPDATE students SET last_grade_id = (SELECT COALESCE(MAX(entry_id), 0) FROM grades WHERE student_id = students.ID)',
+    )
+
+    def __init__(self, filename):
+        """
+        Open the database, creating the tables and indexes if needed.
+
+        Args:
+            filename (str): The path to the database.
+        """
+        self.filename = filename
+        # GradeBook serializes its own calls, so the connection may be used from a worker thread.
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(self.SCHEMA)
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(grades)')]
+        if 'entry_id' not in columns:
+            with self.connection:
+                for statement in self.MIGRATIONS:
+                    self.connection.execute(statement)
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(students)')]
+        if 'last_grade_id' not in columns:
+            with self.connection:
+                for statement in self.LAST_ID_MIGRATIONS:
+                    self.connection.execute(statement)
+        self._lazy = None
+        self._lock = FileLock(filename + '.lock')
+        self._seen = None
+
+    def load(self):
+        """
+        Open the students table without reading it; records are queried when first accessed.
+
+        Returns:
+            tuple: The students and an empty list of records to replay.
+        """
+        with self._lock:
+            self._lazy = LazyStudents(_SqliteSource(self.connection))
+            self._seen = self._state()
+        return self._lazy, []
+
+    def write(self, records, students):
+        """
+        Apply mutation records to the database in one transaction.
+
+        Runs of records with the same operation are sent with executemany.
+
+        Args:
+            records (list): The mutation records.
+            students (Mapping): The students after the change.
+        """
+        with self._lock:
+            self._write(records, students)
+            self._seen = (self._lock.bump(), self._seen[1])
+
+    def _write(self, records, students):
+        """
+        Apply mutation records to the database. The lock must be held.
+
+        Args:
+            records (list): The mutation records.
+            students (Mapping): The students after the change.
+        """
+        with self.connection:
+            for op, group in groupby(records, key=lambda record: record['op']):
+                group = list(group)
+                if op == 'add_student':
+                    added = [StudentRecord.from_dict(record['student']) for record in group]
+                    self.connection.executemany(self.WRITES[op], [
+                        (student.id, student.name, student.class_name, _last_grade_id(student)) for student in added
+                    ])
+                    self.connection.executemany(self.WRITES['add_grade'], [
+                        row for student in added for row in _grade_rows(student)
+                    ])
+                elif op == 'delete_student':
+                    self.connection.executemany(self.WRITES[op], [(record['id'],) for record in group])
+                elif op == 'add_grade':
+                    self.connection.executemany(self.WRITES[op], [
+                        (record['id'], record['grade'], record['entry'], record.get('assignment'), record.get('timestamp'))
+                        for record in group
+                    ])
+                    self.connection.executemany(self.WRITES['last_grade_id'], [(record['entry'], record['id']) for record in group])
+                elif op == 'delete_grade':
+                    self.connection.executemany(self.WRITES[op], [(record['id'], record['entry']) for record in group])
+                else:
+                    raise ValueError(f"Unknown journal operation: {op}")
+        if students is self._lazy:
+            students.synced()
+
+    def save(self, students):
+        """
+        Replace the database contents with the given students.
+
+        When students are the ones loaded from this database every change is already stored,
+        so only the write-ahead log is checkpointed.
+
+        Args:
+            students (Mapping): The students to store.
+        """
+        if students is self._lazy:
+            self.compact(students)
+            return
+        records = students.iter_records() if isinstance(students, LazyStudents) else students.values()
+        with self._lock:
+            with self.connection:
+                self.connection.execute('DELETE FROM grades')
+                self.connection.execute('DELETE FROM students')
+                for record in records:
+                    self.connection.execute(self.WRITES['add_student'], (record.id, record.name, record.class_name, _last_grade_id(record)))
+                    self.connection.executemany(self.WRITES['add_grade'], _grade_rows(record))
+            self._seen = (self._lock.bump(), self._state()[1])
+
+    def compact(self, students):
+        """
+        Fold the write-ahead log back into the database file.
+
+        Args:
+            students (Mapping): The students currently loaded.
+        """
+        self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def close(self):
+        """
+        Close the database connection and the lock file.
+        """
+        self.connection.close()
+        self._lock.close()
+
+    def lock(self):
+        """
+        Get the lock on the .lock file next to the database.
+
+        Returns:
+            FileLock: The lock.
+        """
+        return self._lock
+
+    def stored_files(self):
+        """
+        List the database and its write-ahead log. The log may not exist.
+
+        SQLite reads the database itself, a page at a time, so these storages do not report the
+        bytes they read.
+
+        Returns:
+            list: The paths.
+        """
+        return [self.filename, self.filename + '-wal']
+
+    def changed(self):
+        """
+        Check the write generation in the lock file and SQLite's data version against the ones
+        seen at the last load or write.
+
+        Returns:
+            bool: True if another connection has written.
+        """
+        return self._seen != self._state()
+
+    def _state(self):
+        """
+        Read the write generation and the data version, which SQLite changes whenever another
+        connection commits. The lock must be held.
+
+        Returns:
+            tuple: The generation and the data version.
+        """
+        return self._lock.generation(), self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+
+class _SqliteSource:
+    """
+    Reads students out of the SQLite tables for LazyStudents.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM students').fetchone()[0]
+
+    def __contains__(self, student_id):
+        return self.connection.execute('SELECT 1 FROM students WHERE ID = ?', (student_id,)).fetchone() is not None
+
+    def read(self, student_id):
+        row = self.connection.execute('SELECT Name, Class, last_grade_id FROM students WHERE ID = ?', (student_id,)).fetchone()
+        if row is None:
+            return None
+        grades = self.connection.execute(
+            'SELECT grade, entry_id, assignment, timestamp FROM grades WHERE student_id = ? ORDER BY entry_id', (student_id,)
+        ).fetchall()
+        return _record(student_id, row[0], row[1], grades, row[2])
+
+    def ids(self):
+        for (student_id,) in self.connection.execute('SELECT ID FROM students ORDER BY rowid'):
+            yield student_id
+
+    def records(self):
+        rows = self.connection.execute(
+            'SELECT s.ID, s.Name, s.Class, s.last_grade_id, g.grade, g.entry_id, g.assignment, g.timestamp '
+            'FROM students s LEFT JOIN grades g ON g.student_id = s.ID ORDER BY s.rowid, g.entry_id'
+        )
+        for (student_id, name, class_name, last_id), group in groupby(rows, key=lambda row: row[:4]):
+            yield _record(student_id, name, class_name, [row[4:] for row in group if row[4] is not None], last_id)
+
+    def class_aggregates(self):
+        class_stats = {}
+        class_sizes = {}
+        for class_name, size in self.connection.execute('SELECT Class, COUNT(*) FROM students GROUP BY Class'):
+            class_name = sys.intern(class_name)
+            class_stats[class_name] = RunningStats()
+            class_sizes[class_name] = size
+        rows = self.connection.execute(
+            'SELECT s.Class, COUNT(g.grade), SUM(g.grade), SUM(g.grade * g.grade), MIN(g.grade), MAX(g.grade) '
+            'FROM grades g JOIN students s ON s.ID = g.student_id GROUP BY s.Class'
+        )
+        for class_name, count, total, total_sq, minimum, maximum in rows:
+            stats = class_stats[class_name]
+            stats.count, stats.total, stats.total_sq, stats.minimum, stats.maximum = count, total, total_sq, minimum, maximum
+        return class_stats, class_sizes
+
+    def close(self):
+        pass
+
+
+class ShardedStorage(Storage):
+    """
+    Storage in a directory with one shard per class, so each class is loaded and written on its own.
+
+    The directory holds manifest.json, which lists every shard with its class, file name and grade
+    aggregates, and two files per shard: a .json file in the layout of gradebook.json and a .ids
+    file listing the shard's student IDs. Opening the storage reads only the manifest and the ID
+    lists, which together index every student to their shard. The students of a shard are read
+    when one of them is first accessed, and loaded shards are evicted, least recently used first,
+    once their estimated size passes the memory budget. Shards with changes that are not written
+    yet are never evicted. A write rewrites only the shards it changed, plus the small manifest,
+    so editing one class costs the size of that class instead of the whole grade book.
+
+    Changed shards are written to new files and the manifest is replaced last, so a crash leaves
+    every shard at either its old or its new version, with a manifest that matches.
+
+    Attributes:
+        filename (str): The path to the directory.
+        memory_budget (int): The estimated bytes of loaded shards to keep in memory.
+    """
+
+    MANIFEST = 'manifest.json'
+
+    # Rough in-memory sizes of a student record and of each grade and grade entry, used to
+    # keep the loaded shards within the memory budget.
+    STUDENT_BYTES = 500
+    GRADE_BYTES = 8
+    ENTRY_BYTES = 24
+
+    def __init__(self, filename, memory_budget=256 * 1024 * 1024):
+        """
+        Initialize the storage. The directory is created by the first write.
+
+        Args:
+            filename (str): The path to the directory.
+            memory_budget (int): The estimated bytes of loaded shards to keep in memory.
+        """
+        self.filename = filename
+        self.memory_budget = memory_budget
+        self._shards = {}
+        self._next = 1
+        self._index = {}
+        self._loaded = OrderedDict()
+        self._sizes = {}
+        self._loaded_bytes = 0
+        self._dirty = set()
+        self._lazy = None
+        self._lock = FileLock(filename + '.lock')
+        self._seen = None
+
+    def load(self):
+        """
+        Read the manifest and the student IDs of every shard, without reading any students.
+
+        Returns:
+            tuple: The students and an empty list of records to replay.
+        """
+        with self._lock:
+            self._shards, self._next = self._read_manifest()
+            self._index = {}
+            for class_name, info in self._shards.items():
+                with open(self._path(info['File'] + '.ids'), 'r') as f:
+                    self._index.update(dict.fromkeys(json.load(f), class_name))
+                    self._read(os.fstat(f.fileno()).st_size)
+            self._loaded = OrderedDict()
+            self._sizes = {}
+            self._loaded_bytes = 0
+            self._dirty = set()
+            self._lazy = LazyStudents(_ShardSource(self))
+            self._seen = self._state()
+        return self._lazy, []
+
+    def changing(self, record):
+        """
+        Mark the shard a mutation record changes as dirty, so it stays loaded until it is written.
+
+        Args:
+            record (dict): The mutation record.
+        """
+        if record['op'] == 'add_student':
+            self._dirty.add(sys.intern(record['student']['Class']))
+        else:
+            class_name = self._index.get(record['id'])
+            if class_name is not None:
+                self._dirty.add(class_name)
+
+    def write(self, records, students):
+        """
+        Move added and deleted students in and out of their shards, then rewrite the dirty shards.
+
+        Args:
+            records (list): The mutation records.
+            students (Mapping): The students after the change.
+        """
+        with self._lock:
+            for record in records:
+                op = record['op']
+                if op == 'add_student':
+                    # A student added and deleted again in the same batch is no longer there.
+                    student = students.get(record['student']['ID'])
+                    if student is not None:
+                        self._shard(student.class_name)[student.id] = student
+                        self._index[student.id] = student.class_name
+                        self._dirty.add(student.class_name)
+                elif op == 'delete_student':
+                    class_name = self._index.pop(record['id'], None)
+                    if class_name is not None:
+                        self._shard(class_name).pop(record['id'], None)
+                        self._dirty.add(class_name)
+                elif op in ('add_grade', 'delete_grade'):
+                    self._dirty.add(self._index[record['id']])
+                else:
+                    raise ValueError(f"Unknown journal operation: {op}")
+            self._flush()
+            if students is self._lazy:
+                students.synced()
+
+    def save(self, students):
+        """
+        Write every student, split into one shard per class.
+
+        When students are the ones loaded from this storage, only the dirty shards are written.
+
+        Args:
+            students (Mapping): The students to store.
+        """
+        with self._lock:
+            if students is self._lazy:
+                self._flush()
+                return
+            records = students.iter_records() if isinstance(students, LazyStudents) else students.values()
+            shards = {}
+            for record in records:
+                shards.setdefault(record.class_name, {})[record.id] = record
+            superseded = [info['File'] for info in self._shards.values()]
+            self._shards = {}
+            for class_name, shard in shards.items():
+                self._write_shard(class_name, shard)
+            self._write_manifest(superseded)
+            self._index = {student_id: class_name for class_name, shard in shards.items() for student_id in shard}
+            self._loaded = OrderedDict()
+            self._sizes = {}
+            self._loaded_bytes = 0
+            self._dirty = set()
+
+    def compact(self, students):
+        """
+        Write any dirty shards and delete files the manifest no longer refers to, such as ones
+        left behind by a crash.
+
+        Args:
+            students (Mapping): The students currently loaded.
+        """
+        with self._lock:
+            self._flush()
+            if not os.path.isdir(self.filename):
+                return
+            kept = {self.MANIFEST}
+            for info in self._shards.values():
+                kept.update((info['File'] + '.json', info['File'] + '.ids'))
+            for name in os.listdir(self.filename):
+                if name not in kept:
+                    os.remove(self._path(name))
+
+    def close(self):
+        """
+        Drop the loaded shards and close the lock file.
+        """
+        self._loaded = OrderedDict()
+        self._sizes = {}
+        self._loaded_bytes = 0
+        self._lock.close()
+
+    def lock(self):
+        """
+        Get the lock on the .lock file next to the directory.
+
+        Returns:
+            FileLock: The lock.
+        """
+        return self._lock
+
+    def stored_files(self):
+        """
+        List the manifest and the files of every shard it refers to.
+
+        Returns:
+            list: The paths.
+        """
+        return [self._path(self.MANIFEST)] + [self._path(info['File'] + extension)
+                                              for info in self._shards.values() for extension in ('.json', '.ids')]
+
+    def changed(self):
+        """
+        Check the write generation in the lock file and the size and modification time of the
+        manifest against the ones seen at the last load or write.
+
+        Returns:
+            bool: True if another process has written.
+        """
+        return self._seen != self._state()
+
+    def _state(self):
+        """
+        Read the write generation and the signature of the manifest.
+
+        Returns:
+            tuple: The generation and the signature.
+        """
+        return self._lock.generation(), snapshot_signature(self._path(self.MANIFEST))
+
+    def _path(self, name):
+        """
+        Get the path of a file in the directory.
+
+        Args:
+            name (str): The file name.
+
+        Returns:
+            str: The path.
+        """
+        return os.path.join(self.filename, name)
+
+    def _read_manifest(self):
+        """
+        Read the manifest, if there is one yet.
+
+        Returns:
+            tuple: The shard descriptions keyed by class, and the number for the next shard file.
+        """
+        try:
+            with open(self._path(self.MANIFEST), 'r') as f:
+                manifest = json.load(f)
+                self._read(os.fstat(f.fileno()).st_size)
+        except FileNotFoundError:
+            return {}, 1
+        return {sys.intern(info['Class']): info for info in manifest['Shards']}, manifest['Next']
+
+    def _shard(self, class_name):
+        """
+        Get the students of a shard, reading them if the shard is not loaded.
+
+        Args:
+            class_name (str): The class of the shard.
+
+        Returns:
+            dict: StudentRecord objects keyed by student ID. Empty for a class with no shard yet.
+        """
+        shard = self._loaded.get(class_name)
+        if shard is not None:
+            self._loaded.move_to_end(class_name)
+            return shard
+        shard = self._read_shard(class_name)
+        self._loaded[class_name] = shard
+        self._sizes[class_name] = size = sum(map(self._footprint, shard.values()))
+        self._loaded_bytes += size
+        self._evict(class_name)
+        return shard
+
+    def _read_shard(self, class_name):
+        """
+        Read the students of a shard from its file.
+
+        Args:
+            class_name (str): The class of the shard.
+
+        Returns:
+            dict: StudentRecord objects keyed by student ID, with their running aggregates filled in.
+        """
+        info = self._shards.get(class_name)
+        if info is None:
+            return {}
+        # Shard files are never rewritten in place, so the size read before the file is the size read.
+        try:
+            path = self._path(info['File'] + '.json')
+            size = os.path.getsize(path)
+            shard = read_json(path)
+        except FileNotFoundError:
+            # Another process rewrote the shard after the manifest was read here; read its latest version.
+            info = self._read_manifest()[0].get(class_name)
+            if info is None:
+                return {}
+            path = self._path(info['File'] + '.json')
+            size = os.path.getsize(path)
+            shard = read_json(path)
+        self._read(size)
+        for record in shard.values():
+            record.stats = RunningStats(record.grades)
+        return shard
+
+    def _footprint(self, record):
+        """
+        Estimate the memory a student record takes.
+
+        Args:
+            record (StudentRecord): The record.
+
+        Returns:
+            int: The estimated bytes.
+        """
+        grades = len(record.grades)
+        return self.STUDENT_BYTES + grades * (self.GRADE_BYTES if record.entries is None else self.GRADE_BYTES + self.ENTRY_BYTES)
+
+    def _evict(self, keep):
+        """
+        Drop the least recently used clean shards until the loaded shards fit the memory budget.
+
+        Args:
+            keep (str): The class of a shard that must stay loaded.
+        """
+        for class_name in list(self._loaded):
+            if self._loaded_bytes <= self.memory_budget:
+                break
+            if class_name == keep or class_name in self._dirty:
+                continue
+            shard = self._loaded.pop(class_name)
+            self._loaded_bytes -= self._sizes.pop(class_name)
+            if self._lazy is not None:
+                self._lazy.forget(shard)
+
+    def _flush(self):
+        """
+        Write every dirty shard to new files, then replace the manifest. The lock must be held.
+        """
+        if not self._dirty:
+            return
+        superseded = []
+        for class_name in self._dirty:
+            shard = self._shard(class_name)
+            info = self._shards.pop(class_name, None)
+            if info is not None:
+                superseded.append(info['File'])
+            if shard:
+                self._write_shard(class_name, shard)
+        self._write_manifest(superseded)
+        self._dirty = set()
+        self._evict(None)
+
+    def _write_shard(self, class_name, shard):
+        """
+        Write the students of a shard to new files and describe it in the in-memory manifest.
+
+        Args:
+            class_name (str): The class of the shard.
+            shard (dict): StudentRecord objects keyed by student ID.
+        """
+        os.makedirs(self.filename, exist_ok=True)
+        name = f"{self._next:06d}"
+        self._next += 1
+        write_json(shard, self._path(name + '.json'))
+        with open(self._path(name + '.ids'), 'w') as f:
+            json.dump(list(shard), f)
+            f.flush()
+            os.fsync(f.fileno())
+        stats = RunningStats()
+        for record in shard.values():
+            stats.merge(record.stats if record.stats is not None and not record.stats.stale else RunningStats(record.grades))
+        self._shards[class_name] = {
+            'Class': class_name, 'File': name, 'Students': len(shard), 'Count': stats.count, 'Total': stats.total,
+            'TotalSq': stats.total_sq, 'Min': stats.minimum, 'Max': stats.maximum,
+        }
+
+    def _write_manifest(self, superseded=()):
+        """
+        Replace the manifest with the in-memory one, then delete the files of superseded shards.
+
+        Args:
+            superseded (iterable): The file names of shards the new manifest no longer refers to.
+        """
+        os.makedirs(self.filename, exist_ok=True)
+        temp_path = self._path(self.MANIFEST + '.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump({'Next': self._next, 'Shards': list(self._shards.values())}, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self._path(self.MANIFEST))
+        for name in superseded:
+            for extension in ('.json', '.ids'):
+                try:
+                    os.remove(self._path(name + extension))
+                except FileNotFoundError:
+                    pass
+        self._seen = (self._lock.bump(), snapshot_signature(self._path(self.MANIFEST)))
+
+
+class _ShardSource:
+    """
+    Reads students out of the shards of a ShardedStorage for LazyStudents.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __len__(self):
+        return len(self.storage._index)
+
+    def __contains__(self, student_id):
+        return student_id in self.storage._index
+
+    def read(self, student_id):
+        class_name = self.storage._index.get(student_id)
+        if class_name is None:
+            return None
+        return self.storage._shard(class_name).get(student_id)
+
+    def ids(self):
+        return iter(self.storage._index)
+
+    def records(self):
+        # Shards that are not loaded are read without being kept, so a full pass stays within the budget.
+        for class_name in list(self.storage._shards):
+            shard = self.storage._loaded.get(class_name)
+            if shard is None:
+                shard = self.storage._read_shard(class_name)
+            yield from shard.values()
+
+    def class_aggregates(self):
+        class_stats = {}
+        class_sizes = {}
+        for class_name, info in self.storage._shards.items():
+            stats = RunningStats()
+            stats.count = info['Count']
+            stats.total = info['Total']
+            stats.total_sq = info['TotalSq']
+            stats.minimum = info['Min']
+            stats.maximum = info['Max']
+            class_stats[class_name] = stats
+            class_sizes[class_name] = info['Students']
+        return class_stats, class_sizes
+
+    def close(self):
+        pass
+
+
+def _grade_rows(record):
+    """
+    Make the grades table rows of a student.
+
+    Args:
+        record (StudentRecord): The student.
+
+    Returns:
+        list: (student ID, grade, entry ID, assignment, timestamp) tuples.
+    """
+    if record.entries is None:
+        return [(record.id, grade, number, None, None) for number, grade in enumerate(record.grades, 1)]
+    return [(record.id, grade) + record.entries.entry(index) for index, grade in enumerate(record.grades)]
+
+
+def _last_grade_id(record):
+    """
+    Get the highest entry ID handed out to a student, for the students table.
+
+    Args:
+        record (StudentRecord): The student.
+
+    Returns:
+        int: The ID.
+    """
+    return len(record.grades) if record.entries is None else record.entries.last_id
+
+
+def _record(student_id, name, class_name, grades, last_id=0):
+    """
+    Build a student record from grades table rows.
+
+    Args:
+        student_id (str): The student ID.
+        name (str): The student name.
+        class_name (str): The student class.
+        grades (list): (grade, entry ID, assignment, timestamp) tuples ordered by entry ID.
+        last_id (int): The highest entry ID handed out to the student.
+
+    Returns:
+        StudentRecord: The record, with its running aggregates filled in.
+    """
+    entries = GradeEntries.build([row[1] for row in grades], [row[2] for row in grades], [row[3] for row in grades], last_id)
+    record = StudentRecord(student_id, name, class_name, (row[0] for row in grades), entries)
+    record.stats = RunningStats(record.grades)
+    return record
+
+
+def migrate_json_to_sqlite(json_path, db_path):
+    """
+    Copy a JSON grade book (and any journal next to it) into a SQLite database.
+
+    Args:
+        json_path (str): The path to the JSON grade book.
+        db_path (str): The path to the database to fill. Existing rows are replaced.
+
+    Returns:
+        int: The number of students copied.
+    """
+    # Loading through GradeBook replays any journal left next to the JSON file.
+    from gradebook import GradeBook
+    gradebook = GradeBook(json_path)
+    students = gradebook.students
+    target = SqliteStorage(db_path)
+    try:
+        target.save(students)
+        # Counted before closing, since lazily loaded students need the source still open.
+        count = len(students)
+    finally:
+        target.close()
+        gradebook.close()
+    return count
+
+
+def migrate_to_shards(source_path, directory, memory_budget=256 * 1024 * 1024):
+    """
+    Copy a grade book (and any journal next to it) into a directory of class shards.
+
+    Args:
+        source_path (str): The path to the grade book: JSON, a binary snapshot or a SQLite database.
+        directory (str): The directory to fill. Existing shards are replaced.
+        memory_budget (int): The estimated bytes of loaded shards the new storage keeps in memory.
+
+    Returns:
+        int: The number of students copied.
+    """
+    from gradebook import GradeBook
+    gradebook = GradeBook(source_path)
+    students = gradebook.students
+    target = ShardedStorage(directory, memory_budget)
+    try:
+        target.save(students)
+        # Counted before closing, since lazily loaded students need the source still open.
+        count = len(students)
+    finally:
+        target.close()
+        gradebook.close()
+    return count
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python gradebook_storage.py GRADEBOOK DATABASE_OR_SHARD_DIRECTORY')
+        sys.exit(1)
+    if os.path.isdir(sys.argv[2]) or sys.argv[2].lower().endswith(SHARD_EXTENSION):
+        copied = migrate_to_shards(sys.argv[1], sys.argv[2])
+    else:
+        copied = migrate_json_to_sqlite(sys.argv[1], sys.argv[2])
+    print(f"Copied {copied} students from {sys.argv[1]} to {sys.argv[2]}.")
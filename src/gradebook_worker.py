@@ -0,0 +1,180 @@
+import queue
+import threading
+import traceback
+from concurrent.futures import Future
+
+WORKER_EVENT = '-WORKER-'
+PROGRESS_EVENT = '-PROGRESS-'
+
+
+def open_in_background(open_gradebook):
+    """
+    Start opening a grade book on a daemon thread, so it can load while the user is still logging in.
+
+    Pass the result's result method to GradeBookWorker as its open_gradebook, and the worker picks
+    up the grade book once it is ready. If the application quits first, the thread does not keep it open.
+
+    Args:
+        open_gradebook (function): Creates and returns the GradeBook.
+
+    Returns:
+        concurrent.futures.Future: Resolves to the GradeBook, or to the error opening it raised.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(open_gradebook())
+        except BaseException as error:
+            future.set_exception(error)
+    threading.Thread(target=run, name='gradebook-loader', daemon=True).start()
+    return future
+
+
+class GradeBookWorker:
+    """
+    Runs grade book operations on a background thread so the GUI event loop never waits on disk.
+
+    Operations are queued and run one at a time, in the order they were submitted, so changes
+    reach the grade book and its storage in the same order the user made them. When an operation
+    finishes, its result is posted back to the window as a WORKER_EVENT event, and the GUI passes
+    the event to handle(), which calls the operation's done callback on the GUI thread.
+
+    Attributes:
+        window (sg.Window): The window results are posted to.
+        gradebook (GradeBook): The grade book, or None until it has been opened.
+        lock (threading.RLock): Held while an operation runs. Code on the GUI thread that reads
+            the grade book directly should hold it too.
+        pending (int): The number of operations submitted whose results have not been handled yet.
+    """
+
+    def __init__(self, window, open_gradebook, event_key=WORKER_EVENT):
+        """
+        Initialize the worker and start opening the grade book in the background.
+
+        Args:
+            window (sg.Window): The window results are posted to.
+            open_gradebook (function): Creates and returns the GradeBook. It runs on the worker thread.
+            event_key (str): The event key results are posted with.
+        """
+        self.window = window
+        self.gradebook = None
+        self.lock = threading.RLock()
+        self.pending = 0
+        self._event_key = event_key
+        self._open_gradebook = open_gradebook
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='gradebook-worker', daemon=True)
+        self._thread.start()
+        self.submit(self._open)
+
+    def submit(self, job, done=None):
+        """
+        Queue an operation.
+
+        Args:
+            job (function): Called with the GradeBook on the worker thread. Its return value is the result.
+            done (function): Called with the result on the GUI thread once the job has run, or None.
+        """
+        self.pending += 1
+        self._queue.put((job, done))
+
+    def handle(self, value):
+        """
+        Finish an operation whose result was posted back to the window.
+
+        Args:
+            value (tuple): The value of the WORKER_EVENT event.
+
+        Returns:
+            str: The traceback of the error the job raised, or None if it succeeded.
+        """
+        done, result, error = value
+        self.pending -= 1
+        if error is None and done is not None:
+            done(result)
+        return error
+
+    def progress(self, message):
+        """
+        Make a progress callback for a long job that posts a status line back to the window.
+
+        The window receives a PROGRESS_EVENT event whose value is the formatted message.
+
+        Args:
+            message (str): A format string filled in with the callback's arguments, such as
+                'Exporting... {0} of {1} students'.
+
+        Returns:
+            function: The callback, safe to call from the worker thread.
+        """
+        def report(*counts):
+            self.window.write_event_value(PROGRESS_EVENT, message.format(*counts))
+        return report
+
+    def busy(self):
+        """
+        Check whether operations are still queued or running.
+
+        Returns:
+            bool: True if any submitted operation has not been handled yet.
+        """
+        return self.pending > 0
+
+    def status(self):
+        """
+        Describe what the worker is doing, for a status line.
+
+        Returns:
+            str: 'Ready', or the number of operations still queued or running.
+        """
+        if self.gradebook is None:
+            return 'Loading grade book...'
+        if self.pending:
+            return f"Working... {self.pending} operation{'s' if self.pending != 1 else ''} queued"
+        return 'Ready'
+
+    def stop(self, timeout=None):
+        """
+        Finish every queued operation, close the grade book and stop the thread.
+
+        Results of operations still queued are not posted back.
+
+        Args:
+            timeout (float): The most seconds to wait for the queue to drain, or None to wait until it does.
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _open(self, _):
+        """
+        Open the grade book. This is the first job of every worker.
+        """
+        self.gradebook = self._open_gradebook()
+        return self.gradebook
+
+    def _run(self):
+        """
+        Run queued operations until stop() is called.
+        """
+        stopping = False
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            job, done = item
+            with self.lock:
+                try:
+                    result, error = job(self.gradebook), None
+                except Exception:
+                    result, error = None, traceback.format_exc()
+            if stopping:
+                continue
+            try:
+                self.window.write_event_value(self._event_key, (done, result, error))
+            except Exception:
+                # The window has been closed; finish the remaining work without reporting it.
+                stopping = True
+        with self.lock:
+            if self.gradebook is not None:
+                self.gradebook.close()
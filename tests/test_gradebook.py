@@ -0,0 +1,90 @@
+import pytest
+
+from gradebook import GradeBook
+
+
+def _fill(gradebook):
+    gradebook.add_student({'ID': '1', 'Name': 'Ana', 'Class': '2025'})
+    gradebook.add_student({'ID': '2', 'Name': 'Ben', 'Class': '2026'})
+    gradebook.add_grade('1', 90.0, assignment='Essay', timestamp=1700000000.0)
+    gradebook.add_grade('1', 80.0)
+    gradebook.add_grade('2', 70.0)
+
+
+def test_batch_rolls_back_on_exception(tmp_path):
+    path = str(tmp_path / 'gradebook.json')
+    gradebook = GradeBook(path)
+    _fill(gradebook)
+    with pytest.raises(RuntimeError):
+        with gradebook.batch():
+            gradebook.add_student({'ID': '3', 'Name': 'Cy', 'Class': '2025'})
+            gradebook.add_grade('1', 10.0)
+            gradebook.delete_grade('2', 70.0)
+            gradebook.delete_student('1')
+            raise RuntimeError('abort')
+    assert sorted(gradebook.students) == ['1', '2']
+    assert gradebook.get_grades('1') == [90.0, 80.0]
+    assert gradebook.get_grades('2') == [70.0]
+    assert gradebook.calculate_final_grade('1') == 85.0
+    assert gradebook.class_statistics('2025')['count'] == 2
+    assert gradebook.verify_aggregates() == []
+    gradebook.close()
+
+    # Nothing from the failed batch reached the file.
+    reopened = GradeBook(path)
+    assert sorted(reopened.students) == ['1', '2']
+    assert reopened.get_grades('1') == [90.0, 80.0]
+    reopened.close()
+
+
+def test_nested_batch_persists_once_at_the_outermost_level(tmp_path):
+    path = str(tmp_path / 'gradebook.json')
+    gradebook = GradeBook(path)
+    with gradebook.batch():
+        gradebook.add_student({'ID': '1', 'Name': 'Ana', 'Class': '2025'})
+        with gradebook.batch():
+            gradebook.add_grade('1', 90.0)
+        assert GradeBook(path).students == {}
+    reopened = GradeBook(path)
+    assert reopened.get_grades('1') == [90.0]
+    reopened.close()
+    gradebook.close()
+
+
+@pytest.mark.parametrize('journal', [False, True])
+def test_two_instances_share_a_file(tmp_path, journal):
+    path = str(tmp_path / 'gradebook.json')
+    first = GradeBook(path, journal=journal)
+    second = GradeBook(path, journal=journal)
+    first.add_student({'ID': '1', 'Name': 'Ana', 'Class': '2025'})
+    second.add_student({'ID': '2', 'Name': 'Ben', 'Class': '2025'})
+    # Each write first picks up what the other instance saved, then persists on top of it.
+    first.add_grade('1', 95.0)
+    second.add_grade('1', 85.0)
+    first.add_grade('2', 75.0)
+    assert first.get_grades('1') == [95.0, 85.0]
+    assert second.get_grades('2') == []
+    first.close()
+    second.close()
+
+    reopened = GradeBook(path, journal=journal)
+    assert sorted(reopened.students) == ['1', '2']
+    assert reopened.get_grades('1') == [95.0, 85.0]
+    assert reopened.get_grades('2') == [75.0]
+    assert [entry['ID'] for entry in reopened.grade_entries('1')] == [1, 2]
+    assert reopened.class_statistics('2025')['count'] == 3
+    assert reopened.verify_aggregates() == []
+    reopened.close()
+
+
+def test_change_for_a_student_deleted_elsewhere_is_a_conflict(tmp_path):
+    path = str(tmp_path / 'gradebook.json')
+    first = GradeBook(path)
+    first.add_student({'ID': '1', 'Name': 'Ana', 'Class': '2025'})
+    second = GradeBook(path)
+    second.delete_student('1')
+    first.add_grade('1', 90.0)
+    assert '1' not in first.students
+    assert [record['op'] for record in first.conflicts] == ['add_grade']
+    first.close()
+    second.close()
@@ -0,0 +1,66 @@
+import os
+
+from gradebook import GradeBook
+from gradebook_journal import Journal
+
+
+def test_replay_after_a_crash_drops_a_torn_record(tmp_path):
+    path = str(tmp_path / 'gradebook.json')
+    gradebook = GradeBook(path, journal=True)
+    gradebook.add_student({'ID': '1', 'Name': 'Ana', 'Class': '2025'})
+    gradebook.add_grade('1', 90.0, assignment='Essay')
+    gradebook.add_grade('1', 80.0)
+    # The process dies half-way through appending the next record, without closing anything.
+    with open(path + '.journal', 'a', encoding='utf-8') as f:
+        f.write('{"op": "add_grade", "id": "1", "gra')
+    size = os.path.getsize(path + '.journal')
+
+    reopened = GradeBook(path, journal=True)
+    assert reopened.get_grades('1') == [90.0, 80.0]
+    assert reopened.grade_entries('1')[0]['Assignment'] == 'Essay'
+    assert os.path.getsize(path + '.journal') < size
+    # Appends after the recovery land after the last whole record.
+    reopened.add_grade('1', 70.0)
+    reopened.close()
+    gradebook.close()
+
+    again = GradeBook(path, journal=True)
+    assert again.get_grades('1') == [90.0, 80.0, 70.0]
+    assert again.verify_aggregates() == []
+    again.close()
+
+
+def test_journal_folded_into_the_snapshot_is_not_replayed(tmp_path):
+    path = str(tmp_path / 'gradebook.json')
+    gradebook = GradeBook(path, journal=True)
+    gradebook.add_student({'ID': '1', 'Name': 'Ana', 'Class': '2025'})
+    gradebook.add_grade('1', 90.0)
+    gradebook.compact()
+    gradebook.close()
+
+    journal = Journal(path + '.journal')
+    assert journal.replay(path) == []
+    journal.close()
+    reopened = GradeBook(path, journal=True)
+    assert reopened.get_grades('1') == [90.0]
+    reopened.close()
+
+
+def test_stale_journal_is_discarded_once_the_snapshot_is_rewritten(tmp_path):
+    path = str(tmp_path / 'gradebook.json')
+    gradebook = GradeBook(path, journal=True)
+    gradebook.add_student({'ID': '1', 'Name': 'Ana', 'Class': '2025'})
+    gradebook.add_grade('1', 90.0)
+    gradebook.close()
+    with open(path + '.journal', 'rb') as f:
+        stale = f.read()
+    gradebook = GradeBook(path, journal=True)
+    gradebook.save_data()
+    gradebook.close()
+    # A crash between rewriting the snapshot and resetting the journal leaves the old records behind.
+    with open(path + '.journal', 'wb') as f:
+        f.write(stale)
+
+    reopened = GradeBook(path, journal=True)
+    assert reopened.get_grades('1') == [90.0]
+    reopened.close()
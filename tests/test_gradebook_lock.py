@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from gradebook_lock import FileLock
+
+
+def test_lock_excludes_other_threads(tmp_path):
+    lock = FileLock(str(tmp_path / 'gradebook.json.lock'))
+    inside = []
+    overlaps = []
+
+    def work():
+        for _ in range(20):
+            with lock:
+                inside.append(threading.get_ident())
+                if len(inside) > 1:
+                    overlaps.append(list(inside))
+                time.sleep(0.001)
+                inside.remove(threading.get_ident())
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    lock.close()
+    assert overlaps == []
+
+
+def test_lock_excludes_a_second_lock_on_the_same_file(tmp_path):
+    path = str(tmp_path / 'gradebook.json.lock')
+    first = FileLock(path)
+    second = FileLock(path, timeout=0.1)
+    with first:
+        # Reentrant for the owning thread.
+        with first:
+            pass
+        with pytest.raises(TimeoutError):
+            second.acquire()
+    with second:
+        pass
+    first.close()
+    second.close()
+
+
+def test_generation_counts_writes(tmp_path):
+    path = str(tmp_path / 'gradebook.json.lock')
+    first = FileLock(path)
+    second = FileLock(path)
+    with first:
+        start = first.generation()
+        first.bump()
+    with second:
+        assert second.generation() == start + 1
+    first.close()
+    second.close()